@@ -0,0 +1,129 @@
+"""
+Microbenchmark: row-by-row text COPY (itertuples + write_row) vs the column-wise
+binary COPY encoder in src/utils/utils_copy.py.
+
+Offline (default) it times only the client-side encoding and its peak memory:
+the old path materialises a tuple per row and dumps it with psycopg's
+Transformer, exactly what Copy.write_row does before escaping.
+With --db it also streams both into a temp table over a pooled connection
+(credentials/postgres.json).
+
+    python -m benchmarks.bench_copy_encoder --rows 300000
+    python -m benchmarks.bench_copy_encoder --rows 300000 --db
+"""
+import argparse
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from psycopg.adapt import PyFormat, Transformer
+from src.utils.utils_copy import iter_copy_binary
+
+# Attendance-like frame: ids, a float mark, a flag, short texts and add_timestamp strings
+COLUMN_TYPES = {
+    "id": "BIGINT",
+    "student_id": "BIGINT",
+    "lesson_id": "BIGINT",
+    "mark": "DOUBLE PRECISION",
+    "is_present": "BOOLEAN",
+    "status": "TEXT",
+    "comment": "TEXT",
+    "attendance_date_timestamp": "TIMESTAMP",
+    "fetched_timestamp": "TIMESTAMP",
+}
+
+
+def make_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp("2025-09-01") + pd.to_timedelta(rng.integers(0, 270 * 86400, rows), unit="s")
+    comments = np.array(["", "late", "Kech qoldi", "болел", None], dtype=object)
+    return pd.DataFrame({
+        "id": np.arange(rows, dtype=np.int64),
+        "student_id": rng.integers(1, 5000, rows),
+        "lesson_id": rng.integers(1, 200000, rows),
+        "mark": np.where(rng.random(rows) < 0.3, np.nan, rng.integers(1, 6, rows).astype(float)),
+        "is_present": rng.random(rows) < 0.9,
+        "status": rng.choice(np.array(["present", "absent", "excused"], dtype=object), rows),
+        "comment": rng.choice(comments, rows),
+        "attendance_date_timestamp": dates.strftime("%Y-%m-%d %H:%M:%S"),
+        "fetched_timestamp": pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S"),
+    })
+
+
+def encode_rows(df: pd.DataFrame) -> int:
+    """Current path: one tuple per row, every value boxed and dumped separately."""
+    tx = Transformer()
+    formats = [PyFormat.TEXT] * len(df.columns)
+    size = 0
+    for row in df.itertuples(index=False, name=None):
+        size += sum(len(v) for v in tx.dump_sequence(row, formats) if v is not None)
+    return size
+
+
+def encode_columns(df: pd.DataFrame) -> int:
+    """New path: column buffers laid out straight into binary COPY, one chunk at a time."""
+    return sum(len(chunk) for chunk in iter_copy_binary(df, COLUMN_TYPES))
+
+
+def measure(label: str, func, *args, trace: bool = True) -> None:
+    started = time.perf_counter()
+    size = func(*args)
+    elapsed = time.perf_counter() - started
+
+    # Second run for memory, tracemalloc would skew the timing
+    peak = 0
+    if trace:
+        tracemalloc.start()
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    print(f"{label:<28} {elapsed:8.3f} s   peak {peak / 2**20:8.1f} MiB   {size / 2**20:8.1f} MiB encoded")
+
+
+def copy_rows(cur, df: pd.DataFrame) -> int:
+    with cur.copy(f"COPY bench_copy ({', '.join(df.columns)}) FROM STDIN") as copy:
+        for row in df.itertuples(index=False, name=None):
+            copy.write_row(row)
+    return 0
+
+
+def copy_columns(cur, df: pd.DataFrame) -> int:
+    with cur.copy(f"COPY bench_copy ({', '.join(df.columns)}) FROM STDIN (FORMAT BINARY)") as copy:
+        for chunk in iter_copy_binary(df, COLUMN_TYPES):
+            copy.write(chunk)
+    return 0
+
+
+def run_db(df: pd.DataFrame) -> None:
+    from src.utils.utils_postgres import get_connection, close_pool
+
+    columns_def = ', '.join(f"{col} {pg_type}" for col, pg_type in COLUMN_TYPES.items())
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                for label, func in (("text COPY (write_row)", copy_rows), ("binary COPY (columns)", copy_columns)):
+                    cur.execute(f"CREATE TEMP TABLE bench_copy ({columns_def}) ON COMMIT DROP;")
+                    measure(f"db {label}", func, cur, df, trace=False)
+                    cur.execute("SELECT COUNT(*) FROM bench_copy;")
+                    assert cur.fetchone()[0] == len(df)
+                    conn.rollback()
+    finally:
+        close_pool()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--db", action="store_true", help="also COPY into a temp table")
+    args = parser.parse_args()
+
+    df = make_frame(args.rows)
+    print(f"{args.rows} rows x {len(df.columns)} columns")
+    measure("itertuples + dump (text)", encode_rows, df)
+    measure("column encoder (binary)", encode_columns, df)
+    if args.db:
+        run_db(df)
+
+
+if __name__ == "__main__":
+    main()
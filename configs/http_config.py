@@ -0,0 +1,62 @@
+import os
+from datetime import timedelta
+
+# Shared HTTP client settings used by src/utils/utils_http.py
+
+# Base URLs of the upstream APIs. Each can be pointed at a local stand-in
+# server (mock_servers/) through its environment variable to run offline.
+EDUSCHOOL_API_URL = os.getenv("EDUSCHOOL_API_URL", "https://backend.eduschool.uz/moderator-api")
+AMOCRM_API_URL = os.getenv("AMOCRM_API_URL", "")  # empty: https://{base_domain} of credentials/amocrm.json
+TRELLO_API_URL = os.getenv("TRELLO_API_URL", "https://api.trello.com/1")
+FACEBOOK_GRAPH_URL = os.getenv("FACEBOOK_GRAPH_URL", "https://graph.facebook.com")
+
+# (connect, read) timeout in seconds for calls that do not pass their own
+HTTP_TIMEOUT = (10, 60)
+
+# Retries on connection errors and on RETRY_STATUSES responses, waiting
+# HTTP_BACKOFF * 2^(retry - 1) seconds between them. A Retry-After header
+# (amoCRM and Facebook send one with 429) takes precedence.
+HTTP_RETRIES = 5
+HTTP_BACKOFF = 1.0
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Keep-alive connections kept per host
+HTTP_POOL_MAXSIZE = 16
+
+# Worker threads for crawls that fan out many requests to one API (crawl());
+# the host's rate limit below still caps the request rate
+HTTP_CONCURRENCY = 8
+
+# amoCRM list pages requested at once by amocrm_get_all_items
+AMOCRM_PAGE_CONCURRENCY = 4
+
+# Page sizes tried, largest first, by eduschool_fetch_all_pages; the first one
+# the endpoint accepts is used for all pages of that endpoint
+EDUSCHOOL_PAGE_SIZES = (200, 100, 50, 20)
+
+# Facebook insights: date ranges of at least FACEBOOK_ASYNC_MIN_DAYS days are
+# requested as async report runs, polled every FACEBOOK_POLL_INTERVAL seconds
+# for up to FACEBOOK_POLL_TIMEOUT seconds before falling back to paging
+FACEBOOK_ASYNC_MIN_DAYS = 31
+FACEBOOK_POLL_INTERVAL = 5
+FACEBOOK_POLL_TIMEOUT = 900
+
+# On-disk cache for slow-changing reference endpoints (http_get(..., cache=name)).
+# Within its TTL a cached response is reused without a request; after it the
+# response is revalidated with ETag / Last-Modified when the API sent them.
+# main.py --refresh-reference bypasses the cache for a run.
+HTTP_CACHE_DIR = "http_cache"
+HTTP_CACHE_TTLS = {
+    "eduschool_quarters": timedelta(days=7),
+    "amocrm_reference": timedelta(days=1),  # pipelines, statuses, loss reasons, task types, tags, custom fields
+    "trello_lists": timedelta(hours=12),
+}
+
+# Token-bucket rate limits per API host (suffix match): requests per second
+# and burst size. Hosts not listed are not throttled.
+RATE_LIMITS = {
+    "backend.eduschool.uz": {"rate": 10, "burst": 10},
+    "amocrm.ru": {"rate": 7, "burst": 7},  # amoCRM allows 7 requests per second
+    "api.trello.com": {"rate": 10, "burst": 20},  # 100 requests per 10 s per token
+    "graph.facebook.com": {"rate": 5, "burst": 10},
+}
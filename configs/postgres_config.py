@@ -0,0 +1,54 @@
+# Loader settings used by src/etl/load.py
+
+# Frames with at least this many rows are streamed into a temp staging table
+# with COPY and merged by one INSERT ... SELECT ... ON CONFLICT statement.
+# Smaller frames keep using the executemany batches.
+COPY_THRESHOLD_ROWS = 5000
+
+# Rows encoded per buffer by the binary COPY encoder (src/utils/utils_copy.py).
+# Bounds the encoder's scratch memory; larger chunks mean fewer round trips.
+COPY_CHUNK_ROWS = 50000
+
+# executemany batches retry transient errors (lost connections, deadlocks,
+# serialization failures, pool timeouts) BATCH_RETRIES times, waiting
+# BATCH_BACKOFF * 2^attempt seconds (+ jitter). Batches that still fail are
+# written to DEAD_LETTER_DIR and can be reloaded with replay_failed_batches().
+BATCH_RETRIES = 3
+BATCH_BACKOFF = 1.0
+DEAD_LETTER_DIR = "failed_batches"
+
+# Shadow table swap loads (strategy='swap'): the final DROP + RENAME waits at
+# most SWAP_LOCK_TIMEOUT_MS for running readers, then retries after a pause
+# instead of queueing every new reader behind it.
+SWAP_LOCK_TIMEOUT_MS = 2000
+SWAP_LOCK_RETRIES = 5
+SWAP_RETRY_DELAY = 5  # seconds
+
+# Snapshot history tables (load_history_to_postgres, mode='snapshot') are
+# partitioned by month on fetched_timestamp. Partitions are created for the
+# months being loaded plus the current one and HISTORY_PARTITIONS_AHEAD more.
+HISTORY_PARTITIONS_AHEAD = 1
+
+# Retention in months including the current one; None keeps every partition.
+# Overrides are keyed by history table name, e.g. {"sales_tasks_history_25": 6}.
+HISTORY_RETENTION_MONTHS = None
+HISTORY_RETENTION_OVERRIDES = {}
+# 'detach' keeps old partitions as standalone <partition>_detached tables, 'drop' deletes them
+HISTORY_RETENTION_ACTION = 'detach'
+
+# Shared psycopg_pool connection pool (src/utils/utils_postgres.py).
+# load_to_postgres holds one control connection while its batch workers
+# borrow more, so POOL_MAX_SIZE should stay above the worker count.
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 8
+POOL_TIMEOUT = 60  # seconds a caller may wait for a free connection
+POOL_MAX_IDLE = 300  # seconds before an idle extra connection is closed
+
+# Tables loaded at the same time by load_tables / LoadQueue (src/etl/load_async.py).
+# Each load holds one pooled connection and its executemany batches borrow
+# more for a moment, so keep it well below POOL_MAX_SIZE.
+LOAD_CONCURRENCY = 4
+
+# Jobs a LoadQueue holds (waiting or loading) before submit() blocks the
+# extractor; bounds how many extracted frames are kept in memory at once.
+LOAD_MAX_PENDING = 8
@@ -0,0 +1,20 @@
+import os
+from datetime import timedelta
+
+# Incremental (watermark) sync settings for the extractors
+
+# High-water marks of incrementally synced sources, one JSON file per source
+WATERMARK_DIR = "etl_metadata"
+
+# Finance transactions: re-read this far behind the stored watermark to catch
+# late-committed rows, and do a full re-download at least this often
+FINANCE_WATERMARK_OVERLAP = timedelta(days=2)
+FINANCE_FULL_SYNC_EVERY = timedelta(days=7)
+
+# amoCRM leads, contacts, companies and tasks: filter[updated_at][from] starts
+# this far behind the stored watermark, and a full sweep runs at least this often
+AMOCRM_WATERMARK_OVERLAP = timedelta(minutes=30)
+AMOCRM_FULL_SYNC_EVERY = timedelta(days=7)
+
+# ETL_FULL_SYNC=1 forces a full download of every incrementally synced source
+FORCE_FULL_SYNC = os.getenv("ETL_FULL_SYNC", "") == "1"
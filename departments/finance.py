@@ -18,7 +18,11 @@ if token:
     # --- TRANSACTIONS URGANCH OMON SCHOOL ---
     try:
         transactions = finance_fetch_all_transactions(token)
-        load_to_postgres(df=transactions, dept="finance", table_base_name="transactions", postfix="_2526", primary_key="id")
+        if transactions.empty:
+            logger.info("No new transactions since the last run.")
+        else:
+            load_to_postgres(df=transactions, dept="finance", table_base_name="transactions", postfix="_2526", primary_key="id")
+        finance_save_watermark(transactions, branch="68417f7edbbdfc73ada6ef01")
         logger.info("Transactions successfully fetched and loaded.")
     except Exception as e:
         logger.exception(f"❌Failed to fetch/load Urganch school transactions: {e}")
@@ -27,7 +31,11 @@ if token:
     # --- TRANSACTIONS GURLAN OMON SCHOOL ---
     try:
         transactions = finance_fetch_all_transactions(token, branch="684d1fc04921a1211f725ec4")
-        load_to_postgres(df=transactions, dept="finance", table_base_name="transactions", postfix="_2526", primary_key="id")
+        if transactions.empty:
+            logger.info("No new transactions since the last run.")
+        else:
+            load_to_postgres(df=transactions, dept="finance", table_base_name="transactions", postfix="_2526", primary_key="id")
+        finance_save_watermark(transactions, branch="684d1fc04921a1211f725ec4")
         logger.info("Transactions successfully fetched and loaded.")
     except Exception as e:
         logger.exception(f"❌Failed to fetch/load Gurlan school transactions: {e}")
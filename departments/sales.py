@@ -1,6 +1,7 @@
 from src.etl.connect import *
 from src.etl.extract_sales import *
 from src.etl.load import *
+from src.etl.load_async import *
 import datetime
 from configs.logging_config import get_logger
 logger = get_logger("etl_log")
@@ -20,100 +21,112 @@ except Exception as e:
     headers = None
 
 if headers:
+    # Tables load in the background while the next ones are fetched
+    loads = LoadQueue()
+
     # --- LEADS ---
     try:
         leads = amocrm_get_leads(headers)
-        load_to_postgres(df=leads, dept="sales", table_base_name="leads", postfix="25", primary_key="id")
-        load_history_to_postgres(df=leads, dept="sales", table_base_name="leads", postfix="25", primary_key="id")
-        logger.info("Leads successfully fetched and loaded.")
+        loads.submit(load_job(df=leads, dept="sales", table_base_name="leads", postfix="25", primary_key="id", change_detection=True))
+        # An incremental extract holds only changed leads, absent ones are not deleted
+        loads.submit(history_job(df=leads, dept="sales", table_base_name="leads", postfix="25", primary_key="id", mode="scd2",
+                                tombstones=not leads.attrs.get("incremental", False)))
+        logger.info("Leads successfully fetched.")
     except Exception as e:
-        logger.exception(f"❌Failed to fetch/load leads: {e}")
+        logger.exception(f"❌Failed to fetch leads: {e}")
 
     # --- CATALOGS ---
     try:
         catalogs = amocrm_get_catalogs(headers)
-        load_to_postgres(df=catalogs, dept="sales", table_base_name="catalogs", postfix="25", primary_key="id")
-        logger.info("Catalogs successfully fetched and loaded.")
+        loads.submit(load_job(df=catalogs, dept="sales", table_base_name="catalogs", postfix="25", primary_key="id"))
+        logger.info("Catalogs successfully fetched.")
     except Exception as e:
-        logger.exception(f"❌Failed to fetch/load catalogs: {e}")
+        logger.exception(f"❌Failed to fetch catalogs: {e}")
 
     # --- CONTACTS ---
     try:
         contacts = amocrm_get_contacts(headers)
-        load_to_postgres(df=contacts, dept="sales", table_base_name="contacts", postfix="25", primary_key="id")
-        logger.info("Contacts successfully fetched and loaded.")
+        loads.submit(load_job(df=contacts, dept="sales", table_base_name="contacts", postfix="25", primary_key="id"))
+        logger.info("Contacts successfully fetched.")
     except Exception as e:
-        logger.exception(f"❌Failed to fetch/load contacts: {e}")
+        logger.exception(f"❌Failed to fetch contacts: {e}")
 
     # --- COMPANIES ---
     try:
         companies = amocrm_get_companies(headers)
-        load_to_postgres(df=companies, dept="sales", table_base_name="companies", postfix="25", primary_key="id")
-        logger.info("Companies successfully fetched and loaded.")
+        loads.submit(load_job(df=companies, dept="sales", table_base_name="companies", postfix="25", primary_key="id"))
+        logger.info("Companies successfully fetched.")
     except Exception as e:
-        logger.exception(f"❌Failed to fetch/load companies: {e}")
+        logger.exception(f"❌Failed to fetch companies: {e}")
 
     # --- LOSS REASONS ---
     try:
         loss_reasons = amocrm_get_loss_reasons(headers)
-        load_to_postgres(df=loss_reasons, dept="sales", table_base_name="loss_reasons", postfix="25", primary_key="id")
-        load_history_to_postgres(df=loss_reasons, dept="sales", table_base_name="loss_reasons", postfix="25", primary_key="id")
-        logger.info("Loss reasons successfully fetched and loaded.")
+        loads.submit(load_job(df=loss_reasons, dept="sales", table_base_name="loss_reasons", postfix="25", primary_key="id"))
+        loads.submit(history_job(df=loss_reasons, dept="sales", table_base_name="loss_reasons", postfix="25", primary_key="id"))
+        logger.info("Loss reasons successfully fetched.")
     except Exception as e:
-        logger.exception(f"❌Failed to fetch/load loss reasons: {e}")
+        logger.exception(f"❌Failed to fetch loss reasons: {e}")
 
 
     # --- PIPELINES AND STATUSES ---
     try:
         pipelines_df, statuses_df = amocrm_get_pipelines_statuses(headers)
 
-        load_to_postgres(df=pipelines_df, dept="sales", table_base_name="pipelines", postfix="25", primary_key="id")
-        load_history_to_postgres(df=pipelines_df, dept="sales", table_base_name="pipelines", postfix="25", primary_key="id")
+        loads.submit(load_job(df=pipelines_df, dept="sales", table_base_name="pipelines", postfix="25", primary_key="id"))
+        loads.submit(history_job(df=pipelines_df, dept="sales", table_base_name="pipelines", postfix="25", primary_key="id"))
 
-        load_to_postgres(df=statuses_df, dept="sales", table_base_name="statuses", postfix="25", primary_key="status_id")
-        load_history_to_postgres(df=statuses_df, dept="sales", table_base_name="statuses", postfix="25", primary_key="status_id")
+        loads.submit(load_job(df=statuses_df, dept="sales", table_base_name="statuses", postfix="25", primary_key="status_id"))
+        loads.submit(history_job(df=statuses_df, dept="sales", table_base_name="statuses", postfix="25", primary_key="status_id"))
 
-        logger.info("Pipelines and statuses successfully fetched and loaded.")
+        logger.info("Pipelines and statuses successfully fetched.")
     except Exception as e:
-        logger.exception(f"❌Failed to fetch/load pipelines and statuses: {e}")
+        logger.exception(f"❌Failed to fetch pipelines and statuses: {e}")
 
     # --- TASKS ---
     try:
         tasks = amocrm_get_tasks(headers)
-        load_to_postgres(df=tasks, dept="sales", table_base_name="tasks", postfix="25", primary_key="id")
-        load_history_to_postgres(df=tasks, dept="sales", table_base_name="tasks", postfix="25", primary_key="id")
-        logger.info("Tasks successfully fetched and loaded.")
+        loads.submit(load_job(df=tasks, dept="sales", table_base_name="tasks", postfix="25", primary_key="id"))
+        loads.submit(history_job(df=tasks, dept="sales", table_base_name="tasks", postfix="25", primary_key="id", mode="scd2",
+                                tombstones=not tasks.attrs.get("incremental", False)))
+        logger.info("Tasks successfully fetched.")
     except Exception as e:
-        logger.exception(f"❌Failed to fetch/load tasks: {e}")
+        logger.exception(f"❌Failed to fetch tasks: {e}")
 
     # --- TAGS & CUSTOM FIELDS ---
     try:
         tags_df, custom_fields_df = amocrm_get_tags_custom_fields(headers)
 
-        load_to_postgres(df=tags_df, dept="sales", table_base_name="tags", postfix="25", primary_key="id")
-        load_history_to_postgres(df=tags_df, dept="sales", table_base_name="tags", postfix="25", primary_key="id")
+        loads.submit(load_job(df=tags_df, dept="sales", table_base_name="tags", postfix="25", primary_key="id"))
+        loads.submit(history_job(df=tags_df, dept="sales", table_base_name="tags", postfix="25", primary_key="id"))
 
-        load_to_postgres(df=custom_fields_df, dept="sales", table_base_name="custom_fields", postfix="25", primary_key="id")
-        load_history_to_postgres(df=custom_fields_df, dept="sales", table_base_name="custom_fields", postfix="25", primary_key="id")
+        loads.submit(load_job(df=custom_fields_df, dept="sales", table_base_name="custom_fields", postfix="25", primary_key="id"))
+        loads.submit(history_job(df=custom_fields_df, dept="sales", table_base_name="custom_fields", postfix="25", primary_key="id"))
 
-        logger.info("Tags & custom fields successfully fetched and loaded.")
+        logger.info("Tags & custom fields successfully fetched.")
     except Exception as e:
-        logger.exception(f"❌Failed to fetch/load tags & custom fields: {e}")
+        logger.exception(f"❌Failed to fetch tags & custom fields: {e}")
 
     # --- TASK TYPES ---
     try:
         task_types = amocrm_get_task_types(headers)
-        load_to_postgres(df=task_types, dept="sales", table_base_name="task_types", postfix="25", primary_key="id")
-        logger.info("Task types successfully fetched and loaded.")
+        loads.submit(load_job(df=task_types, dept="sales", table_base_name="task_types", postfix="25", primary_key="id"))
+        logger.info("Task types successfully fetched.")
     except Exception as e:
-        logger.exception(f"❌Failed to fetch/load task types: {e}")
+        logger.exception(f"❌Failed to fetch task types: {e}")
 
     # --- USERS ---
     try:
         users = amocrm_get_users(headers)
-        load_to_postgres(df=users, dept="sales", table_base_name="users", postfix="25", primary_key="id")
-        logger.info("Users successfully fetched and loaded.")
+        loads.submit(load_job(df=users, dept="sales", table_base_name="users", postfix="25", primary_key="id"))
+        logger.info("Users successfully fetched.")
     except Exception as e:
-        logger.exception(f"❌Failed to fetch/load leads: {e}")
+        logger.exception(f"❌Failed to fetch leads: {e}")
+
+    # --- LOAD ---
+    results = loads.join()
+
+    # Advance incremental watermarks only for entities that loaded
+    amocrm_save_watermarks(results)
 
 logger.info("SALES DEPARTMENT ETL run completed.")
@@ -18,7 +18,7 @@ if key and token:
 
         load_to_postgres(df=boards_df, dept="trello", table_base_name="boards", postfix="25", primary_key="id")
 
-        load_to_postgres(df=cards_df, dept="trello", table_base_name="cards", postfix="25", primary_key="id")
+        load_to_postgres(df=cards_df, dept="trello", table_base_name="cards", postfix="25", primary_key="id", change_detection=True)
         load_history_to_postgres(df=cards_df, dept="trello", table_base_name="cards", postfix="25", primary_key="id")
 
         load_to_postgres(df=lists_df, dept="trello", table_base_name="lists", postfix="25", primary_key="id")
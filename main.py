@@ -1,5 +1,21 @@
+import argparse
 from configs.logging_config import setup_logging
-from departments import ceo, education, finance, hr, marketing, sales, trello
+from src.utils.utils_http import refresh_reference, close_sessions
+from src.utils.utils_postgres import close_pool
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the nightly ETL for all departments.")
+    parser.add_argument("--refresh-reference", action="store_true",
+                        help="ignore cached reference responses (quarters, pipelines, tags, ...) and download them again")
+    args = parser.parse_args()
+
     setup_logging()
+    if args.refresh_reference:
+        refresh_reference()
+
+    # Departments run on import
+    from departments import ceo, education, finance, hr, marketing, sales, trello
+
+    # Release pooled HTTP and PostgreSQL connections before exit
+    close_sessions()
+    close_pool()
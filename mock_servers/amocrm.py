@@ -0,0 +1,259 @@
+"""
+Local stand-in for the amoCRM API v4 (https://{base_domain}/api/v4) and its
+OAuth token endpoint.
+
+Lists page with page/limit (at most 250 per page) and _links.next, honour
+filter[updated_at][from] and order[updated_at], and answer an empty result
+with 204 No Content. Reference endpoints send an ETag. Requests beyond
+7 per second are answered 429, like the real account limit.
+
+    python -m mock_servers.amocrm --size leads=50000 --latency-ms 150
+    AMOCRM_API_URL=http://127.0.0.1:8102 python main.py
+"""
+import time
+from urllib.parse import urlencode
+
+from mock_servers.common import MockHandler, serve
+
+NAME = "amocrm"
+URL_PATH = ""  # AMOCRM_API_URL is the account URL, /api/v4 and /oauth2 hang off it
+DEFAULT_PORT = 8102
+DEFAULT_RPS = 7
+DEFAULT_SIZES = {
+    "leads": 5000,
+    "contacts": 4000,
+    "companies": 300,
+    "tasks": 3000,
+    "users": 15,
+    "catalogs": 3,
+    "recently_updated": 50,  # items per entity updated within the last hour
+}
+MAX_PAGE_SIZE = 250
+ACCOUNT_ID = 31_000_000
+TAGS = ["instagram", "telegram", "sayt", "qayta aloqa", "tavsiya", "ota-ona", "ko'rgazma", "VIP"]
+SOURCES = ["instagram", "facebook", "telegram", "google", "tavsiya"]
+BRANCHES = ["Urganch", "Xiva"]
+
+
+def build_dataset(sizes, rng):
+    now = int(time.time())
+    year_ago = now - 365 * 86400
+
+    def stamps(recent):
+        created = rng.randint(year_ago, now - 3600)
+        updated = rng.randint(now - 3600, now) if recent else rng.randint(created, now - 3600)
+        return created, updated
+
+    users = [{"id": 9_000_000 + i, "name": f"Menejer {i + 1}", "email": f"manager{i + 1}@example.uz",
+              "lang": "ru", "rights": {"is_admin": i == 0, "is_active": True},
+              "_links": {"self": {"href": f"/api/v4/users/{9_000_000 + i}"}}}
+             for i in range(sizes["users"])]
+    user_ids = [u["id"] for u in users] or [9_000_000]
+
+    pipelines = [{
+        "id": 7_000_000 + p,
+        "name": name,
+        "sort": p + 1,
+        "is_main": p == 0,
+        "is_unsorted_on": True,
+        "is_archive": False,
+        "account_id": ACCOUNT_ID,
+        "_links": {"self": {"href": f"/api/v4/leads/pipelines/{7_000_000 + p}"}},
+        "_embedded": {"statuses": [
+            {"id": 60_000_000 + p * 100 + s, "name": status, "sort": (s + 1) * 10, "pipeline_id": 7_000_000 + p,
+             "type": 0 if s < 4 else 1}
+            for s, status in enumerate(["Yangi lid", "Aloqa o'rnatildi", "Sinov darsi", "Shartnoma", "Muvaffaqiyatli", "Yopilgan"])
+        ]},
+    } for p, name in enumerate(["Qabul 2025-2026", "Yozgi lager"])]
+    status_ids = [(p["id"], s["id"]) for p in pipelines for s in p["_embedded"]["statuses"]]
+
+    loss_reasons = [{"id": 80_000 + i, "name": reason, "sort": i * 10, "created_at": year_ago, "updated_at": year_ago,
+                     "_links": {"self": {"href": f"/api/v4/leads/loss_reasons/{80_000 + i}"}}}
+                    for i, reason in enumerate(["Qimmat", "Uzoq", "Boshqa maktab", "Javob bermadi"])]
+    tags = {entity: [{"id": 40_000 + e * 100 + i, "name": name, "color": None} for i, name in enumerate(TAGS)]
+            for e, entity in enumerate(("leads", "contacts", "companies"))}
+    def custom_field(entity, field_id, name, field_type="text", code=None):
+        return {"id": field_id, "name": name, "type": field_type, "account_id": ACCOUNT_ID, "code": code,
+                "sort": field_id % 100 * 10, "is_api_only": False, "enums": None, "group_id": None,
+                "required_statuses": [], "is_deletable": code is None, "is_predefined": code is not None,
+                "entity_type": entity, "tracking_callback": None, "remind": None, "triggers": [],
+                "currency": None, "hidden_statuses": [], "chained_lists": None,
+                "_links": {"self": {"href": f"/api/v4/{entity}/custom_fields/{field_id}"}}}
+
+    custom_fields = {
+        "leads": [custom_field("leads", 1_000_000 + i, name) for i, name in
+                  enumerate(["utm_source", "utm_medium", "utm_campaign", "Kurslar", "Filial", "Marketing manba"])],
+        "contacts": [custom_field("contacts", 1_000_100, "Telefon", "multitext", "PHONE")],
+        "companies": [custom_field("companies", 1_000_200, "Manzil")],
+    }
+    task_types = [{"id": 1, "name": "Qo'ng'iroq", "color": None, "icon_id": None, "code": "FOLLOW_UP"},
+                  {"id": 2, "name": "Uchrashuv", "color": None, "icon_id": None, "code": "MEETING"}]
+
+    def base(entity, i, offset):
+        recent = i < sizes["recently_updated"]
+        created, updated = stamps(recent)
+        return {
+            "id": offset + i,
+            "responsible_user_id": rng.choice(user_ids),
+            "group_id": 0,
+            "created_by": rng.choice(user_ids),
+            "updated_by": rng.choice(user_ids),
+            "created_at": created,
+            "updated_at": updated,
+            "account_id": ACCOUNT_ID,
+            "_links": {"self": {"href": f"/api/v4/{entity}/{offset + i}"}},
+        }
+
+    leads = []
+    for i in range(sizes["leads"]):
+        lead = base("leads", i, 20_000_000)
+        pipeline_id, status_id = rng.choice(status_ids)
+        lead.update({
+            "name": f"Lid #{lead['id']}",
+            "price": rng.choice([0, 0, 1_500_000, 2_500_000, 3_000_000]),
+            "status_id": status_id,
+            "pipeline_id": pipeline_id,
+            "loss_reason_id": rng.choice([None, None, None] + [r["id"] for r in loss_reasons]),
+            "closed_at": lead["updated_at"] if status_id % 100 >= 4 else None,
+            "closest_task_at": rng.choice([None, lead["updated_at"] + 86400]),
+            "is_deleted": False,
+            "score": None,
+            "labor_cost": None,
+            "custom_fields_values": rng.choice([None, [
+                {"field_id": 1_000_000, "field_name": "utm_source", "field_code": None, "field_type": "text",
+                 "values": [{"value": rng.choice(SOURCES)}]},
+                {"field_id": 1_000_004, "field_name": "Filial", "field_code": None, "field_type": "select",
+                 "values": [{"value": rng.choice(BRANCHES), "enum_id": 5000}]},
+            ]]),
+            "_embedded": {"tags": [{"id": t["id"], "name": t["name"], "color": None}
+                                   for t in rng.sample(tags["leads"], rng.randint(0, 3))],
+                          "companies": []},
+        })
+        leads.append(lead)
+
+    contacts = []
+    for i in range(sizes["contacts"]):
+        contact = base("contacts", i, 30_000_000)
+        contact.update({
+            "name": f"Kontakt {contact['id']}",
+            "first_name": "",
+            "last_name": "",
+            "closest_task_at": rng.choice([None, contact["updated_at"] + 86400]),
+            "is_deleted": False,
+            "is_unsorted": False,
+            "custom_fields_values": [{"field_id": 1_000_100, "field_name": "Telefon", "field_code": "PHONE",
+                                      "field_type": "multitext",
+                                      "values": [{"value": f"+99891{rng.randint(1000000, 9999999)}", "enum_code": "MOB"}]}],
+            "_embedded": {"tags": [], "companies": []},
+        })
+        contacts.append(contact)
+
+    companies = []
+    for i in range(sizes["companies"]):
+        company = base("companies", i, 40_000_000)
+        company.update({"name": f"Kompaniya {company['id']}", "is_deleted": False,
+                        "closest_task_at": rng.choice([None, company["updated_at"] + 86400]),
+                        "custom_fields_values": None, "_embedded": {"tags": []}})
+        companies.append(company)
+
+    tasks = []
+    for i in range(sizes["tasks"]):
+        task = base("tasks", i, 50_000_000)
+        task.update({
+            "entity_id": 20_000_000 + rng.randrange(max(sizes["leads"], 1)),
+            "entity_type": "leads",
+            "is_completed": rng.random() < 0.7,
+            "task_type_id": rng.choice(task_types)["id"],
+            "text": rng.choice(["Qayta qo'ng'iroq", "Sinov darsiga taklif", "Shartnoma yuborish"]),
+            "duration": 0,
+            "complete_till": task["created_at"] + rng.randint(1, 14) * 86400,
+            "result": [],
+        })
+        tasks.append(task)
+
+    catalogs = [{"id": 6_000 + i, "name": name, "created_by": user_ids[0], "updated_by": user_ids[0],
+                 "created_at": year_ago, "updated_at": year_ago, "sort": i * 10, "type": "regular",
+                 "can_add_elements": True, "can_show_in_cards": True, "can_link_multiple": True,
+                 "can_be_deleted": True, "sdk_widget_code": None, "account_id": ACCOUNT_ID,
+                 "_links": {"self": {"href": f"/api/v4/catalogs/{6_000 + i}"}}}
+                for i, name in enumerate(["Kurslar", "Xizmatlar", "Mahsulotlar", "Chegirmalar"][:sizes["catalogs"]])]
+
+    return {
+        "leads": leads,
+        "contacts": contacts,
+        "companies": companies,
+        "tasks": tasks,
+        "users": users,
+        "catalogs": catalogs,
+        "pipelines": pipelines,
+        "loss_reasons": loss_reasons,
+        "tags": tags,
+        "custom_fields": custom_fields,
+        "task_types": task_types,
+    }
+
+
+class Handler(MockHandler):
+    ROUTES = [
+        ("POST", r"/oauth2/access_token", "access_token"),
+        ("GET", r"/api/v4/leads/pipelines", "pipelines"),
+        ("GET", r"/api/v4/leads/loss_reasons", "loss_reasons"),
+        ("GET", r"/api/v4/(leads|contacts|companies)/(tags|custom_fields)", "entity_reference"),
+        ("GET", r"/api/v4/account", "account"),
+        ("GET", r"/api/v4/(leads|contacts|companies|tasks|users|catalogs)", "items"),
+    ]
+
+    def access_token(self):
+        self.send_json({"token_type": "Bearer", "expires_in": 86400,
+                        "access_token": f"mock-amocrm-access-{int(time.time())}",
+                        "refresh_token": f"mock-amocrm-refresh-{int(time.time())}"})
+
+    def reference(self, key, items):
+        self.send_json({"_total_items": len(items), "_links": {"self": {"href": f"{self.base_url()}{self.path}"}},
+                        "_embedded": {key: items}}, etag=True)
+
+    def pipelines(self):
+        self.reference("pipelines", self.data["pipelines"])
+
+    def loss_reasons(self):
+        self.reference("loss_reasons", self.data["loss_reasons"])
+
+    def entity_reference(self, entity, field):
+        self.reference(field, self.data[field][entity])
+
+    def account(self):
+        payload = {"id": ACCOUNT_ID, "name": "Mock school", "subdomain": "mock", "_embedded": {}}
+        if "task_types" in self.query.get("with", ""):
+            payload["_embedded"]["task_types"] = self.data["task_types"]
+        self.send_json(payload, etag=True)
+
+    def items(self, entity):
+        items = self.data[entity]
+        since = self.query.get("filter[updated_at][from]")
+        if since:
+            items = [item for item in items if item.get("updated_at", 0) >= int(since)]
+        order = self.query.get("order[updated_at]")
+        if order:
+            items = sorted(items, key=lambda item: item.get("updated_at", 0), reverse=order == "desc")
+
+        limit = self.int_param("limit", 50, MAX_PAGE_SIZE)
+        page = self.int_param("page", 1)
+        chunk = items[(page - 1) * limit:page * limit]
+        if not chunk:
+            return self.send_empty(204)
+
+        def link(number):
+            query = {**self.query, "page": number, "limit": limit}
+            return {"href": f"{self.base_url()}/api/v4/{entity}?{urlencode(query)}"}
+
+        links = {"self": link(page)}
+        if page * limit < len(items):
+            links["next"] = link(page + 1)
+        if page > 1:
+            links["prev"] = link(page - 1)
+        self.send_json({"_page": page, "_links": links, "_embedded": {entity: chunk}})
+
+
+if __name__ == "__main__":
+    import sys
+    serve(sys.modules[__name__])
@@ -0,0 +1,246 @@
+"""
+Shared plumbing of the local stand-in API servers: a threaded stdlib HTTP
+server, JSON responses (brotli/gzip like the real APIs), fault injection and
+fixture loading. Each upstream module (eduschool, amocrm, trello, graph)
+defines its routes and generated dataset on top of it.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import brotli
+
+
+class Faults:
+    """
+    Latency and error injection applied to every request before it is routed.
+
+    Parameters
+    ----------
+    latency_ms, jitter_ms : float
+        Added delay per request: latency_ms plus a uniform 0..jitter_ms.
+    error_rate : float
+        Share of requests answered 429 with Retry-After: retry_after.
+    timeout_rate : float
+        Share of requests held for timeout_s seconds and then dropped without
+        a response, so the client hits its read timeout.
+    rps : float
+        Requests per second above which requests are answered 429, like the
+        real per-account limits (0 = unlimited).
+    """
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, timeout_rate=0.0,
+                 timeout_s=90.0, rps=0.0, retry_after=1):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_s = timeout_s
+        self.rps = rps
+        self.retry_after = retry_after
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def _over_limit(self):
+        if not self.rps:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0] >= 1:
+                self._recent.popleft()
+            if len(self._recent) >= self.rps:
+                return True
+            self._recent.append(now)
+            return False
+
+    def inject(self, handler):
+        """Apply the faults to a request; True when the request was answered (or dropped) here."""
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay:
+            time.sleep(delay / 1000)
+        if self._over_limit() or random.random() < self.error_rate:
+            handler.send_json({"status": 429, "title": "Too Many Requests"}, status=429,
+                              headers={"Retry-After": str(self.retry_after)})
+            return True
+        if random.random() < self.timeout_rate:
+            time.sleep(self.timeout_s)
+            handler.close_connection = True
+            return True
+        return False
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """
+    Routes requests to handler methods by (method, path regex).
+
+    Subclasses set ROUTES = [("GET", r"/path/(\\w+)", "method_name"), ...];
+    the method gets the regex groups and answers with send_json / send_empty.
+    self.query and self.body hold the parsed query string and request body.
+    """
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+    ROUTES = []
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        split = urlsplit(self.path)
+        self.query = dict(parse_qsl(split.query, keep_blank_values=True))
+        raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if "json" in (self.headers.get("Content-Type") or ""):
+            self.body = json.loads(raw or b"{}")
+        else:
+            self.body = dict(parse_qsl(raw.decode(), keep_blank_values=True))
+
+        if self.server.faults.inject(self):
+            return
+        for route_method, pattern, name in self.ROUTES:
+            match = re.fullmatch(pattern, split.path) if route_method == method else None
+            if match:
+                return getattr(self, name)(*match.groups())
+        self.send_json({"error": f"no route for {method} {split.path}"}, status=404)
+
+    @property
+    def data(self):
+        return self.server.data
+
+    def base_url(self):
+        """Scheme and host the client used, for absolute links (paging.next, _links)."""
+        return f"http://{self.headers.get('Host') or '%s:%s' % self.server.server_address[:2]}"
+
+    def by_id(self, collection, key="_id"):
+        """{id: item} index of a dataset collection, built on first use."""
+        indexes = self.server.indexes
+        if (collection, key) not in indexes:
+            indexes[collection, key] = {item[key]: item for item in self.data[collection]}
+        return indexes[collection, key]
+
+    def int_param(self, name, default, maximum=None):
+        try:
+            value = int(self.query.get(name, default))
+        except ValueError:
+            value = default
+        return max(1, min(value, maximum) if maximum else value)
+
+    def send_json(self, payload, status=200, headers=None, etag=False):
+        """
+        Send payload as JSON, compressed as the client accepts. With etag=True
+        an ETag is sent and a matching If-None-Match is answered 304.
+        """
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        headers = dict(headers or {})
+        if etag:
+            headers["ETag"] = f'"{hashlib.sha1(body).hexdigest()}"'
+            if self.headers.get("If-None-Match") == headers["ETag"]:
+                self.send_response(304)
+                self.send_header("ETag", headers["ETag"])
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+        accepted = self.headers.get("Accept-Encoding") or ""
+        encoding = None
+        if "br" in accepted:
+            body, encoding = brotli.compress(body, quality=5), "br"
+        elif "gzip" in accepted:
+            body, encoding = gzip.compress(body, compresslevel=5), "gzip"
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_empty(self, status=204):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def parse_sizes(pairs, defaults):
+    """Merge --size name=N options into the server's default dataset sizes."""
+    sizes = dict(defaults)
+    for pair in pairs or []:
+        name, _, value = pair.partition("=")
+        if name in defaults:
+            sizes[name] = int(value)
+    return sizes
+
+
+def load_fixtures(data, fixtures_dir, name):
+    """Replace generated collections with <fixtures_dir>/<name>/<collection>.json files that exist."""
+    if not fixtures_dir:
+        return data
+    for collection in list(data):
+        path = os.path.join(fixtures_dir, name, f"{collection}.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data[collection] = json.load(f)
+    return data
+
+
+def add_common_arguments(parser):
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generated datasets")
+    parser.add_argument("--size", action="append", metavar="NAME=N",
+                        help="dataset size, e.g. --size students=5000 (repeatable)")
+    parser.add_argument("--fixtures", help="directory with <server>/<collection>.json files used instead of generated data")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay added to every request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="extra random delay of up to this much")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered 429")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="share of requests left unanswered")
+    parser.add_argument("--timeout-s", type=float, default=90.0, help="how long unanswered requests are held")
+    parser.add_argument("--rps", type=float, default=None, help="requests per second before 429 (default: the API's own limit)")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    return parser
+
+
+def make_server(module, args, port):
+    """Build (not start) the stand-in server of an upstream module from the parsed arguments."""
+    sizes = parse_sizes(args.size, module.DEFAULT_SIZES)
+    data = load_fixtures(module.build_dataset(sizes, random.Random(args.seed)), args.fixtures, module.NAME)
+    server = ThreadingHTTPServer((args.host, port), module.Handler)
+    server.daemon_threads = True
+    server.data = data
+    server.indexes = {}
+    server.verbose = args.verbose
+    server.faults = Faults(args.latency_ms, args.jitter_ms, args.error_rate, args.timeout_rate,
+                           args.timeout_s, module.DEFAULT_RPS if args.rps is None else args.rps, args.retry_after)
+    return server
+
+
+def serve(module):
+    """Command-line entry point of a single upstream's server."""
+    parser = add_common_arguments(argparse.ArgumentParser(description=f"Local stand-in for the {module.NAME} API."))
+    parser.add_argument("--port", type=int, default=module.DEFAULT_PORT)
+    args = parser.parse_args()
+    server = make_server(module, args, args.port)
+    host, port = server.server_address[:2]
+    print(f"{module.NAME}: http://{host}:{port}{module.URL_PATH} "
+          f"({', '.join(f'{k}={len(v)}' for k, v in server.data.items() if isinstance(v, (list, dict)))})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,360 @@
+"""
+Local stand-in for the eduschool moderator API (backend.eduschool.uz/moderator-api).
+
+Answers {"code": 0, "data": ...} like the real API; /pagin endpoints page with
+page/limit, cap the page size at MAX_PAGE_SIZE and report "total".
+Cashbox transactions are listed newest-first.
+
+    python -m mock_servers.eduschool --size students=5000 --latency-ms 80
+    EDUSCHOOL_API_URL=http://127.0.0.1:8101/moderator-api python main.py
+"""
+import datetime
+import random
+
+from mock_servers.common import MockHandler, serve
+
+NAME = "eduschool"
+URL_PATH = "/moderator-api"
+DEFAULT_PORT = 8101
+DEFAULT_RPS = 0
+DEFAULT_SIZES = {
+    "classes": 40,
+    "students": 800,
+    "employees": 60,
+    "transactions": 3000,
+    "journals_per_class": 8,
+    "lessons": 12,  # attendance records per student and journal
+}
+# Larger limits are silently reduced to this, like the real API
+MAX_PAGE_SIZE = 100
+
+YEAR_ID = "6841869b8eb7901bc71c7807"
+BRANCH_ID = "68417f7edbbdfc73ada6ef01"
+SUBJECTS = ["Matematika", "Ona tili", "Ingliz tili", "Fizika", "Kimyo", "Biologiya", "Tarix", "Informatika",
+            "Rus tili", "Geografiya", "Jismoniy tarbiya", "Musiqa"]
+FIRST_NAMES = ["Aziz", "Dilnoza", "Javohir", "Madina", "Sardor", "Nilufar", "Bekzod", "Malika", "Otabek", "Zarina"]
+LAST_NAMES = ["Karimov", "Rashidova", "Tursunov", "Yusupova", "Aliyev", "Saidova", "Ergashev", "Qodirova"]
+
+
+def oid(kind, n):
+    """Mongo-like 24 hex digit id: collection prefix + sequence number."""
+    return f"{kind:02x}{n:022x}"
+
+
+# Nine in ten students are studying
+STATUSES = [{"_id": oid(12, 0), "name": "O'qiyapti", "state": "active", "isDefault": True}] * 9 + [
+    {"_id": oid(12, 1), "name": "Chiqib ketgan", "state": "archived", "isDefault": False}]
+
+
+def iso(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.") + f"{moment.microsecond // 1000:03d}Z"
+
+
+def academic_year_start(today):
+    return datetime.datetime(today.year if today.month >= 9 else today.year - 1, 9, 1)
+
+
+def person(rng, n):
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    middle = rng.choice(["Alisher o'g'li", "Bahodir qizi", "Rustam o'g'li", ""])
+    return {
+        "firstName": first,
+        "lastName": last,
+        "middleName": middle,
+        "fullName": f"{last} {first} {middle}".strip(),
+        "phoneNumber": f"+99890{1000000 + n * 7919 % 9000000}",
+    }
+
+
+def build_dataset(sizes, rng):
+    now = datetime.datetime.utcnow()
+    year_start = academic_year_start(now.date())
+    org = {"organizationId": oid(13, 0), "academicYearId": YEAR_ID}
+
+    quarter_bounds = [(0, 60), (67, 130), (137, 200), (207, 272)]
+    quarters = [{
+        "_id": oid(1, i),
+        **org,
+        "quarter": i + 1,
+        "startsAt": iso(year_start + datetime.timedelta(days=start)),
+        "endsAt": iso(year_start + datetime.timedelta(days=end, hours=23, minutes=59)),
+        "months": [],
+        "createdAt": iso(year_start - datetime.timedelta(days=20)),
+        "updatedAt": iso(year_start - datetime.timedelta(days=20)),
+    } for i, (start, end) in enumerate(quarter_bounds)]
+
+    employees = []
+    for i in range(sizes["employees"]):
+        role = rng.choice(["O'qituvchi"] * 4 + ["Administrator"])
+        created = year_start - datetime.timedelta(days=rng.randint(0, 900))
+        employees.append({
+            "_id": oid(2, i),
+            **org,
+            "uuid": 500 + i,
+            **person(rng, i),
+            "type": "teacher" if role == "O'qituvchi" else "staff",
+            "login": f"employee{i + 1}",
+            "singleLessonCost": rng.choice([0, 50000, 80000]),
+            "state": "active",
+            "classIds": [],
+            "lessonStartBell": None,
+            "lessonEndBell": None,
+            "imageUrl": None,
+            "fcmToken": None,
+            "isBoss": i == 0,
+            "branchEmployee": {"_id": oid(14, i), "branchId": BRANCH_ID, "isActive": True,
+                               "roleId": oid(15, role == "Administrator"), "salary": rng.randint(40, 150) * 100000,
+                               "roleName": role},
+            "employeeSubjects": [],
+            "subjects": [],
+            "customFields": [],
+            "archivedAt": None,
+            "birthday": iso(datetime.datetime(rng.randint(1965, 2000), rng.randint(1, 12), rng.randint(1, 28))),
+            "createdAt": iso(created),
+            "updatedAt": iso(created + datetime.timedelta(days=rng.randint(0, 300))),
+            "gender": rng.choice(["male", "female"]),
+            "employeeNo": f"E{i + 1:04d}",
+        })
+    teachers = employees or [{"_id": oid(2, 0), "firstName": "", "lastName": "", "phoneNumber": ""}]
+
+    classes = []
+    for i in range(sizes["classes"]):
+        head = rng.choice(teachers)
+        classes.append({
+            "_id": oid(3, i),
+            "uuid": 1000 + i,
+            "type": "regular",
+            "grade": i % 11 + 1,
+            "letter": "ABCDEFGH"[i // 11 % 8],
+            "language": rng.choice(["uz", "ru", "en"]),
+            "studentsCount": 0,
+            "maxStudentsCount": 30,
+            "building": {"_id": oid(4, i % 2), "name": f"Bino {i % 2 + 1}"},
+            "headTeacher": [{k: head[k] for k in ("_id", "firstName", "lastName", "phoneNumber")}],
+            "moderators": [],
+        })
+
+    students = []
+    for i in range(sizes["students"]):
+        klass = classes[i % len(classes)] if classes else {"_id": None, "grade": 1}
+        if classes:
+            klass["studentsCount"] += 1
+        contract = year_start - datetime.timedelta(days=rng.randint(0, 700))
+        plan = i % 3
+        students.append({
+            "_id": oid(5, i),
+            "uuid": 20000 + i,
+            **person(rng, i + 1000),
+            "balance": rng.randint(-30, 10) * 100000,
+            "gender": rng.choice(["male", "female"]),
+            "contractNumber": f"{year_start.year % 100}/{i + 1:05d}",
+            "address": rng.choice(["Urganch sh.", "Xiva sh.", "Gurlan t."]),
+            "paymentDay": rng.choice([1, 5, 10, 15]),
+            "grade": klass["grade"],
+            "class": {"_id": klass["_id"]},
+            "status": rng.choice(STATUSES),
+            "parents": [{"_id": oid(10, i), "type": rng.choice(["father", "mother"])}],
+            "subscription": {"_id": oid(11, plan), "name": ["Standart", "Imtiyozli", "Premium"][plan],
+                             "duration": 1, "price": [2_500_000, 1_500_000, 4_000_000][plan],
+                             "timeRange": "month", "state": "active"},
+            "customFields": [],
+            "otherPhoneNumbers": [],
+            "birthday": iso(datetime.datetime(year_start.year - 6 - klass["grade"], rng.randint(1, 12), rng.randint(1, 28))),
+            "contractDate": iso(contract),
+            "contractEndDate": iso(datetime.datetime(year_start.year + 1, 5, 31)),
+        })
+
+    # Student details (/students/{id}), only what the list does not carry
+    details = {s["_id"]: {
+        "_id": s["_id"],
+        "kommoLeadId": rng.randint(10_000_000, 99_999_999),
+        "locations": [
+            {"type": "homeLocation", "lat": 41.55 + rng.random() / 10, "lng": 60.6 + rng.random() / 10},
+            {"type": "pickupLocation", "lat": 41.55 + rng.random() / 10, "lng": 60.6 + rng.random() / 10,
+             "pickupTime": f"0{rng.randint(7, 8)}:{rng.choice(['00', '15', '30', '45'])}"},
+        ],
+    } for s in students}
+
+    journals = []
+    for klass in classes:
+        for subject in rng.sample(SUBJECTS, min(sizes["journals_per_class"], len(SUBJECTS))):
+            journals.append({
+                "_id": oid(6, len(journals)),
+                "classId": klass["_id"],
+                "subject": {"_id": oid(7, SUBJECTS.index(subject)), "name": subject},
+                "teacher": [{"_id": rng.choice(teachers)["_id"]}],
+            })
+
+    # Newest first, minutes to hours apart, ending now
+    transaction_types = [
+        {"_id": oid(16, 0), "name": "O'quvchi to'lovi", "type": "income", "hasImpactOn": "student", "color": "#22c55e"},
+        {"_id": oid(16, 1), "name": "Ish haqi", "type": "expense", "hasImpactOn": "employee", "color": "#ef4444"},
+        {"_id": oid(16, 2), "name": "Xo'jalik", "type": "expense", "hasImpactOn": "none", "color": "#f59e0b"},
+    ]
+    cashboxes = [{"_id": oid(17, i), "name": name} for i, name in enumerate(["Asosiy kassa", "Bank"])]
+    methods = [{"_id": oid(18, i), "name": name} for i, name in enumerate(["Naqd", "Karta", "O'tkazma"])]
+    transactions = []
+    moment = now
+    balance = 500_000_000
+    for i in range(sizes["transactions"]):
+        moment -= datetime.timedelta(seconds=rng.randint(60, 7200))
+        kind = rng.choice([transaction_types[0]] * 4 + transaction_types[1:])
+        student = rng.choice(students) if students and kind["hasImpactOn"] == "student" else None
+        employee = rng.choice(employees) if employees and kind["hasImpactOn"] == "employee" else None
+        cashier, cashbox, method = rng.choice(teachers), rng.choice(cashboxes), rng.choice(methods)
+        amount = rng.randint(1, 40) * 100000
+        after = balance
+        balance -= amount if kind["type"] == "income" else -amount
+        transactions.append({
+            "_id": oid(8, sizes["transactions"] - i),
+            **org,
+            "sessionId": oid(19, i // 50),
+            "number": sizes["transactions"] - i,
+            "origin": "manual",
+            "type": kind["type"],
+            "balanceId": oid(20, 0),
+            "branchId": BRANCH_ID,
+            "cashboxId": cashbox["_id"],
+            "transactionTypeId": kind["_id"],
+            "amount": amount,
+            "paymentMethodId": method["_id"],
+            "paymentType": method["name"],
+            "comment": rng.choice(["", "Oylik to'lov", "Avans"]),
+            "studentId": student["_id"] if student else None,
+            "cashierId": cashier["_id"],
+            "beforeAmount": balance,
+            "afterAmount": after,
+            "actualDate": iso(moment),
+            "transactionType": {k: v for k, v in kind.items() if k != "_id"},
+            "student": {k: (student or {}).get(k) for k in ("_id", "uuid", "firstName", "lastName", "middleName",
+                                                           "fullName", "phoneNumber", "contractNumber")},
+            "cashier": {k: cashier[k] for k in ("_id", "firstName", "lastName", "phoneNumber")},
+            "branch": {"_id": BRANCH_ID, "name": "Urganch"},
+            "cashbox": cashbox,
+            "paymentMethod": method,
+            "parentTransactionId": None,
+            "toCashboxId": None,
+            "fromCashboxId": None,
+            "state": "completed",
+            "fromCashbox": {"_id": None, "name": None},
+            "employeeId": employee["_id"] if employee else None,
+            "employee": {k: (employee or {}).get(k) for k in ("_id", "firstName", "lastName", "phoneNumber")},
+            "teacherSalaryForLessonIds": [],
+            "createdAt": iso(moment),
+            "updatedAt": iso(moment),
+        })
+
+    return {
+        "quarters": quarters,
+        "employees": employees,
+        "classes": classes,
+        "students": students,
+        "details": details,
+        "journals": journals,
+        "transactions": transactions,
+        "lessons": sizes["lessons"],
+    }
+
+
+class Handler(MockHandler):
+    ROUTES = [
+        ("POST", r"/moderator-api/sign-in", "sign_in"),
+        ("GET", r"/moderator-api/class/pagin", "classes"),
+        ("GET", r"/moderator-api/students/pagin", "students"),
+        ("GET", r"/moderator-api/students/(\w+)", "student"),
+        ("GET", r"/moderator-api/employees/pagin", "employees"),
+        ("GET", r"/moderator-api/journal/(\w+)", "journal"),
+        ("GET", r"/moderator-api/quarter", "quarters"),
+        ("GET", r"/moderator-api/attendances/class", "attendances"),
+        ("GET", r"/moderator-api/cashbox/transaction/pagin", "transactions"),
+    ]
+
+    def ok(self, data):
+        self.send_json({"code": 0, "message": "success", "data": data})
+
+    def paged(self, items, **meta):
+        limit = self.int_param("limit", 10, MAX_PAGE_SIZE)
+        page = self.int_param("page", 1)
+        self.ok({"data": items[(page - 1) * limit:page * limit], "total": len(items), **meta})
+
+    def sign_in(self):
+        self.ok({YEAR_ID: {"token": "mock-eduschool-token"}})
+
+    def classes(self):
+        self.paged(self.data["classes"])
+
+    def students(self):
+        students = self.data["students"]
+        balances = [s["balance"] for s in students]
+        self.paged(students, totalBalance=sum(balances),
+                   totalDebted=sum(b for b in balances if b < 0), totalOwned=sum(b for b in balances if b > 0))
+
+    def student(self, student_id):
+        detail = self.data["details"].get(student_id)
+        if detail is None:
+            return self.send_json({"code": 404, "message": "Student not found"})
+        self.ok(detail)
+
+    def employees(self):
+        self.paged(self.data["employees"])
+
+    def journal(self, class_id):
+        self.ok([j for j in self.data["journals"] if j["classId"] == class_id])
+
+    def quarters(self):
+        self.send_json({"code": 0, "message": "success", "data": self.data["quarters"]}, etag=True)
+
+    def transactions(self):
+        self.paged(self.data["transactions"])
+
+    def attendances(self):
+        quarter_id, class_id, journal_id = (self.query.get(k) for k in ("quarterId", "classId", "subjectId"))
+        quarter = self.by_id("quarters").get(quarter_id)
+        if quarter is None:
+            return self.send_json({"code": 400, "message": "quarterId is required"})
+
+        # One block per lesson with the class's attendances; generated per
+        # request, the same ids always give the same answer
+        rng = random.Random(f"{quarter_id}:{class_id}:{journal_id}")
+        start = datetime.datetime.strptime(quarter["startsAt"][:10], "%Y-%m-%d")
+        students = [s["_id"] for s in self.data["students"] if s["class"]["_id"] == class_id]
+        lessons = []
+        for n in range(self.data["lessons"]):
+            day = start + datetime.timedelta(days=2 * n, hours=8 + n % 6)
+            lesson_id = f"{journal_id[:14]}{n:010x}"
+            attendances = []
+            for student_id in students:
+                mark = rng.choice([None, None, 3, 4, 5])
+                state = rng.choice(["present"] * 12 + ["absent", "late"])
+                attendances.append({
+                    "_id": f"{student_id[-12:]}{lesson_id[-12:]}",
+                    "classId": class_id,
+                    "lessonId": lesson_id,
+                    "studentId": student_id,
+                    "comment": "",
+                    "mark": mark,
+                    "state": state,
+                    "markHistory": [] if mark is None else [{
+                        "markSetByEmployeeId": oid(2, 0), "date": iso(day),
+                        "oldMark": None, "newMark": mark, "newComment": "",
+                    }],
+                    "lessonDate": iso(day),
+                    "attendanceDate": iso(day),
+                    "reason": "Kasal" if state == "absent" else None,
+                    "reasonId": oid(21, 0) if state == "absent" else None,
+                })
+            lessons.append({
+                "_id": lesson_id,
+                "state": "finished",
+                "isGroupLesson": False,
+                "homework": rng.choice(["", "Mashq 12", "Darslik 45-bet"]),
+                "date": iso(day),
+                "period": [{"_id": oid(9, n), "lessonHour": n % 6 + 1, "state": "finished"}],
+                "attendances": attendances,
+            })
+        self.ok({"data": lessons, "total": len(lessons)})
+
+
+if __name__ == "__main__":
+    import sys
+    serve(sys.modules[__name__])
@@ -0,0 +1,242 @@
+"""
+Local stand-in for the Facebook Graph API (https://graph.facebook.com/{version})
+as used for ad accounts: campaigns, campaign-level insights (daily or monthly
+time_increment, cursor paging with paging.next), async report runs and
+promoted pages.
+
+Campaigns and their daily numbers are derived from the ad account / campaign
+ids, so any act_... id works and answers are the same across runs. Async
+report runs complete after --size async_seconds=N seconds.
+
+    python -m mock_servers.graph --size campaigns_per_account=200
+    FACEBOOK_GRAPH_URL=http://127.0.0.1:8104 python main.py
+"""
+import base64
+import calendar
+import datetime
+import itertools
+import json
+import random
+import threading
+import time
+from urllib.parse import urlencode
+
+from mock_servers.common import MockHandler, serve
+
+NAME = "graph"
+URL_PATH = ""
+DEFAULT_PORT = 8104
+DEFAULT_RPS = 0
+DEFAULT_SIZES = {
+    "campaigns_per_account": 20,
+    "pages_per_account": 2,
+    "async_seconds": 3,  # time an async report run takes to complete
+}
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 500
+RANKINGS = ["ABOVE_AVERAGE", "AVERAGE", "BELOW_AVERAGE_35", "BELOW_AVERAGE_20", "UNKNOWN"]
+
+
+def build_dataset(sizes, rng):
+    return {
+        "campaigns": {},  # {ad_account_id: [campaign, ...]}, generated on first request unless given as a fixture
+        "report_runs": {},
+        "sizes": sizes,
+        "seed": rng.random(),
+    }
+
+
+def campaigns_of(data, account_id):
+    if account_id not in data["campaigns"]:
+        rng = random.Random(f"{data['seed']}:{account_id}")
+        today = datetime.date.today()
+        campaigns = []
+        for i in range(data["sizes"]["campaigns_per_account"]):
+            start = today - datetime.timedelta(days=rng.randint(0, 200))
+            campaigns.append({
+                "id": str(120_200_000_000_000_000 + rng.randrange(10 ** 12)),
+                "name": f"{rng.choice(['Qabul', 'Yozgi lager', 'Ochiq eshiklar kuni', 'Brend'])} {i + 1}",
+                "status": rng.choice(["ACTIVE", "PAUSED"]),
+                "effective_status": rng.choice(["ACTIVE", "PAUSED", "CAMPAIGN_PAUSED"]),
+                "start": str(start),
+                "stop": str(start + datetime.timedelta(days=rng.randint(3, 120))),
+            })
+        data["campaigns"][account_id] = campaigns
+    return data["campaigns"][account_id]
+
+
+def daily_row(account_id, campaign, day):
+    """One campaign-day of insights, numbers as strings like the Graph API sends them."""
+    rng = random.Random(f"{campaign['id']}:{day}")
+    impressions = rng.randint(200, 20000)
+    reach = int(impressions / rng.uniform(1.05, 1.8))
+    clicks = int(impressions * rng.uniform(0.002, 0.03))
+    spend = round(impressions / 1000 * rng.uniform(0.4, 2.5), 2)
+    leads = rng.randint(0, max(clicks // 15, 0))
+    actions = [{"action_type": "link_click", "value": str(clicks)},
+               {"action_type": "post_engagement", "value": str(clicks + rng.randint(0, 200))}]
+    if leads:
+        actions.append({"action_type": "lead", "value": str(leads)})
+    return {
+        "account_id": account_id.removeprefix("act_"),
+        "campaign_id": campaign["id"],
+        "campaign_name": campaign["name"],
+        "impressions": str(impressions),
+        "clicks": str(clicks),
+        "spend": f"{spend:.2f}",
+        "ctr": f"{clicks / impressions * 100:.6f}",
+        "cpc": f"{spend / clicks:.6f}" if clicks else None,
+        "cpm": f"{spend / impressions * 1000:.6f}",
+        "reach": str(reach),
+        "frequency": f"{impressions / reach:.6f}",
+        "conversions": [{"action_type": "lead", "value": str(leads)}] if leads else None,
+        "actions": actions,
+        "unique_actions": [{"action_type": "link_click", "value": str(int(clicks * 0.9))}],
+        "unique_clicks": str(int(clicks * 0.9)),
+        "quality_ranking": rng.choice(RANKINGS),
+        "engagement_rate_ranking": rng.choice(RANKINGS),
+        "conversion_rate_ranking": rng.choice(RANKINGS),
+        "date_start": str(day),
+        "date_stop": str(day),
+    }
+
+
+def sum_actions(lists):
+    totals = {}
+    for actions in lists:
+        for action in actions or []:
+            totals[action["action_type"]] = totals.get(action["action_type"], 0) + int(action["value"])
+    return [{"action_type": k, "value": str(v)} for k, v in totals.items()] or None
+
+
+def monthly_row(rows, since, until):
+    """Sum a campaign-month of daily rows; reach is deduplicated across days (lower than the sum)."""
+    first = rows[0]
+    impressions = sum(int(r["impressions"]) for r in rows)
+    clicks = sum(int(r["clicks"]) for r in rows)
+    spend = sum(float(r["spend"]) for r in rows)
+    daily_reach = [int(r["reach"]) for r in rows]
+    reach = int(max(daily_reach) + 0.35 * (sum(daily_reach) - max(daily_reach)))
+    day = datetime.date.fromisoformat(first["date_start"])
+    month_end = day.replace(day=calendar.monthrange(day.year, day.month)[1])
+    return {**first,
+            "impressions": str(impressions),
+            "clicks": str(clicks),
+            "spend": f"{spend:.2f}",
+            "ctr": f"{clicks / impressions * 100:.6f}",
+            "cpc": f"{spend / clicks:.6f}" if clicks else None,
+            "cpm": f"{spend / impressions * 1000:.6f}",
+            "reach": str(reach),
+            "frequency": f"{impressions / reach:.6f}",
+            "conversions": sum_actions(r["conversions"] for r in rows),
+            "actions": sum_actions(r["actions"] for r in rows),
+            "unique_actions": sum_actions(r["unique_actions"] for r in rows),
+            "unique_clicks": str(int(sum(int(r["unique_clicks"]) for r in rows) * 0.8)),
+            "date_start": str(max(day.replace(day=1), since)),
+            "date_stop": str(min(month_end, until))}
+
+
+def insights_rows(data, account_id, params):
+    time_range = json.loads(params.get("time_range") or "{}")
+    today = datetime.date.today()
+    since = datetime.date.fromisoformat(time_range.get("since", str(today - datetime.timedelta(days=30))))
+    until = datetime.date.fromisoformat(time_range.get("until", str(today)))
+    fields = [f for f in (params.get("fields") or "").split(",") if f]
+
+    rows = []
+    for campaign in campaigns_of(data, account_id):
+        start = max(since, datetime.date.fromisoformat(campaign["start"]))
+        stop = min(until, datetime.date.fromisoformat(campaign["stop"]))
+        days = [start + datetime.timedelta(days=n) for n in range((stop - start).days + 1)]
+        daily = [daily_row(account_id, campaign, day) for day in days]
+        if params.get("time_increment") == "monthly":
+            rows.extend(monthly_row(list(month), since, until)
+                        for _, month in itertools.groupby(daily, key=lambda r: r["date_start"][:7]))
+        else:
+            rows.extend(daily)
+
+    if fields:
+        keep = set(fields) | {"date_start", "date_stop"}
+        rows = [{k: v for k, v in row.items() if k in keep and v is not None} for row in rows]
+    return rows
+
+
+class Handler(MockHandler):
+    ROUTES = [
+        ("GET", r"/v[\d.]+/(act_\w+)/campaigns", "campaigns"),
+        ("GET", r"/v[\d.]+/(act_\w+)/insights", "insights"),
+        ("POST", r"/v[\d.]+/(act_\w+)/insights", "start_report"),
+        ("GET", r"/v[\d.]+/(act_\w+)/promote_pages", "promote_pages"),
+        ("GET", r"/v[\d.]+/(report_\w+)/insights", "report_insights"),
+        ("GET", r"/v[\d.]+/(report_\w+)", "report_status"),
+        ("GET", r"/v[\d.]+/(page_\w+)", "page"),
+    ]
+    _report_ids = itertools.count(1)
+    _report_lock = threading.Lock()
+
+    def paged(self, items):
+        """Cursor paging: data + paging.cursors, with paging.next while items remain."""
+        limit = self.int_param("limit", DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+        after = self.query.get("after")
+        offset = int(base64.urlsafe_b64decode(after).decode()) if after else 0
+        chunk = items[offset:offset + limit]
+
+        def cursor(position):
+            return base64.urlsafe_b64encode(str(position).encode()).decode()
+
+        payload = {"data": chunk}
+        if chunk:
+            payload["paging"] = {"cursors": {"before": cursor(offset), "after": cursor(offset + len(chunk))}}
+            if offset + len(chunk) < len(items):
+                query = {**self.query, "limit": limit, "after": cursor(offset + len(chunk))}
+                path = self.path.split("?")[0]
+                payload["paging"]["next"] = f"{self.base_url()}{path}?{urlencode(query)}"
+        self.send_json(payload)
+
+    def campaigns(self, account_id):
+        fields = set((self.query.get("fields") or "id,name").split(","))
+        self.paged([{k: v for k, v in c.items() if k in fields} for c in campaigns_of(self.data, account_id)])
+
+    def insights(self, account_id):
+        self.paged(insights_rows(self.data, account_id, self.query))
+
+    def start_report(self, account_id):
+        with self._report_lock:
+            report_run_id = f"report_{next(self._report_ids)}"
+        self.data["report_runs"][report_run_id] = {
+            "started": time.monotonic(),
+            "rows": insights_rows(self.data, account_id, {**self.query, **self.body}),
+        }
+        self.send_json({"report_run_id": report_run_id})
+
+    def report_status(self, report_run_id):
+        run = self.data["report_runs"].get(report_run_id)
+        if run is None:
+            return self.send_json({"error": {"message": "Unknown report run", "code": 100}}, status=400)
+        progress = (time.monotonic() - run["started"]) / max(self.data["sizes"]["async_seconds"], 1e-9)
+        self.send_json({
+            "id": report_run_id,
+            "async_status": "Job Completed" if progress >= 1 else ("Job Running" if progress > 0.2 else "Job Started"),
+            "async_percent_completion": min(int(progress * 100), 100),
+        })
+
+    def report_insights(self, report_run_id):
+        run = self.data["report_runs"].get(report_run_id)
+        if run is None:
+            return self.send_json({"error": {"message": "Unknown report run", "code": 100}}, status=400)
+        self.paged(run["rows"])
+
+    def promote_pages(self, account_id):
+        pages = [{"id": f"page_{account_id.removeprefix('act_')}_{i}", "name": f"Maktab sahifasi {i + 1}",
+                  "access_token": f"mock-page-token-{i}"} for i in range(self.data["sizes"]["pages_per_account"])]
+        self.paged(pages)
+
+    def page(self, page_id):
+        rng = random.Random(page_id)
+        fans = rng.randint(1000, 50000)
+        self.send_json({"id": page_id, "fan_count": fans, "followers_count": int(fans * 1.1)})
+
+
+if __name__ == "__main__":
+    import sys
+    serve(sys.modules[__name__])
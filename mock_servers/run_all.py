@@ -0,0 +1,55 @@
+"""
+Start the local stand-ins of all four upstream APIs (eduschool, amoCRM,
+Trello, Graph API) on consecutive ports and print the environment variables
+that point the pipeline at them.
+
+    python -m mock_servers.run_all --latency-ms 100 --error-rate 0.02 --size students=5000
+    # then, in another shell, with the printed variables exported:
+    python main.py
+
+Credentials files are still read (credentials/*.json); any values work
+against the stand-ins. Run the pipeline from a scratch copy of the project:
+tokens/, the caches and the watermarks in etl_metadata/ would otherwise mix
+stand-in and production state. --size applies to whichever server has that
+dataset.
+"""
+import argparse
+import threading
+
+from mock_servers import amocrm, eduschool, graph, trello
+from mock_servers.common import add_common_arguments, make_server
+
+MODULES = [
+    (eduschool, "EDUSCHOOL_API_URL"),
+    (amocrm, "AMOCRM_API_URL"),
+    (trello, "TRELLO_API_URL"),
+    (graph, "FACEBOOK_GRAPH_URL"),
+]
+
+
+def main():
+    parser = add_common_arguments(argparse.ArgumentParser(description="Local stand-ins of all upstream APIs."))
+    parser.add_argument("--base-port", type=int, default=eduschool.DEFAULT_PORT,
+                        help="port of the first server, the others follow")
+    args = parser.parse_args()
+
+    servers = []
+    for offset, (module, variable) in enumerate(MODULES):
+        server = make_server(module, args, args.base_port + offset)
+        host, port = server.server_address[:2]
+        threading.Thread(target=server.serve_forever, name=module.NAME, daemon=True).start()
+        servers.append(server)
+        print(f"export {variable}=http://{host}:{port}{module.URL_PATH}")
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Local stand-in for the Trello REST API (https://api.trello.com/1): the member's
+boards, board lists (with ETag) and board cards, with their checklists
+embedded when requested with checklists=all.
+
+    python -m mock_servers.trello --size cards=20000
+    TRELLO_API_URL=http://127.0.0.1:8103/1 python main.py
+"""
+import datetime
+import time
+
+from mock_servers.common import MockHandler, serve
+
+NAME = "trello"
+URL_PATH = "/1"
+DEFAULT_PORT = 8103
+DEFAULT_RPS = 10  # 100 requests per 10 s per token
+DEFAULT_SIZES = {
+    "boards": 8,
+    "lists_per_board": 6,
+    "cards": 2000,
+    "checklists_per_card": 1,
+    "items_per_checklist": 4,
+}
+LIST_NAMES = ["Backlog", "Rejada", "Jarayonda", "Tekshiruvda", "Bajarildi", "Arxiv"]
+LABELS = [{"id": f"lbl{i:021x}", "name": name, "color": color}
+          for i, (name, color) in enumerate([("Muhim", "red"), ("Marketing", "blue"), ("Ta'mirlash", "orange")])]
+
+
+def trello_id(created, n):
+    """Trello ids start with the creation time as 8 hex digits."""
+    return f"{created:08x}{n:016x}"
+
+
+def iso(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def build_dataset(sizes, rng):
+    now = int(time.time())
+    counter = iter(range(1, 1 << 60))
+
+    def new_id(age_days=365):
+        return trello_id(rng.randint(now - age_days * 86400, now), next(counter))
+
+    boards, lists, cards = [], {}, {}
+    for b in range(sizes["boards"]):
+        board_id = new_id(900)
+        last_activity = datetime.datetime.utcfromtimestamp(rng.randint(now - 30 * 86400, now))
+        boards.append({
+            "id": board_id,
+            "name": f"Board {b + 1}",
+            "desc": rng.choice(["", "Operatsion vazifalar", "Marketing rejasi"]),
+            "closed": rng.random() < 0.1,
+            "url": f"https://trello.com/b/{board_id[-8:]}/board-{b + 1}",
+            "dateLastActivity": iso(last_activity),
+            "dateLastView": iso(last_activity + datetime.timedelta(hours=rng.randint(0, 48))),
+        })
+        lists[board_id] = [{"id": new_id(), "idBoard": board_id, "name": LIST_NAMES[i % len(LIST_NAMES)],
+                            "closed": False, "pos": (i + 1) * 16384}
+                           for i in range(sizes["lists_per_board"])]
+        cards[board_id] = []
+
+    for c in range(sizes["cards"] if boards else 0):
+        board_id = boards[c % len(boards)]["id"]
+        card_id = new_id()
+        checklists = [{
+            "id": new_id(),
+            "idCard": card_id,
+            "idBoard": board_id,
+            "name": f"Checklist {k + 1}",
+            "checkItems": [{"id": new_id(), "name": f"Qadam {i + 1}", "state": rng.choice(["complete", "incomplete"]),
+                            "pos": (i + 1) * 16384} for i in range(sizes["items_per_checklist"])],
+        } for k in range(rng.randint(0, 2 * sizes["checklists_per_card"]))]
+        due = rng.choice([None, iso(datetime.datetime.utcfromtimestamp(now + rng.randint(-20, 40) * 86400))])
+        cards[board_id].append({
+            "id": card_id,
+            "idBoard": board_id,
+            "idList": rng.choice(lists[board_id])["id"] if lists[board_id] else None,
+            "name": f"Vazifa {c + 1}",
+            "desc": rng.choice(["", "Batafsil ma'lumot izohda"]),
+            "labels": rng.sample(LABELS, rng.randint(0, 2)),
+            "due": due,
+            "dueComplete": due is not None and rng.random() < 0.5,
+            "url": f"https://trello.com/c/{card_id[-8:]}/{c + 1}",
+            "closed": rng.random() < 0.05,
+            "checklists": checklists,
+        })
+
+    return {"boards": boards, "lists": lists, "cards": cards}
+
+
+class Handler(MockHandler):
+    ROUTES = [
+        ("GET", r"/1/members/me/boards", "boards"),
+        ("GET", r"/1/boards/(\w+)/lists", "lists"),
+        ("GET", r"/1/boards/(\w+)/cards", "cards"),
+    ]
+
+    def boards(self):
+        self.send_json(self.data["boards"])
+
+    def lists(self, board_id):
+        if board_id not in self.data["lists"]:
+            return self.send_json({"message": "invalid id"}, status=400)
+        self.send_json(self.data["lists"][board_id], etag=True)
+
+    def cards(self, board_id):
+        if board_id not in self.data["cards"]:
+            return self.send_json({"message": "invalid id"}, status=400)
+        with_checklists = self.query.get("checklists") == "all"
+        self.send_json([card if with_checklists else {k: v for k, v in card.items() if k != "checklists"}
+                        for card in self.data["cards"][board_id]])
+
+
+if __name__ == "__main__":
+    import sys
+    serve(sys.modules[__name__])
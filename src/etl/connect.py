@@ -3,6 +3,10 @@ import json
 import ast
 import os
 import requests
+from urllib.parse import urlsplit
+from src.utils.utils_http import *
+from src.utils.utils_stream import *
+from configs.http_config import EDUSCHOOL_API_URL, AMOCRM_API_URL, EDUSCHOOL_PAGE_SIZES, HTTP_CONCURRENCY
 import pandas as pd
 from amocrm.v2 import tokens
 from datetime import datetime, timedelta
@@ -17,6 +21,11 @@ def amocrm_headers(access_token):
     }
 
 
+def amocrm_base_url(domain):
+    """Account URL of amoCRM: https://{domain}, or AMOCRM_API_URL when set (local stand-in server)."""
+    return AMOCRM_API_URL.rstrip("/") or f"https://{domain}"
+
+
 def amocrm_initial_token(auth_code):
     # Load credentials from JSON file
     with open("credentials/amocrm.json", "r") as f:
@@ -25,7 +34,7 @@ def amocrm_initial_token(auth_code):
     AMO_DOMAIN = creds["base_domain"]
 
     """Exchange authorization code for initial access and refresh tokens (run this once)"""
-    url = f'https://{AMO_DOMAIN}/oauth2/access_token'
+    url = f'{amocrm_base_url(AMO_DOMAIN)}/oauth2/access_token'
     data = {
         "client_id": creds["client_id"],
         "client_secret": creds["client_secret"],
@@ -33,7 +42,7 @@ def amocrm_initial_token(auth_code):
         "code": auth_code,
         "redirect_uri": creds["redirect_uri"]
     }
-    response = requests.post(url, json=data)
+    response = http_post(url, json=data)
     try:
         response.raise_for_status()
     except requests.HTTPError:
@@ -65,12 +74,12 @@ def amocrm_refresh_token():
         REFRESH_TOKEN = creds["refresh_token"]
         REDIRECT_URI = creds["redirect_uri"]
 
-        BASE_URL = f'https://{AMO_DOMAIN}/api/v4'
+        BASE_URL = f'{amocrm_base_url(AMO_DOMAIN)}/api/v4'
 
         # Access token refresh function
         def amocrm_get_access_token():
             """Refresh access token via OAuth2"""
-            url = f'https://{AMO_DOMAIN}/oauth2/access_token'
+            url = f'{amocrm_base_url(AMO_DOMAIN)}/oauth2/access_token'
 
             data = {
                 "client_id": CLIENT_ID,
@@ -80,7 +89,7 @@ def amocrm_refresh_token():
                 "redirect_uri": REDIRECT_URI
             }
 
-            response = requests.post(url, json=data)
+            response = http_post(url, json=data)
             response.raise_for_status()
             token_data = response.json()
 
@@ -132,7 +141,7 @@ def eduschool_token():
             password = credentials['password']
 
         # API endpoint
-        url = 'https://backend.eduschool.uz/moderator-api/sign-in'
+        url = f'{EDUSCHOOL_API_URL}/sign-in'
 
         # Payload
         payload = {
@@ -163,7 +172,7 @@ def eduschool_token():
         }
 
         # Send POST request
-        response = requests.post(url, json=payload, headers=headers)
+        response = http_post(url, json=payload, headers=headers)
         response.raise_for_status()  # Raise error if not 200
 
         # Extract token from response (nested under the first key in 'data')
@@ -195,7 +204,7 @@ def eduschool_headers(token, year, branch):
             "authorization": f"Bearer {token}",
             "branch": f"{branch}",
             "connection": "keep-alive",
-            "host": "backend.eduschool.uz",
+            "host": urlsplit(EDUSCHOOL_API_URL).netloc,
             "language": "uz",
             "organization": "test",
             "origin": "https://omonschool.eduschool.uz",
@@ -211,6 +220,127 @@ def eduschool_headers(token, year, branch):
 
     return headers
 
+
+# Page size accepted by each eduschool endpoint, found on first use
+_eduschool_page_sizes = {}
+
+
+def _eduschool_page(url, headers, params, page, limit):
+    # Items are decoded while the body streams in, the raw page is never held whole
+    with http_get(url, headers=headers, params={**params, "page": page, "limit": limit}, stream=True) as response:
+        response.raise_for_status()
+        meta = {}
+        items = list(iter_json_items(response, "data.data", meta))
+    if meta.get("code") != 0:
+        raise ValueError(f"API error on {url} page {page}: {meta.get('message', meta.get('code'))}")
+    data = {k.removeprefix("data."): v for k, v in meta.items() if k.startswith("data.")}
+    data["data"] = items
+    return data
+
+
+def _eduschool_first_page(url, headers, params):
+    """Fetch page 1 with the largest accepted page size; returns (page data, page size)."""
+    sizes = [_eduschool_page_sizes[url]] if url in _eduschool_page_sizes else list(EDUSCHOOL_PAGE_SIZES)
+
+    for i, limit in enumerate(sizes):
+        try:
+            first = _eduschool_page(url, headers, params, 1, limit)
+            break
+        except (requests.HTTPError, ValueError) as e:
+            if i == len(sizes) - 1:
+                raise
+            logger.info(f"{url}: page size {limit} rejected ({e}), trying {sizes[i + 1]}.")
+
+    if len(first["data"]) < min(limit, first["total"]):
+        # The endpoint capped the page size without an error
+        limit = max(len(first["data"]), 1)
+    _eduschool_page_sizes[url] = limit
+    return first, limit
+
+
+def eduschool_fetch_all_pages(url, headers, params=None, id_field="_id", max_workers=HTTP_CONCURRENCY, builder=None):
+    """
+    Fetch every item of a paginated eduschool list endpoint ({"data": {"data": [...], "total": n}}).
+
+    Page 1 is requested with the largest size in EDUSCHOOL_PAGE_SIZES the
+    endpoint accepts (a size that errors is skipped, a silently capped one is
+    lowered to what came back); the remaining pages are then fetched
+    concurrently and merged in page order. Items repeated across pages are
+    dropped by id_field and a shortfall against total is logged.
+
+    With builder (a ColumnBuilder), each page goes into it as soon as it is
+    merged and the builder is returned instead of the item list, so only
+    the pages in flight are ever held as dicts.
+
+    Returns (items, meta): the items and the page-1 payload without its item list
+    (e.g. totals such as totalBalance).
+    """
+    params = dict(params or {})
+    first, limit = _eduschool_first_page(url, headers, params)
+    total = first["total"]
+    meta = {k: v for k, v in first.items() if k != "data"}
+
+    unique = [] if builder is None else builder
+    seen = set()
+    received = 0
+
+    # Rows inserted or deleted while paging shift page boundaries
+    def merge(task, data):
+        nonlocal received
+        if isinstance(data, Exception):
+            raise data
+        received += len(data["data"])
+        for item in data["data"]:
+            key = item.get(id_field) if isinstance(item, dict) else None
+            if key is not None and key in seen:
+                continue
+            seen.add(key)
+            unique.append(item)
+
+    merge(None, first)
+    del first
+    n_pages = -(-total // limit)
+    if n_pages > 1:
+        tasks = [(url, headers, params, page, limit) for page in range(2, n_pages + 1)]
+        label = url.rsplit("/moderator-api/", 1)[-1]
+        # crawl hands pages over in page order
+        crawl(_eduschool_page, tasks, max_workers=max_workers, label=label, on_result=merge)
+
+    if len(unique) < received:
+        logger.warning(f"{url}: dropped {received - len(unique)} duplicate items across pages.")
+    if len(unique) < total:
+        logger.warning(f"{url}: got {len(unique)} of {total} items, {total - len(unique)} missing.")
+
+    logger.info(f"{url}: {len(unique)} items in {n_pages} pages of {limit}.")
+    return unique, meta
+
+
+def eduschool_fetch_pages_until(url, headers, stop, params=None):
+    """
+    Page a newest-first eduschool list endpoint one page at a time and stop
+    after the first page holding an item for which stop(item) is true, or at
+    the first empty page (data.total is not trusted, it moves while paging).
+
+    Returns (items, meta) like eduschool_fetch_all_pages; items include the
+    whole last page, callers filter out what they already have.
+    """
+    params = dict(params or {})
+    data, limit = _eduschool_first_page(url, headers, params)
+    meta = {k: v for k, v in data.items() if k != "data"}
+
+    items, page = [], 1
+    while True:
+        if page > 1:
+            data = _eduschool_page(url, headers, params, page, limit)
+        items.extend(data["data"])
+        if not data["data"] or any(stop(item) for item in data["data"]):
+            break
+        page += 1
+
+    logger.info(f"{url}: {len(items)} items in {page} pages of {limit} (of {data['total']} total).")
+    return items, meta
+
+
 def marketing_facebook_token():
     try:
         # Load credentials from JSON file
@@ -1,8 +1,13 @@
 from src.utils.utils_dataframe import *
 from src.etl.connect import *
-import time
+import os
+import json
 import ast
 import requests
+from src.utils.utils_http import *
+from src.utils.utils_cache import *
+from src.utils.utils_stream import *
+from configs.http_config import EDUSCHOOL_API_URL, HTTP_CONCURRENCY
 import brotli
 import pandas as pd
 import datetime
@@ -12,7 +17,8 @@ logger = get_logger("etl_log")
 
 
 
-def eduschool_fetch_attendance_and_marks(token, classes_df, quarters_df, journals_df, year="6841869b8eb7901bc71c7807", branch="68417f7edbbdfc73ada6ef01"):
+def eduschool_fetch_attendance_and_marks(token, classes_df, quarters_df, journals_df, year="6841869b8eb7901bc71c7807", branch="68417f7edbbdfc73ada6ef01",
+                                         max_workers=HTTP_CONCURRENCY):
     class_to_journals = {class_id: group['journal_id'].tolist() for class_id, group in journals_df.groupby('class_id')}
     class_ids = classes_df["id"].tolist()
 
@@ -43,7 +49,7 @@ def eduschool_fetch_attendance_and_marks(token, classes_df, quarters_df, journal
 
     # Function to fetch attendance for a class_id, subject_id (journal_id), quarter_id
     def fetch_attendance(quarter_id, class_id, subject_id, timeout_sec=30):
-        base_url = 'https://backend.eduschool.uz/moderator-api/attendances/class'
+        base_url = f'{EDUSCHOOL_API_URL}/attendances/class'
         params_local = {
             'quarterId': quarter_id,
             'classId': class_id,
@@ -51,16 +57,21 @@ def eduschool_fetch_attendance_and_marks(token, classes_df, quarters_df, journal
             'childId': subject_id
         }
         try:
-            response = requests.get(base_url, params=params_local, headers=headers, timeout=timeout_sec)
-            response.raise_for_status()
-            data = response.json()
-
-            if data['code'] != 0:
+            # Closed on every path, also when the status check raises
+            with http_get(base_url, params=params_local, headers=headers, timeout=timeout_sec, stream=True) as response:
+                response.raise_for_status()
+
+                # Decode lesson by lesson while the body streams in
+                meta = {}
+                attendance_context, attendances = [], []
+                for block in iter_json_items(response, 'data.data', meta):
+                    attendances.extend(block.pop('attendances', None) or [])
+                    attendance_context.append(block)
+
+            if meta.get('code') != 0:
                 raise ValueError(
-                    f"API error for class {class_id}, subject {subject_id}, quarter {quarter_id}: {data['message']}")
+                    f"API error for class {class_id}, subject {subject_id}, quarter {quarter_id}: {meta.get('message')}")
 
-            attendance_context = data['data']['data']
-            attendances = [att for block in data['data']['data'] for att in block.get('attendances', [])]
             return True, attendance_context, attendances  # Success flag
         except requests.exceptions.Timeout:
             logger.error(
@@ -70,56 +81,61 @@ def eduschool_fetch_attendance_and_marks(token, classes_df, quarters_df, journal
             logger.error(f"Unexpected error for class {class_id}, subject {subject_id}, quarter {quarter_id}: {e}")
             return False, [], []  # Failure flag, no raise to allow queueing
 
-    all_attendance_context = []
-    all_attendances = []
+    # Rows go straight into column lists, one record dict at a time
+    all_attendance_context = ColumnBuilder()
+    all_attendances = ColumnBuilder()
     retry_queue = []  # List to hold failed (quarter_id, class_id, subject_id) tuples
 
-    # Main loop: Initial fetches
+    def collect(task, result):
+        success, attendance_context, attendances = result
+        quarter_id, class_id, subject_id = task
+        # Add identifiers and extend
+        for att in attendance_context:
+            att['class_id'] = class_id
+            att['subject_id'] = subject_id
+            att['quarter_id'] = quarter_id
+        all_attendance_context.extend(attendance_context)
+        all_attendances.extend(attendances)
+
+    # Initial fetches: every quarter x class x journal, crawled concurrently
+    tasks = []
     for quarter_id in quarter_ids:
-        # if len(all_attendance_context) > 100: break
         for class_id in class_ids:
-            # if len(all_attendance_context) > 100: break
             relevant_journal_ids = class_to_journals.get(class_id, [])
             if not relevant_journal_ids:
                 logger.info(f"Skipping class {class_id} as it has no associated journals.")
                 continue
-            for subject_id in relevant_journal_ids:
-                # if len(all_attendance_context) > 100: break
-                success, attendance_context, attendances = fetch_attendance(quarter_id, class_id, subject_id)
-                if success:
-                    # Add identifiers and extend
-                    for att in attendance_context:
-                        att['class_id'] = class_id
-                        att['subject_id'] = subject_id
-                        att['quarter_id'] = quarter_id
-                    all_attendance_context.extend(attendance_context)
-                    all_attendances.extend(attendances)
-                else:
-                    retry_queue.append((quarter_id, class_id, subject_id))
-
-    # Second retry queue: Attempt failed combos again (with optional increased timeout)
+            tasks.extend((quarter_id, class_id, subject_id) for subject_id in relevant_journal_ids)
+
+    logger.info(f"Fetching attendance for {len(tasks)} quarter/class/journal combinations with {max_workers} workers...")
+
+    def collect_or_queue(task, result):
+        if isinstance(result, tuple) and result[0]:
+            collect(task, result)
+        else:
+            retry_queue.append(task)
+
+    # Results are handed over in task order, so the frames match a sequential crawl
+    crawl(fetch_attendance, tasks, max_workers=max_workers, label="attendances", on_result=collect_or_queue)
+
+    # Second retry queue: Attempt failed combos again (with increased timeout)
     if retry_queue:
         logger.info(f"Retrying {len(retry_queue)} failed fetches...")
-        for quarter_id, class_id, subject_id in retry_queue:
-            logger.info(
-                f"Retry starting for quarter {quarter_id}, class {class_id}, subject {subject_id} at {time.time()}")
-            success, attendance_context, attendances = fetch_attendance(quarter_id, class_id, subject_id,
-                                                                        timeout_sec=60)  # Increased timeout for retry
-            if success:
-                # Add identifiers and extend
-                for att in attendance_context:
-                    att['class_id'] = class_id
-                    att['subject_id'] = subject_id
-                    att['quarter_id'] = quarter_id
-                all_attendance_context.extend(attendance_context)
-                all_attendances.extend(attendances)
+        retry_tasks = [(quarter_id, class_id, subject_id, 60) for quarter_id, class_id, subject_id in retry_queue]
+
+        def collect_retry(task, result):
+            quarter_id, class_id, subject_id, _ = task
+            if isinstance(result, tuple) and result[0]:
+                collect((quarter_id, class_id, subject_id), result)
             else:
                 logger.warning(f"Retry failed again for class {class_id}, subject {subject_id}, quarter {quarter_id}")
 
+        crawl(fetch_attendance, retry_tasks, max_workers=max_workers, label="attendances retry",
+              on_result=collect_retry)
+
     # Create DataFrames
-    df_attendance_context = pd.DataFrame(all_attendance_context)
-    df_attendances = pd.DataFrame(all_attendances)
-    df_attendance_context.drop('attendances', axis=1, inplace=True)
+    df_attendance_context = all_attendance_context.to_frame()
+    df_attendances = all_attendances.to_frame()
 
     # Flatten 'period' — always keep indices 0–8
     def flatten_period(cell):
@@ -183,12 +199,12 @@ def eduschool_fetch_attendance_and_marks(token, classes_df, quarters_df, journal
     df_attendance_context.fillna(0, inplace=True)
     df_attendance_context = clean_string_columns(df_attendance_context)
     df_attendance_context = normalize_columns(df_attendance_context)
-    df_attendance_context = add_timestamp(df_attendance_context)
+    df_attendance_context = add_timestamp(df_attendance_context, dataset="education_attendance_context")
 
     df_attendances.fillna(0, inplace=True)
     df_attendances = clean_string_columns(df_attendances)
     df_attendances = normalize_columns(df_attendances)
-    df_attendances = add_timestamp(df_attendances)
+    df_attendances = add_timestamp(df_attendances, dataset="education_attendances")
 
     with open("eduschool_cache/branches.json", "r") as f:
         filials  = json.load(f)
@@ -210,45 +226,16 @@ def eduschool_fetch_attendance_and_marks(token, classes_df, quarters_df, journal
 
 def eduschool_fetch_classes(token, year="6841869b8eb7901bc71c7807", branch="68417f7edbbdfc73ada6ef01"):
     # API endpoint and base params
-    base_url = 'https://backend.eduschool.uz/moderator-api/class/pagin'
+    base_url = f'{EDUSCHOOL_API_URL}/class/pagin'
     params = {
-        'limit': 20,  # As per the example; can adjust if needed
         'headTeachersIds': '[]',
         'search': ''
     }
 
     headers = eduschool_headers(token, branch=branch, year=year)
 
-    # Function to fetch all pages with pagination
-    def fetch_all_classes():
-        all_classes = []
-        page = 1
-        total = None
-
-        while True:
-            params['page'] = page
-            response = requests.get(base_url, params=params, headers=headers)
-            response.raise_for_status()  # Raise error if not 200
-            data = response.json()
-
-            if data['code'] != 0:
-                raise ValueError(f"API error: {data['message']}")
-
-            classes = data['data']['data']
-            all_classes.extend(classes)
-
-            if total is None:
-                total = data['data']['total']
-
-            if len(all_classes) >= total:
-                break
-
-            page += 1
-
-        return all_classes
-
     # Fetch data
-    classes_data = fetch_all_classes()
+    classes_data, _ = eduschool_fetch_all_pages(base_url, headers, params)
 
     # Create initial DataFrame
     classes_df = pd.DataFrame(classes_data)
@@ -283,7 +270,7 @@ def eduschool_fetch_classes(token, year="6841869b8eb7901bc71c7807", branch="6841
 
     classes_df = clean_string_columns(classes_df)
     classes_df = normalize_columns(classes_df)
-    classes_df = add_timestamp(classes_df)
+    classes_df = add_timestamp(classes_df, dataset="education_classes")
 
     classes_df[['uuid', 'grade']] = classes_df[['uuid', 'grade']].apply(lambda s: fill_and_numeric(s, dtype="int"))
     classes_df[['students_count', 'max_students_count']] = classes_df[['students_count', 'max_students_count']].apply(
@@ -300,7 +287,7 @@ def eduschool_fetch_classes(token, year="6841869b8eb7901bc71c7807", branch="6841
 
 def eduschool_fetch_employees(token, year="6841869b8eb7901bc71c7807", branch="68417f7edbbdfc73ada6ef01"):
     # API endpoint and base params
-    base_url = 'https://backend.eduschool.uz/moderator-api/employees/pagin'
+    base_url = f'{EDUSCHOOL_API_URL}/employees/pagin'
     params = {
         'limit': 200,  # As per the example; can adjust if needed
     }
@@ -308,7 +295,7 @@ def eduschool_fetch_employees(token, year="6841869b8eb7901bc71c7807", branch="68
 
     # Function to fetch all pages with pagination
     def fetch_all_employees():
-        response = requests.get(base_url, params=params, headers=headers)
+        response = http_get(base_url, params=params, headers=headers)
         response.raise_for_status()  # Raise error if not 200
         if response.headers.get("Content-Encoding") == "br":
             try:
@@ -352,7 +339,7 @@ def eduschool_fetch_employees(token, year="6841869b8eb7901bc71c7807", branch="68
     # Clean and enrich dfs
     df = clean_string_columns(df)
     df = normalize_columns(df)
-    df = add_timestamp(df)
+    df = add_timestamp(df, dataset="education_employees")
     df.fillna(0, inplace=True)
 
     with open("eduschool_cache/branches.json", "r") as f:
@@ -375,13 +362,13 @@ def eduschool_fetch_journals(token , classes_df, year="6841869b8eb7901bc71c7807"
 
     # Function to fetch journal for a single class ID (no pagination, single request)
     def fetch_journal_for_class(class_id):
-        base_url = f'https://backend.eduschool.uz/moderator-api/journal/{class_id}'
+        base_url = f'{EDUSCHOOL_API_URL}/journal/{class_id}'
         params_local = {
             'search': '',
             'limit': 20,
             'page': 1
         }
-        response = requests.get(base_url, params=params_local, headers=headers)
+        response = http_get(base_url, params=params_local, headers=headers)
         response.raise_for_status()
         data = response.json()
 
@@ -396,39 +383,27 @@ def eduschool_fetch_journals(token , classes_df, year="6841869b8eb7901bc71c7807"
 
         return journals
 
-    # Loop over class IDs, fetch journals, and collect data
+    # Fetch the journals of all classes concurrently (crawl logs failed classes)
     all_data = []
-    for class_id in class_ids:
-        try:
-            journals = fetch_journal_for_class(class_id)
+    for journals in crawl(fetch_journal_for_class, [(class_id,) for class_id in class_ids], label="journals"):
+        if not isinstance(journals, Exception):
             all_data.extend(journals)
-        except Exception as e:
-            print(f"Error for class {class_id}: {e}")
-
-    # Create DataFrame
-    df = pd.DataFrame(all_data)
 
-    # Extract and flatten only specified columns
-    extracted_data = []
-
-    for _, row in df.iterrows():
-        entry = {
-            'class_id': row.get('classId'),
-            'subject_id': row['subject']['_id'] if 'subject' in row else None,
-            'subject_name': row['subject']['name'] if 'subject' in row else None,
-            'journal_id': row.get('_id')
-        }
+    # Extract and flatten only specified columns, straight from the decoded journals
+    subjects = [journal.get('subject') if isinstance(journal.get('subject'), dict) else {} for journal in all_data]
+    extracted_data = {
+        'class_id': [journal.get('classId') for journal in all_data],
+        'subject_id': [subject.get('_id') for subject in subjects],
+        'subject_name': [subject.get('name') for subject in subjects],
+        'journal_id': [journal.get('_id') for journal in all_data],
+    }
 
-        # Flatten teacher IDs (always create columns 0–5)
-        for i in range(6):  # ✅ fixed indices 0–5
-            col_name = f'teacher_{i}_id'
-            if 'teacher' in row and isinstance(row['teacher'], list) and i < len(row['teacher']):
-                teacher_item = row['teacher'][i]
-                entry[col_name] = teacher_item.get('_id') if isinstance(teacher_item, dict) else None
-            else:
-                entry[col_name] = None  # ensure column exists even if no data
-        # Append result
-        extracted_data.append(entry)
+    # Flatten teacher IDs (always create columns 0–5)
+    teachers = [journal.get('teacher') if isinstance(journal.get('teacher'), list) else [] for journal in all_data]
+    for i in range(6):  # ✅ fixed indices 0–5
+        extracted_data[f'teacher_{i}_id'] = [
+            t[i].get('_id') if i < len(t) and isinstance(t[i], dict) else None for t in teachers
+        ]
 
     # Create final DataFrame with only specified columns
     df_final = pd.DataFrame(extracted_data)
@@ -437,7 +412,7 @@ def eduschool_fetch_journals(token , classes_df, year="6841869b8eb7901bc71c7807"
     df_final.fillna(0, inplace=True)
     df_final = clean_string_columns(df_final)
     df_final = normalize_columns(df_final)
-    df_final = add_timestamp(df_final)
+    df_final = add_timestamp(df_final, dataset="education_journals")
 
     with open("eduschool_cache/branches.json", "r") as f:
         filials  = json.load(f)
@@ -453,20 +428,21 @@ def eduschool_fetch_journals(token , classes_df, year="6841869b8eb7901bc71c7807"
 
 def eduschool_fetch_quarters(token, year="6841869b8eb7901bc71c7807", branch="68417f7edbbdfc73ada6ef01"):
     # API endpoint and base params
-    base_url = 'https://backend.eduschool.uz/moderator-api/quarter'
+    base_url = f'{EDUSCHOOL_API_URL}/quarter'
     params = {
         'search': '',
         'limit': 200,  # As per the example; sufficient for small totals
     }
     headers = eduschool_headers(token, branch=branch, year=year)
 
-    # fetch all quarters
+    # fetch all quarters (cached, they change a few times a year)
     params['page'] = 1
-    response = requests.get(base_url, params=params, headers=headers)
+    response = http_get(base_url, params=params, headers=headers, cache="eduschool_quarters")
     response.raise_for_status()  # Raise error if not 200
     data = response.json()
 
     if data['code'] != 0:
+        drop_cached(response)
         raise ValueError(f"API error: {data['message']}")
 
     quarters = data['data']
@@ -476,7 +452,7 @@ def eduschool_fetch_quarters(token, year="6841869b8eb7901bc71c7807", branch="684
     df.fillna(0, inplace=True)
     df = clean_string_columns(df)
     df = normalize_columns(df)
-    df = add_timestamp(df)
+    df = add_timestamp(df, dataset="education_quarters")
 
     with open("eduschool_cache/branches.json", "r") as f:
         filials  = json.load(f)
@@ -494,93 +470,114 @@ def eduschool_fetch_quarters(token, year="6841869b8eb7901bc71c7807", branch="684
 
 def eduschool_fetch_students(token, year="6841869b8eb7901bc71c7807", branch="68417f7edbbdfc73ada6ef01"):
     # API endpoint and base params (no filters for full list)
-    base_url = 'https://backend.eduschool.uz/moderator-api/students/pagin'
+    base_url = f'{EDUSCHOOL_API_URL}/students/pagin'
     params = {
-        'limit': 20,  # As per the example; can adjust for efficiency (e.g., 200)
         'grade': '[]',
         'search': ''
     }
     headers = eduschool_headers(token, branch=branch, year=year)
 
-    all_students = []
-    aggregates = {}  # To store totalBalance, totalDebted, totalOwned (from first response)
-    page = 1
-    total = None
-
-    while True:
-        params['page'] = page
-        response = requests.get(base_url, params=params, headers=headers)
-        response.raise_for_status()  # Raise error if not 200
-        data = response.json()
-
-        if data['code'] != 0:
-            raise ValueError(f"API error: {data['message']}")
-
-        students = data['data']['data']
-        all_students.extend(students)
-
-        if total is None:
-            total = data['data']['total']
-            aggregates = {
-                'totalBalance': data['data'].get('totalBalance', 0),
-                'totalDebted': data['data'].get('totalDebted', 0),
-                'totalOwned': data['data'].get('totalOwned', 0)
-            }
-
-        if len(all_students) >= total:
-            break
-
-        page += 1
+    all_students, meta = eduschool_fetch_all_pages(base_url, headers, params, builder=ColumnBuilder())
+    aggregates = {  # totalBalance, totalDebted, totalOwned (from first response)
+        'totalBalance': meta.get('totalBalance', 0),
+        'totalDebted': meta.get('totalDebted', 0),
+        'totalOwned': meta.get('totalOwned', 0)
+    }
 
     # Create initial DataFrame for students
-    df = pd.DataFrame(all_students)
+    df = all_students.to_frame()
 
     # New Base URL
-    base_url_2 = 'https://backend.eduschool.uz/moderator-api/students/'
+    base_url_2 = f'{EDUSCHOOL_API_URL}/students/'
+
+    # Detail payloads cached by student id, one file per branch; reused while the
+    # student's updatedAt is unchanged
+    cache_name, cache_dir = f"student_details_{branch}", "eduschool_cache"
+    cache_path = os.path.join(cache_dir, f"{cache_name}.json")
+    details_cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            try:
+                details_cache = json.load(f)
+            except json.JSONDecodeError:
+                details_cache = {}
+
+    def fetch_details(student_id):
+        response = http_get(base_url_2 + student_id, headers=headers)
+        if response.status_code == 200:
+            json_data = response.json()
+            if json_data['code'] == 0:
+                return json_data['data']
+        return None
+
+    updated_at = df['updatedAt'] if 'updatedAt' in df.columns else pd.Series(None, index=df.index)
+    list_updated_at = dict(zip(df['_id'], updated_at))
+    details = {}
+    to_fetch = []
+    for student_id, student_updated_at in list_updated_at.items():
+        cached = details_cache.get(student_id)
+        if cached is not None and pd.notna(student_updated_at) and cached.get('updatedAt') == student_updated_at:
+            details[student_id] = cached
+        else:
+            to_fetch.append((student_id,))
+    logger.info(f"Student details: {len(details)} cached, {len(to_fetch)} to fetch.")
+
+    fresh = {}
+    for (student_id,), student_data in zip(to_fetch, crawl(fetch_details, to_fetch, label="student details")):
+        if isinstance(student_data, dict):
+            # Keep only what is read below, stamped with the list's updatedAt
+            student_updated_at = list_updated_at[student_id]
+            details[student_id] = fresh[student_id] = {
+                'updatedAt': student_updated_at if pd.notna(student_updated_at) else None,
+                '_id': student_data['_id'],
+                'kommoLeadId': student_data.get('kommoLeadId', None),
+                'locations': student_data.get('locations', []),
+            }
+    # Only students still listed stay cached, so leavers do not pile up in the file
+    evicted = len(details_cache.keys() - details.keys())
+    if fresh or evicted:
+        write_json_cache(cache_name, details, cache_dir)
+        logger.info(f"Student details cache: {len(fresh)} fetched, {evicted} no longer listed dropped.")
 
     # List to hold extracted data
     data_list = []
 
     for student_id in df['_id']:
-        url = base_url_2 + student_id
-        response = requests.get(url, headers=headers)
-
-        if response.status_code == 200:
-            json_data = response.json()
-            if json_data['code'] == 0:
-                student_data = json_data['data']
-
-                lead_id = student_data['_id']
-                kommo_lead_id = student_data.get('kommoLeadId', None)
-
-                # Find pickup location
-                pickup_lat = None
-                pickup_lng = None
-                pickup_time = None
-                home_lat = None
-                home_lng = None
-
-                for loc in student_data.get('locations', []):
-                    if loc['type'] == 'pickupLocation':
-                        pickup_lat = loc['lat']
-                        pickup_lng = loc['lng']
-                        pickup_time = loc.get('pickupTime', '')  # Assuming it might be present
-                    elif loc['type'] == 'homeLocation':
-                        # Take the last homeLocation as in the example
-                        home_lat = loc['lat']
-                        home_lng = loc['lng']
-
-                # If multiple home locations, the above will take the last one
-
-                data_list.append({
-                    'id': lead_id,
-                    'amocrm_id': kommo_lead_id,
-                    'pickup_location_latitude': pickup_lat,
-                    'pickup_location_longitude': pickup_lng,
-                    'pickup_time': pickup_time,
-                    'home_location_latitude': home_lat,
-                    'home_location_longitude': home_lng
-                })
+        student_data = details.get(student_id)
+        if student_data is None:
+            continue
+
+        lead_id = student_data['_id']
+        kommo_lead_id = student_data.get('kommoLeadId', None)
+
+        # Find pickup location
+        pickup_lat = None
+        pickup_lng = None
+        pickup_time = None
+        home_lat = None
+        home_lng = None
+
+        for loc in student_data.get('locations', []):
+            if loc['type'] == 'pickupLocation':
+                pickup_lat = loc['lat']
+                pickup_lng = loc['lng']
+                pickup_time = loc.get('pickupTime', '')  # Assuming it might be present
+            elif loc['type'] == 'homeLocation':
+                # Take the last homeLocation as in the example
+                home_lat = loc['lat']
+                home_lng = loc['lng']
+
+        # If multiple home locations, the above will take the last one
+
+        data_list.append({
+            'id': lead_id,
+            'amocrm_id': kommo_lead_id,
+            'pickup_location_latitude': pickup_lat,
+            'pickup_location_longitude': pickup_lng,
+            'pickup_time': pickup_time,
+            'home_location_latitude': home_lat,
+            'home_location_longitude': home_lng
+        })
 
     # Create DataFrame
     locations_df = pd.DataFrame(data_list)
@@ -670,9 +667,9 @@ def eduschool_fetch_students(token, year="6841869b8eb7901bc71c7807", branch="684
     # Merge with main pandas dataframe
     df = pd.merge(df, locations_df, on='id', how='left')
 
-    df = add_timestamp(df)
+    df = add_timestamp(df, dataset="education_students")
     agg_df = normalize_columns(agg_df)
-    agg_df = add_timestamp(agg_df)
+    agg_df = add_timestamp(agg_df, dataset="education_students_aggregated")
     agg_df['id'] = secrets.token_hex(12)
 
     with open("eduschool_cache/branches.json", "r") as f:
@@ -2,58 +2,127 @@ from src.utils.utils_dataframe import *
 from src.etl.connect import *
 import time
 import ast
-import requests
+from src.utils.utils_http import *
+from src.utils.utils_cache import *
+from src.utils.utils_stream import *
+from configs.http_config import EDUSCHOOL_API_URL
+from configs.sync_config import WATERMARK_DIR, FINANCE_WATERMARK_OVERLAP, FINANCE_FULL_SYNC_EVERY, FORCE_FULL_SYNC
 import numpy as np
 import datetime
-import requests
 import pandas as pd
 from configs.logging_config import get_logger
 logger = get_logger("etl_log")
 
 
-# Function to fetch all transactions by paginating the API
-def finance_fetch_all_transactions(token, year="6841869b8eb7901bc71c7807", branch="68417f7edbbdfc73ada6ef01"):
-    url = "https://backend.eduschool.uz/moderator-api/cashbox/transaction/pagin"
-    headers = eduschool_headers(token, branch=branch, year=year)
-
-    transactions = []
-    page = 1
-    limit = 20
-    total = None
-
-    while True:
-        params = {
-            "search": "",
-            "page": page,
-            "limit": limit
-        }
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()  # Raises an error for bad status codes
+# Per-branch high-water marks: WATERMARK_DIR/finance_watermarks.json,
+# {branch: {"createdAt", "id", "full_sync_at"}}
+FINANCE_WATERMARKS = "finance_watermarks"
 
-        json_response = response.json()
-        if json_response.get("code") != 0:
-            raise ValueError(f"API returned non-zero code: {json_response.get('code')}")
 
-        data = json_response["data"]
-        if total is None:
-            total = data["total"]
+def finance_read_watermark(branch):
+    """Return the stored watermark of a branch, or None before its first sync."""
+    path = os.path.join(WATERMARK_DIR, f"{FINANCE_WATERMARKS}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            return json.load(f).get(branch)
+        except json.JSONDecodeError:
+            return None
 
-        transactions.extend(data["data"])
 
-        if len(transactions) >= total:
-            break
+def finance_save_watermark(transactions_df, branch):
+    """
+    Store the watermark reached by finance_fetch_all_transactions.
+    Call it only after the frame was loaded, so a failed load is re-fetched next run.
+    """
+    watermark = transactions_df.attrs.get("watermark")
+    if watermark:
+        os.makedirs(WATERMARK_DIR, exist_ok=True)
+        update_json_cache(FINANCE_WATERMARKS, {branch: watermark}, WATERMARK_DIR)
 
-        page += 1
 
-
-    # Create a flattened pandas DataFrame by exploding/flattening nested structures
-    transactions_df = pd.json_normalize(transactions, sep="_")
+# Function to fetch all transactions by paginating the API
+def finance_fetch_all_transactions(token, year="6841869b8eb7901bc71c7807", branch="68417f7edbbdfc73ada6ef01", incremental=True):
+    """
+    Fetch the cashbox transactions of a branch.
+
+    With incremental=True only transactions created since the branch's stored
+    watermark (minus FINANCE_WATERMARK_OVERLAP) are fetched, paging
+    newest-first and stopping at the watermark, then re-reading the first
+    pages until no new transaction turns up. A full download is done on the
+    first run, every FINANCE_FULL_SYNC_EVERY, with ETL_FULL_SYNC=1, and
+    whenever the endpoint turns out not to list newest-first. The new watermark is attached as
+    df.attrs["watermark"]; store it with finance_save_watermark after loading.
+    """
+    url = f"{EDUSCHOOL_API_URL}/cashbox/transaction/pagin"
+    headers = eduschool_headers(token, branch=branch, year=year)
+    now = pd.Timestamp.now(tz="UTC")
+
+    def created(item):
+        return pd.to_datetime(item.get("createdAt"), errors="coerce", utc=True)
+
+    state = finance_read_watermark(branch) if incremental and not FORCE_FULL_SYNC else None
+    full_sync = (
+        state is None
+        or pd.isna(pd.to_datetime(state.get("full_sync_at"), errors="coerce", utc=True))
+        or now - pd.to_datetime(state["full_sync_at"], utc=True) >= FINANCE_FULL_SYNC_EVERY
+    )
+
+    # Transactions go into flattened columns (as json_normalize(sep="_") would) as they are decoded
+    transactions = ColumnBuilder(sep="_")
+    if not full_sync:
+        since = pd.to_datetime(state["createdAt"], utc=True) - FINANCE_WATERMARK_OVERLAP
+        items, _ = eduschool_fetch_pages_until(
+            url, headers, stop=lambda item: created(item) < since, params={"search": ""}
+        )
+        created_at = [created(item) for item in items]
+        if any(pd.isna(c) for c in created_at) or any(a < b for a, b in zip(created_at, created_at[1:])):
+            logger.warning(f"Finance {branch}: transactions are not listed newest-first by createdAt, doing a full sync.")
+            full_sync = True
+        else:
+            # Transactions created while paging push the older ones a page further (read
+            # twice) and are not read themselves: keep one copy per id and re-read from
+            # the top, down to the newest transaction seen, until nothing new turns up.
+            fresh = {item["_id"]: item for item, c in zip(items, created_at) if c >= since}
+            while fresh:
+                newest = max(created(item) for item in fresh.values())
+                more, _ = eduschool_fetch_pages_until(
+                    url, headers, stop=lambda item: created(item) < newest, params={"search": ""}
+                )
+                new = {item["_id"]: item for item in more if item["_id"] not in fresh and created(item) >= since}
+                if not new:
+                    break
+                fresh.update(new)
+            transactions.extend(fresh.values())
+            logger.info(f"Finance {branch}: {len(transactions)} transactions since {since.isoformat()} (incremental).")
+            del fresh
+        del items
+
+    if full_sync:
+        eduschool_fetch_all_pages(url, headers, {"search": ""}, builder=transactions)
+        logger.info(f"Finance {branch}: {len(transactions)} transactions (full sync).")
+
+    # Newest transaction seen becomes the next watermark
+    created_at = pd.to_datetime(pd.Series(transactions.column("createdAt"), dtype=object), errors="coerce", utc=True)
+    if created_at.notna().any():
+        newest = created_at.idxmax()
+        watermark = {"createdAt": created_at[newest].isoformat(), "id": transactions.column("_id")[newest]}
+    elif state is not None:
+        watermark = {"createdAt": state["createdAt"], "id": state.get("id")}
+    else:
+        watermark = None
+    if watermark is not None:
+        watermark["full_sync_at"] = now.isoformat() if full_sync else state["full_sync_at"]
+
+    # Create a flattened pandas DataFrame from the collected columns
+    transactions_df = transactions.to_frame()
 
     # Clean and enrich dfs
     transactions_df.fillna(0, inplace=True)
     transactions_df = clean_string_columns(transactions_df)
     transactions_df = normalize_columns(transactions_df)
-    transactions_df = add_timestamp(transactions_df)
+    transactions_df = add_timestamp(transactions_df, dataset="finance_transactions")
 
     with open("eduschool_cache/branches.json", "r") as f:
         filials  = json.load(f)
@@ -63,6 +132,7 @@ def finance_fetch_all_transactions(token, year="6841869b8eb7901bc71c7807", branc
     transactions_df.rename(columns={"type": "transaction_type"}, inplace=True)
 
     transactions_df.attrs["name"] = "finance_transactions"
+    transactions_df.attrs["watermark"] = watermark
 
     # Save df to CSV
     save_df_with_timestamp(df=transactions_df)
@@ -1,5 +1,8 @@
 from src.utils.utils_dataframe import *
 from src.etl.connect import *
+from src.utils.utils_http import *
+from configs.http_config import FACEBOOK_GRAPH_URL, FACEBOOK_ASYNC_MIN_DAYS, FACEBOOK_POLL_INTERVAL, FACEBOOK_POLL_TIMEOUT
+import time
 import requests
 import pandas as pd
 from datetime import datetime, timedelta, timezone
@@ -7,32 +10,186 @@ from configs.logging_config import get_logger
 logger = get_logger("etl_log")
 
 
-def fetch_marketing_facebook_data(access_token, ad_account_ids, api_version="v24.0", period=1):
+def facebook_get_all(url, params=None):
+    """GET a Graph API edge and follow paging.next until the last page; returns all "data" items."""
+    items = []
+    while url:
+        response = http_get(url, params=params)
+        response.raise_for_status()
+        data = response.json()
+        items.extend(data.get("data", []))
+        # The next link already carries every query parameter
+        url, params = data.get("paging", {}).get("next"), None
+    return items
+
+
+def facebook_run_async_report(url, params, label):
+    """
+    Start an async insights report run (POST /insights) and wait for it.
+    Returns the report's rows, or None if the job failed, timed out or a
+    request to it failed; the caller then falls back to facebook_get_all.
+    """
+    base_url = url.rsplit("/", 2)[0]
+    try:
+        response = http_post(url, data=params)
+        response.raise_for_status()
+        report_run_id = response.json()["report_run_id"]
+
+        started = time.monotonic()
+        while True:
+            response = http_get(f"{base_url}/{report_run_id}", params={
+                "access_token": params["access_token"],
+                "fields": "async_status,async_percent_completion"
+            })
+            response.raise_for_status()
+            status = response.json()
+            if status.get("async_status") == "Job Completed":
+                break
+            if status.get("async_status") in ("Job Failed", "Job Skipped"):
+                logger.warning(f"Facebook {label}: async report {report_run_id} ended with {status.get('async_status')}.")
+                return None
+            if time.monotonic() - started > FACEBOOK_POLL_TIMEOUT:
+                logger.warning(f"Facebook {label}: async report {report_run_id} not done after {FACEBOOK_POLL_TIMEOUT} s.")
+                return None
+            time.sleep(FACEBOOK_POLL_INTERVAL)
+
+        logger.info(f"Facebook {label}: async report {report_run_id} completed in {time.monotonic() - started:.0f} s.")
+        return facebook_get_all(f"{base_url}/{report_run_id}/insights", {
+            "access_token": params["access_token"],
+            "limit": 500
+        })
+    except (requests.RequestException, KeyError) as e:
+        logger.warning(f"Facebook {label}: async report request failed ({e}), falling back to a synchronous pull.")
+        return None
+
+
+# Metrics that cannot be summed over days; a local monthly rollup re-fetches them
+FACEBOOK_NON_ADDITIVE = [
+    "reach",
+    "frequency",
+    "unique_clicks",
+    "quality_ranking",
+    "engagement_rate_ranking",
+    "conversion_rate_ranking",
+]
+
+
+def _sum_action_lists(lists):
+    """Sum [{"action_type", "value"}, ...] lists of several days per action_type."""
+    totals = {}
+    for actions in lists:
+        if not isinstance(actions, list):
+            continue
+        for action in actions:
+            key = action.get("action_type")
+            totals[key] = totals.get(key, 0) + float(action.get("value", 0) or 0)
+    if not totals:
+        return None
+    # Graph API sends values as strings; keep every digit ('{:g}' cut them to 6 significant)
+    return [
+        {"action_type": key, "value": str(int(value)) if value.is_integer() else str(round(value, 6))}
+        for key, value in totals.items()
+    ]
+
+
+def facebook_rollup_monthly(daily, since, until, non_additive=None):
+    """
+    Build the period='monthly' insights rows from the daily ones.
+
+    impressions, clicks, spend and the action lists are summed; ctr, cpc and
+    cpm are recomputed from the sums. reach, frequency, unique_clicks and the
+    rankings cannot be derived from daily rows: they are taken from
+    non_additive (monthly rows with FACEBOOK_NON_ADDITIVE fields) when given,
+    otherwise approximated (max daily reach / unique_clicks, frequency =
+    impressions / reach, last daily ranking) with a warning. Months are clamped
+    to since..until like the Graph API does. Campaigns without data keep their
+    single zero row.
+    """
+    daily = daily.copy()
+    daily["_order"] = pd.factorize(daily["account_id"].astype(str) + "|" + daily["campaign_id"].astype(str))[0]
+    dated = daily[daily["date_start"].notna()].copy()
+    undated = daily[daily["date_start"].isna()]
+
+    dated["_month"] = pd.to_datetime(dated["date_start"]).dt.to_period("M")
+    grouped = dated.groupby(["account_id", "campaign_id", "_month"], sort=False)
+    monthly = grouped.agg(
+        _order=("_order", "first"),
+        campaign_name=("campaign_name", "first"),
+        impressions=("impressions", "sum"),
+        clicks=("clicks", "sum"),
+        spend=("spend", "sum"),
+        reach=("reach", "max"),
+        unique_clicks=("unique_clicks", "max"),
+        quality_ranking=("quality_ranking", "last"),
+        engagement_rate_ranking=("engagement_rate_ranking", "last"),
+        conversion_rate_ranking=("conversion_rate_ranking", "last"),
+    ).reset_index()
+    for col in ["conversions", "actions"]:
+        if col in dated.columns:
+            monthly[col] = grouped[col].agg(_sum_action_lists).to_numpy()
+    monthly["unique_actions"] = float("nan")
+
+    monthly["ctr"] = (monthly["clicks"] / monthly["impressions"] * 100).where(monthly["impressions"] > 0)
+    monthly["cpc"] = (monthly["spend"] / monthly["clicks"]).where(monthly["clicks"] > 0)
+    monthly["cpm"] = (monthly["spend"] / monthly["impressions"] * 1000).where(monthly["impressions"] > 0)
+
+    if non_additive is not None and not non_additive.empty:
+        exact = non_additive[non_additive["date_start"].notna()].copy()
+        exact["_month"] = pd.to_datetime(exact["date_start"]).dt.to_period("M")
+        exact["campaign_id"] = exact["campaign_id"].astype(str)
+        exact = exact.drop_duplicates(["account_id", "campaign_id", "_month"])
+        keys = ["account_id", "campaign_id", "_month"]
+        monthly["campaign_id"] = monthly["campaign_id"].astype(str)
+        monthly = monthly.drop(columns=[col for col in FACEBOOK_NON_ADDITIVE if col in monthly.columns]).merge(
+            exact[keys + [col for col in FACEBOOK_NON_ADDITIVE if col in exact.columns]], on=keys, how="left"
+        )
+    else:
+        logger.warning("Facebook monthly rollup: reach, frequency, unique clicks and rankings are approximated from daily rows.")
+        monthly["frequency"] = (monthly["impressions"] / monthly["reach"]).where(monthly["reach"] > 0)
+
+    # The API clamps the first and last month to the requested range
+    month_start = monthly["_month"].dt.start_time.dt.date
+    month_end = monthly["_month"].dt.end_time.dt.date
+    monthly["date_start"] = month_start.where(month_start > since, since).astype(str)
+    monthly["date_stop"] = month_end.where(month_end < until, until).astype(str)
+
+    monthly = pd.concat([monthly.drop(columns="_month"), undated], ignore_index=True)
+    monthly = monthly.sort_values("_order", kind="stable").drop(columns="_order").reset_index(drop=True)
+    return monthly.reindex(columns=[col for col in daily.columns if col != "_order"])
+
+
+def fetch_marketing_facebook_data(access_token, ad_account_ids, api_version="v24.0", period=1, monthly_rollup=False):
+    """
+    Campaign insights of the last 90 days per period (1 = daily, 'monthly', ...).
+
+    With period=1 and monthly_rollup=True returns (daily_df, monthly_df), the
+    monthly table being rolled up locally (see facebook_rollup_monthly) with
+    only the non-additive metrics fetched monthly from the API.
+    """
+    today = datetime.today().date()
+    since = today - timedelta(days=90)
+
     # Step 1: Get all campaigns
     def get_campaigns(ad_account_id):
-        url = f"https://graph.facebook.com/{api_version}/{ad_account_id}/campaigns"
+        url = f"{FACEBOOK_GRAPH_URL}/{api_version}/{ad_account_id}/campaigns"
         params = {
             "access_token": access_token,
-            "fields": "id,name,status,effective_status"
+            "fields": "id,name,status,effective_status",
+            "limit": 500
         }
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json().get("data", [])
-
-    # Step 2: Get insights for a single campaign
-    def get_campaign_insights(campaign_id, period):
+        return facebook_get_all(url, params)
 
-        today = datetime.today().date()
-        since = today - timedelta(days=90)
+    # Step 2: Get campaign-level insights of the whole ad account
+    def get_account_insights(ad_account_id, period, fields=None):
 
         time_range = json.dumps({
             "since": str(since),
             "until": str(today)
         })
 
-        url = f"https://graph.facebook.com/{api_version}/{campaign_id}/insights"
+        url = f"{FACEBOOK_GRAPH_URL}/{api_version}/{ad_account_id}/insights"
 
-        fields = [
+        fields = fields or [
             "campaign_name",
             "campaign_id",
             "impressions",
@@ -63,23 +220,36 @@ def fetch_marketing_facebook_data(access_token, ad_account_ids, api_version="v24
                 "level": "campaign",
                 "fields": fields_str,
                 "time_range": time_range,
-                "time_increment": period
+                "time_increment": period,
+                "limit": 500
             }
             return params
 
         params = get_params(period)
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json().get("data", [])
+
+        # Long ranges run as an async report job, the rest are paged directly
+        if (today - since).days >= FACEBOOK_ASYNC_MIN_DAYS:
+            insights = facebook_run_async_report(url, params, label=ad_account_id)
+            if insights is not None:
+                return insights
+        return facebook_get_all(url, params)
 
     # Step 3: Collect all insights into a DataFrame
     def collect_insights_to_df(ad_account_id, period):
         campaigns = get_campaigns(ad_account_id)
+
+        # One insights pull per account, split by campaign
+        insights_by_campaign = {}
+        for daily_row in get_account_insights(ad_account_id, period):
+            insights_by_campaign.setdefault(str(daily_row.get("campaign_id")), []).append(daily_row)
+        logger.info(f"Facebook {ad_account_id}: {sum(map(len, insights_by_campaign.values()))} insight rows "
+                    f"for {len(insights_by_campaign)}/{len(campaigns)} campaigns.")
+
         all_rows = []
 
         for camp in campaigns:
             camp_id = camp["id"]
-            insights = get_campaign_insights(camp_id, period)
+            insights = insights_by_campaign.get(str(camp_id))
 
             if not insights:
                 # No data for campaign, create one row with zeros
@@ -127,13 +297,42 @@ def fetch_marketing_facebook_data(access_token, ad_account_ids, api_version="v24
 
         return df
 
-    # Initialize an empty DataFrame
-    facebook_data = pd.DataFrame()
+    # Step 4: Monthly non-additive metrics for the local rollup, one small pull per account
+    def collect_non_additive_to_df(ad_account_id):
+        rows = get_account_insights(ad_account_id, "monthly", fields=["campaign_id", "date_start"] + FACEBOOK_NON_ADDITIVE)
+        df = pd.DataFrame(rows, columns=["campaign_id", "date_start"] + FACEBOOK_NON_ADDITIVE)
+        for col in ["reach", "frequency", "unique_clicks"]:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+        df["account_id"] = ad_account_id
+        return df
+
+    # Collect insights of all ad accounts concurrently (async report jobs overlap)
+    account_dfs = crawl(collect_insights_to_df, [(ad_account_id, period) for ad_account_id in ad_account_ids],
+                        label="facebook accounts")
+    for df in account_dfs:
+        if isinstance(df, Exception):
+            raise df
+    facebook_data = pd.concat([pd.DataFrame(), *account_dfs], ignore_index=True)
+
+    if not monthly_rollup:
+        return finish_marketing_facebook(facebook_data)
+
+    if period != 1:
+        raise ValueError("monthly_rollup needs daily insights (period=1).")
+    non_additive = crawl(collect_non_additive_to_df, [(ad_account_id,) for ad_account_id in ad_account_ids],
+                         label="facebook monthly reach")
+    if any(isinstance(df, Exception) for df in non_additive):
+        non_additive = None
+    else:
+        non_additive = pd.concat(non_additive, ignore_index=True)
+    facebook_monthly = facebook_rollup_monthly(facebook_data, since, today, non_additive)
+
+    return finish_marketing_facebook(facebook_data), finish_marketing_facebook(facebook_monthly)
+
 
-    # Loop through all ad accounts and collect insights
-    for ad_account_id in ad_account_ids:
-        df = collect_insights_to_df(ad_account_id, period)
-        facebook_data = pd.concat([facebook_data, df], ignore_index=True)
+def finish_marketing_facebook(facebook_data):
+    """Clean an insights frame for loading: UTC dates, row id, normalised columns, timestamp."""
+    facebook_data = facebook_data.copy()
 
     for col in ["date_start", "date_stop"]:
         # Convert to datetime, coerce errors to NaT
@@ -168,23 +367,23 @@ def fetch_marketing_facebook_data(access_token, ad_account_ids, api_version="v24
 def fetch_marketing_facebook_pages_data(access_token, ad_account_ids, api_version="v24.0"):
     def get_pages(ad_account_id):
         """Fetch all promote_pages associated with the ad account"""
-        url = f"https://graph.facebook.com/{api_version}/{ad_account_id}/promote_pages"
+        url = f"{FACEBOOK_GRAPH_URL}/{api_version}/{ad_account_id}/promote_pages"
         params = {
             "access_token": access_token,
             "fields": "id,name,access_token"  # You can request these fields on the Page nodes
         }
-        resp = requests.get(url, params=params)
+        resp = http_get(url, params=params)
         resp.raise_for_status()
         return resp.json().get("data", [])
 
     def get_page_snapshot(page_id):
         """Get current fan_count and followers_count"""
-        url = f"https://graph.facebook.com/{api_version}/{page_id}"
+        url = f"{FACEBOOK_GRAPH_URL}/{api_version}/{page_id}"
         params = {
             "access_token": access_token,
             "fields": "fan_count,followers_count"
         }
-        resp = requests.get(url, params=params)
+        resp = http_get(url, params=params)
         resp.raise_for_status()
         return resp.json()
 
@@ -235,7 +434,7 @@ def fetch_marketing_facebook_pages_data(access_token, ad_account_ids, api_versio
     # Meta business additional permissions needed 
     
     def get_page_daily_insights(page_id, page_access_token):
-    url = f"https://graph.facebook.com/{api_version}/{page_id}/insights"
+    url = f"{FACEBOOK_GRAPH_URL}/{api_version}/{page_id}/insights"
     
     # Tashkent time (UTC+5)
     tashkent = timezone(timedelta(hours=5))
@@ -261,7 +460,7 @@ def fetch_marketing_facebook_pages_data(access_token, ad_account_ids, api_versio
         "since": int(since_ts),
     }
 
-    resp = requests.get(url, params=params)
+    resp = http_get(url, params=params)
     if not resp.ok:
         print(f"Insights failed for {page_id}:", resp.json())
         return {"page_fan_adds": 0}
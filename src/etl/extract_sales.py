@@ -1,8 +1,14 @@
-import requests
+from src.utils.utils_http import *
 from src.utils.utils_dataframe import *
 from src.utils.utils_cache import *
+from src.etl.connect import amocrm_base_url
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import pandas as pd
 import json
+from configs.http_config import AMOCRM_PAGE_CONCURRENCY
+from configs.sync_config import WATERMARK_DIR, AMOCRM_WATERMARK_OVERLAP, AMOCRM_FULL_SYNC_EVERY, FORCE_FULL_SYNC
 from configs.logging_config import get_logger
 logger = get_logger("etl_log")
 
@@ -11,26 +17,198 @@ with open("credentials/amocrm.json", "r") as f:
     creds = json.load(f)
 
 AMO_DOMAIN = creds["base_domain"]
-BASE_URL = f'https://{AMO_DOMAIN}/api/v4'
+BASE_URL = f'{amocrm_base_url(AMO_DOMAIN)}/api/v4'
 
-def amocrm_get_all_items(endpoint, headers):
-    """Fetch paginated results for any endpoint"""
-    items = []
-    page = 1
-    while True:
-        url = f"{BASE_URL}/{endpoint}?page={page}&limit=250"
-        response = requests.get(url, headers=headers)
+# Per-entity high-water marks: WATERMARK_DIR/amocrm_watermarks.json,
+# {entity: {"updated_at": unix seconds, "full_sync_at"}}
+AMOCRM_WATERMARKS = "amocrm_watermarks"
+
+
+def amocrm_get_all_items(endpoint, headers, params=None, max_workers=AMOCRM_PAGE_CONCURRENCY):
+    """
+    Fetch paginated results for any endpoint, keeping up to max_workers page
+    requests in flight (the shared client holds them to amoCRM's 7 req/s and
+    backs off on 429).
+
+    A page is the last one when it has no _links.next or is short, so no
+    empty page is requested to find the end. Only page 1 is requested until
+    it shows there is more, pages past the end that were already in flight
+    are discarded. Items are returned in page order.
+    """
+    limit = 250
+
+    def fetch_page(page):
+        response = http_get(f"{BASE_URL}/{endpoint}", headers=headers, params={**(params or {}), "page": page, "limit": limit})
         response.raise_for_status()
+        if response.status_code == 204:  # amoCRM answers an empty result with No Content
+            return [], True
         data = response.json()
         embedded = data.get("_embedded", {})
-        results = embedded.get("items") or embedded.get(endpoint)
-        if not results:
+        results = embedded.get("items") or embedded.get(endpoint) or []
+        is_last = len(results) < limit or not data.get("_links", {}).get("next")
+        return results, is_last
+
+    started = time.perf_counter()
+    pages = {}
+    last_page = None
+    next_page = 1
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        while True:
+            # One request until page 1 shows there are more pages
+            window = 1 if 1 not in pages else max_workers
+            while len(in_flight) < window and (last_page is None or next_page <= last_page):
+                in_flight[pool.submit(fetch_page, next_page)] = next_page
+                next_page += 1
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                page = in_flight.pop(future)
+                results, is_last = future.result()
+                pages[page] = results
+                if is_last:
+                    last_page = page if last_page is None else min(last_page, page)
+            # Stop waiting for pages known to be past the end
+            for future in [f for f, page in in_flight.items() if last_page is not None and page > last_page]:
+                future.cancel()
+                in_flight.pop(future)
+
+    items = [item for page in sorted(pages) if page <= last_page for item in pages[page]]
+    elapsed = time.perf_counter() - started
+    logger.info(f"SALES: {endpoint}: {len(items)} items, {last_page} pages in {elapsed:.1f} s "
+                f"({last_page / max(elapsed, 1e-9):.1f} pages/s).")
+    return items
+
+
+def amocrm_get_items_since(entity, headers, since):
+    """
+    Fetch every item of entity with updated_at >= since (unix seconds).
+
+    Pages by key instead of offset: each request asks for page 1 from the
+    newest updated_at seen so far, so items edited while paging reappear at
+    their new position instead of shifting the pages after them. Only when a
+    full page shares one updated_at does the next request move to page 2 of
+    that second. Stops when a request brings nothing new.
+    """
+    limit = 250
+    items = {}
+    page = 1
+    requests_made = 0
+    while True:
+        response = http_get(f"{BASE_URL}/{entity}", headers=headers, params={
+            "filter[updated_at][from]": since,
+            "order[updated_at]": "asc",
+            "page": page,
+            "limit": limit,
+        })
+        response.raise_for_status()
+        requests_made += 1
+        if response.status_code == 204:  # amoCRM answers an empty result with No Content
             break
-        items.extend(results)
-        if len(results) < 250:
+        results = response.json().get("_embedded", {}).get(entity) or []
+
+        new = [item for item in results if items.get(item["id"], {}).get("updated_at") != item.get("updated_at")]
+        if not new:
             break
-        page += 1
-    return items
+        for item in results:
+            items[item["id"]] = item
+
+        newest = max(item.get("updated_at") or since for item in results)
+        if newest > since:
+            since, page = newest, 1
+        elif len(results) < limit:
+            break
+        else:
+            page += 1
+
+    logger.info(f"SALES: {entity}: {len(items)} items in {requests_made} requests.")
+    return list(items.values())
+
+
+def amocrm_read_watermarks():
+    """Return the stored {entity: watermark} of incrementally synced amoCRM entities."""
+    path = os.path.join(WATERMARK_DIR, f"{AMOCRM_WATERMARKS}.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError:
+            return {}
+
+
+def amocrm_get_updated_items(entity, headers, incremental=True):
+    """
+    Fetch leads/contacts/companies/tasks changed since the entity's watermark.
+
+    Pages from the watermark minus AMOCRM_WATERMARK_OVERLAP with
+    amocrm_get_items_since; the newest updated_at seen becomes the next
+    watermark. A full sweep is done instead on the first run,
+    every AMOCRM_FULL_SYNC_EVERY, with ETL_FULL_SYNC=1 or incremental=False.
+
+    Returns (items, sync): sync = {"incremental": bool, "watermark": {entity: state}}
+    for the frame's attrs; store it with amocrm_save_watermarks once loaded.
+    """
+    now = pd.Timestamp.now(tz="UTC")
+    state = amocrm_read_watermarks().get(entity) if incremental and not FORCE_FULL_SYNC else None
+    full_sync = (
+        state is None
+        or pd.isna(pd.to_datetime(state.get("full_sync_at"), errors="coerce", utc=True))
+        or now - pd.to_datetime(state["full_sync_at"], utc=True) >= AMOCRM_FULL_SYNC_EVERY
+    )
+
+    if full_sync:
+        items = amocrm_get_all_items(entity, headers)
+        logger.info(f"SALES: {len(items)} {entity} (full sweep).")
+    else:
+        since = int(state["updated_at"] - AMOCRM_WATERMARK_OVERLAP.total_seconds())
+        items = amocrm_get_items_since(entity, headers, since)
+        logger.info(f"SALES: {len(items)} {entity} updated since {pd.Timestamp(since, unit='s', tz='UTC').isoformat()} (incremental).")
+
+    # Newest updated_at seen (or the old one if nothing changed) becomes the next watermark
+    updated = [item["updated_at"] for item in items if isinstance(item.get("updated_at"), (int, float))]
+    if state:
+        updated.append(state["updated_at"])
+    watermark = {}
+    if updated:
+        watermark[entity] = {
+            "updated_at": max(updated),
+            "full_sync_at": now.isoformat() if full_sync else state["full_sync_at"],
+        }
+    return items, {"incremental": not full_sync, "watermark": watermark}
+
+
+def amocrm_empty_frame(name, sync):
+    """Frame returned when an incremental fetch found nothing new (the loaders skip it)."""
+    df = pd.DataFrame()
+    df.attrs.update({"name": name, **sync})
+    return df
+
+
+def amocrm_save_watermarks(results):
+    """
+    Store the watermarks of the frames whose loads all succeeded.
+    results as returned by LoadQueue.join / load_tables (the frames' attrs carry the watermarks).
+    """
+    ok, watermarks = {}, {}
+    for result in results:
+        attrs = result["attrs"]
+        if not attrs.get("watermark"):
+            continue
+        ok[attrs["name"]] = ok.get(attrs["name"], True) and result["ok"]
+        watermarks[attrs["name"]] = attrs["watermark"]
+
+    updates = {}
+    for name, watermark in watermarks.items():
+        if ok[name]:
+            updates.update(watermark)
+        else:
+            logger.warning(f"SALES: {name} not loaded completely, keeping its old watermark.")
+    if updates:
+        os.makedirs(WATERMARK_DIR, exist_ok=True)
+        update_json_cache(AMOCRM_WATERMARKS, updates, WATERMARK_DIR)
 
 
 def amocrm_get_catalogs(headers):
@@ -44,16 +222,18 @@ def amocrm_get_catalogs(headers):
 
     catalogs_df["created_at"] = pd.to_datetime(catalogs_df["created_at"], unit="s")
     catalogs_df["updated_at"] = pd.to_datetime(catalogs_df["updated_at"], unit="s")
-    catalogs_df = add_timestamp(catalogs_df)
+    catalogs_df = add_timestamp(catalogs_df, dataset="sales_catalogs")
 
     catalogs_df.attrs["name"] = "sales_catalogs"
     save_df_with_timestamp(df=catalogs_df)
     return catalogs_df
 
 
-def amocrm_get_companies(headers):
+def amocrm_get_companies(headers, incremental=True):
     logger.info("SALES: Downloading companies...")
-    companies = amocrm_get_all_items("companies", headers)
+    companies, sync = amocrm_get_updated_items("companies", headers, incremental)
+    if not companies:
+        return amocrm_empty_frame("sales_companies", sync)
     companies_df = pd.DataFrame(companies)
 
     companies_df.fillna(0, inplace=True)
@@ -64,16 +244,19 @@ def amocrm_get_companies(headers):
     companies_df["updated_at"] = pd.to_datetime(companies_df["updated_at"], unit="s")
     companies_df["closest_task_at"] = pd.to_datetime(companies_df["closest_task_at"], unit="s")
 
-    companies_df = add_timestamp(companies_df)
+    companies_df = add_timestamp(companies_df, dataset="sales_companies")
     companies_df.attrs["name"] = "sales_companies"
+    companies_df.attrs.update(sync)
 
     save_df_with_timestamp(df=companies_df)
     return companies_df
 
 
-def amocrm_get_contacts(headers):
+def amocrm_get_contacts(headers, incremental=True):
     logger.info("SALES: Downloading contacts...")
-    contacts = amocrm_get_all_items("contacts", headers)
+    contacts, sync = amocrm_get_updated_items("contacts", headers, incremental)
+    if not contacts:
+        return amocrm_empty_frame("sales_contacts", sync)
     contacts_df = pd.DataFrame(contacts)
 
     contacts_df.fillna(0, inplace=True)
@@ -84,16 +267,19 @@ def amocrm_get_contacts(headers):
     contacts_df["updated_at"] = pd.to_datetime(contacts_df["updated_at"], unit="s")
     contacts_df["closest_task_at"] = pd.to_datetime(contacts_df["closest_task_at"], unit="s")
 
-    contacts_df = add_timestamp(contacts_df)
+    contacts_df = add_timestamp(contacts_df, dataset="sales_contacts")
     contacts_df.attrs["name"] = "sales_contacts"
+    contacts_df.attrs.update(sync)
 
     save_df_with_timestamp(df=contacts_df)
     return contacts_df
 
 
-def amocrm_get_leads(headers):
+def amocrm_get_leads(headers, incremental=True):
     logger.info("SALES: Downloading leads...")
-    leads = amocrm_get_all_items("leads", headers)
+    leads, sync = amocrm_get_updated_items("leads", headers, incremental)
+    if not leads:
+        return amocrm_empty_frame("sales_leads", sync)
     leads_df = pd.DataFrame(leads)
 
     wanted = [
@@ -168,8 +354,9 @@ def amocrm_get_leads(headers):
     leads_df["closed_at"] = pd.to_datetime(leads_df["closed_at"], unit="s")
     leads_df["closest_task_at"] = pd.to_datetime(leads_df["closest_task_at"], unit="s")
 
-    leads_df = add_timestamp(leads_df)
+    leads_df = add_timestamp(leads_df, dataset="sales_leads")
     leads_df.attrs["name"] = "sales_leads"
+    leads_df.attrs.update(sync)
 
     save_df_with_timestamp(df=leads_df)
     return leads_df
@@ -177,7 +364,7 @@ def amocrm_get_leads(headers):
 
 def amocrm_get_loss_reasons(headers):
     logger.info("SALES: Downloading loss reasons...")
-    response = requests.get(f"{BASE_URL}/leads/loss_reasons", headers=headers)
+    response = http_get(f"{BASE_URL}/leads/loss_reasons", headers=headers, cache="amocrm_reference")
     response.raise_for_status()
     loss_reasons = response.json()["_embedded"]["loss_reasons"]
     loss_reasons_df = pd.DataFrame(loss_reasons)
@@ -188,7 +375,7 @@ def amocrm_get_loss_reasons(headers):
 
     loss_reasons_df["created_at"] = pd.to_datetime(loss_reasons_df["created_at"], unit="s")
     loss_reasons_df["updated_at"] = pd.to_datetime(loss_reasons_df["updated_at"], unit="s")
-    loss_reasons_df = add_timestamp(loss_reasons_df)
+    loss_reasons_df = add_timestamp(loss_reasons_df, dataset="sales_loss_reasons")
 
     loss_reasons_dict = loss_reasons_df.set_index('id')['name'].astype(str).to_dict()
     update_json_cache("loss_reasons", loss_reasons_dict, 'amocrm_cache')
@@ -200,7 +387,7 @@ def amocrm_get_loss_reasons(headers):
 
 def amocrm_get_pipelines_statuses(headers):
     logger.info("SALES: Downloading pipelines...")
-    pipelines_resp = requests.get(f"{BASE_URL}/leads/pipelines", headers=headers)
+    pipelines_resp = http_get(f"{BASE_URL}/leads/pipelines", headers=headers, cache="amocrm_reference")
     pipelines_resp.raise_for_status()
     pipelines = pipelines_resp.json()["_embedded"]["pipelines"]
     pipelines_df = pd.DataFrame(pipelines)
@@ -209,7 +396,7 @@ def amocrm_get_pipelines_statuses(headers):
     pipelines_df = clean_string_columns(pipelines_df)
     pipelines_df = normalize_columns(pipelines_df)
 
-    pipelines_df = add_timestamp(pipelines_df)
+    pipelines_df = add_timestamp(pipelines_df, dataset="sales_pipelines")
     pipelines_df.attrs["name"] = "sales_pipelines"
 
     save_df_with_timestamp(df=pipelines_df)
@@ -230,7 +417,7 @@ def amocrm_get_pipelines_statuses(headers):
     statuses_df = clean_string_columns(statuses_df)
     statuses_df = normalize_columns(statuses_df)
 
-    statuses_df = add_timestamp(statuses_df)
+    statuses_df = add_timestamp(statuses_df, dataset="sales_pipeline_statuses")
     statuses_df.attrs["name"] = "sales_pipeline_statuses"
 
     save_df_with_timestamp(df=statuses_df)
@@ -253,7 +440,7 @@ def amocrm_get_tags_custom_fields(headers):
 
     for entity in ["leads", "contacts", "companies"]:
         for field in ["tags", "custom_fields"]:
-            response = requests.get(f"{BASE_URL}/{entity}/{field}", headers=headers)
+            response = http_get(f"{BASE_URL}/{entity}/{field}", headers=headers, cache="amocrm_reference")
             response.raise_for_status()
 
             data = response.json()["_embedded"][field]
@@ -268,7 +455,7 @@ def amocrm_get_tags_custom_fields(headers):
     tags_df.fillna(0, inplace=True)
     tags_df = clean_string_columns(tags_df)
     tags_df = normalize_columns(tags_df)
-    tags_df = add_timestamp(tags_df)
+    tags_df = add_timestamp(tags_df, dataset="sales_tags")
     tags_df = tags_df.rename(columns={"id": "amocrm_id"})
     # Add a new serial 'id' column starting from 1
     tags_df.insert(0, "id", range(1, len(tags_df) + 1))
@@ -282,7 +469,7 @@ def amocrm_get_tags_custom_fields(headers):
     custom_fields_df.fillna(0, inplace=True)
     custom_fields_df = clean_string_columns(custom_fields_df)
     custom_fields_df = normalize_columns(custom_fields_df)
-    custom_fields_df = add_timestamp(custom_fields_df)
+    custom_fields_df = add_timestamp(custom_fields_df, dataset="sales_custom_fields")
     custom_fields_df = custom_fields_df.rename(columns={"id": "amocrm_id"})
     # Add a new serial 'id' column starting from 1
     custom_fields_df.insert(0, "id", range(1, len(custom_fields_df) + 1))
@@ -296,9 +483,11 @@ def amocrm_get_tags_custom_fields(headers):
     return tags_df, custom_fields_df
 
 
-def amocrm_get_tasks(headers):
+def amocrm_get_tasks(headers, incremental=True):
     logger.info("SALES: Downloading tasks...")
-    tasks = amocrm_get_all_items("tasks", headers)
+    tasks, sync = amocrm_get_updated_items("tasks", headers, incremental)
+    if not tasks:
+        return amocrm_empty_frame("sales_tasks", sync)
     tasks_df = pd.DataFrame(tasks)
     tasks_df.fillna(0, inplace=True)
 
@@ -309,16 +498,17 @@ def amocrm_get_tasks(headers):
     tasks_df["updated_at"] = pd.to_datetime(tasks_df["updated_at"], unit="s")
     tasks_df["complete_till"] = pd.to_datetime(tasks_df["complete_till"], unit="s")
 
-    tasks_df = add_timestamp(tasks_df)
+    tasks_df = add_timestamp(tasks_df, dataset="sales_tasks")
 
     tasks_df.attrs["name"] = "sales_tasks"
+    tasks_df.attrs.update(sync)
     save_df_with_timestamp(df=tasks_df)
     return tasks_df
 
 
 def amocrm_get_task_types(headers):
     logger.info("SALES: Downloading task types...")
-    response = requests.get(f"{BASE_URL}/account?with=task_types", headers=headers)
+    response = http_get(f"{BASE_URL}/account?with=task_types", headers=headers, cache="amocrm_reference")
     response.raise_for_status()
     task_types = response.json()["_embedded"]["task_types"]
     task_types_df = pd.DataFrame(task_types)
@@ -327,7 +517,7 @@ def amocrm_get_task_types(headers):
     task_types_df = clean_string_columns(task_types_df)
     task_types_df = normalize_columns(task_types_df)
 
-    task_types_df = add_timestamp(task_types_df)
+    task_types_df = add_timestamp(task_types_df, dataset="sales_task_types")
     task_types_dict = task_types_df.set_index('id')['code'].astype(str).to_dict()
     update_json_cache("task_types", task_types_dict, 'amocrm_cache')
 
@@ -345,7 +535,7 @@ def amocrm_get_users(headers):
     users_df = clean_string_columns(users_df)
     users_df = normalize_columns(users_df)
 
-    users_df = add_timestamp(users_df)
+    users_df = add_timestamp(users_df, dataset="sales_users")
     users_df.attrs["name"] = "sales_users"
 
     users_dict = users_df.set_index('id')['name'].astype(str).to_dict()
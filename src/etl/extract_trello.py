@@ -2,12 +2,14 @@ from src.utils.utils_dataframe import *
 from src.etl.connect import *
 import pandas as pd
 import requests
+from src.utils.utils_http import *
+from configs.http_config import TRELLO_API_URL
 from datetime import datetime
 from configs.logging_config import get_logger
 logger = get_logger("etl_log")
 
 
-def trello_fetch_data(key, token, base_url = "https://api.trello.com/1"):
+def trello_fetch_data(key, token, base_url = TRELLO_API_URL):
     """
     get card creation datetime from Trello card ID
     def trello_id_to_datetime(id):
@@ -19,10 +21,10 @@ def trello_fetch_data(key, token, base_url = "https://api.trello.com/1"):
     # ------------------------------------------------------
     # Safe fetch helper with try/except and graceful fallback
     # ------------------------------------------------------
-    def fetch(url):
-        params = {"key": key, "token": token}
+    def fetch(url, extra_params=None, cache=None):
+        params = {"key": key, "token": token, **(extra_params or {})}
         try:
-            response = requests.get(url, params=params, timeout=15)
+            response = http_get(url, params=params, timeout=15, cache=cache)
             response.raise_for_status()
             try:
                 return response.json()
@@ -53,17 +55,23 @@ def trello_fetch_data(key, token, base_url = "https://api.trello.com/1"):
     } for b in boards])
 
     # ------------------------------------------------------
-    # Fetch lists and cards for each board
+    # Fetch lists and cards (with their checklists) for each board:
+    # two requests per board, boards fetched concurrently
     # ------------------------------------------------------
+    def fetch_board(board_id):
+        lists = fetch(f"{base_url}/boards/{board_id}/lists", cache="trello_lists")
+        cards = fetch(f"{base_url}/boards/{board_id}/cards", {"checklists": "all"})
+        return lists, cards
+
+    board_ids = [board.get("id") for board in boards]
+    board_data = crawl(fetch_board, [(board_id,) for board_id in board_ids], label="trello boards")
+
     all_lists = []
     all_cards = []
+    all_checklists = []
 
-    for board in boards:
-        board_id = board.get("id")
-
+    for board_id, (lists, cards) in zip(board_ids, board_data):
         # --- Lists ---
-        lists = fetch(f"{base_url}/boards/{board_id}/lists")
-
         for lst in lists:
             all_lists.append({
                 "board_id": board_id,
@@ -73,8 +81,6 @@ def trello_fetch_data(key, token, base_url = "https://api.trello.com/1"):
             })
 
         # --- Cards ---
-        cards = fetch(f"{base_url}/boards/{board_id}/cards")
-
         for card in cards:
             all_cards.append({
                 "board_id": board_id,
@@ -90,38 +96,27 @@ def trello_fetch_data(key, token, base_url = "https://api.trello.com/1"):
                 # "created_at": trello_id_to_datetime(card.get("id"))
             })
 
+            # --- Checklists ---
+            for checklist in card.get("checklists") or []:
+                for item in checklist.get("checkItems", []):
+                    all_checklists.append({
+                        "board_id": board_id,
+                        "card_id": card.get("id"),
+                        "id": checklist.get("id"),
+                        "checklist_name": checklist.get("name"),
+                        "item_name": item.get("name"),
+                        "state": item.get("state")
+                    })
+
     cards_df = pd.DataFrame(all_cards)
     lists_df = pd.DataFrame(all_lists)
-
-    # ------------------------------------------------------
-    # Fetch checklists for each card
-    # ------------------------------------------------------
-    all_checklists = []
-
-    for _, card in cards_df.iterrows():
-        card_id = card["id"]
-        board_id = card["board_id"]
-
-        checklists = fetch(f"{base_url}/cards/{card_id}/checklists")
-
-        for checklist in checklists:
-            for item in checklist.get("checkItems", []):
-                all_checklists.append({
-                    "board_id": board_id,
-                    "card_id": card_id,
-                    "id": checklist.get("id"),
-                    "checklist_name": checklist.get("name"),
-                    "item_name": item.get("name"),
-                    "state": item.get("state")
-                })
-
     checklists_df = pd.DataFrame(all_checklists)
 
     # --- Boards preprocessing  ---
     boards_df.fillna(0, inplace=True)
     boards_df = clean_string_columns(boards_df)
     boards_df = normalize_columns(boards_df)
-    boards_df = add_timestamp(boards_df)
+    boards_df = add_timestamp(boards_df, dataset="trello_boards")
     boards_df.attrs["name"] = "trello_boards"
     save_df_with_timestamp(df=boards_df)
 
@@ -129,7 +124,7 @@ def trello_fetch_data(key, token, base_url = "https://api.trello.com/1"):
     cards_df.fillna(0, inplace=True)
     cards_df = clean_string_columns(cards_df)
     cards_df = normalize_columns(cards_df)
-    cards_df = add_timestamp(cards_df)
+    cards_df = add_timestamp(cards_df, dataset="trello_cards")
     cards_df.attrs["name"] = "trello_cards"
     save_df_with_timestamp(df=cards_df)
 
@@ -137,7 +132,7 @@ def trello_fetch_data(key, token, base_url = "https://api.trello.com/1"):
     lists_df.fillna(0, inplace=True)
     lists_df = clean_string_columns(lists_df)
     lists_df = normalize_columns(lists_df)
-    lists_df = add_timestamp(lists_df)
+    lists_df = add_timestamp(lists_df, dataset="trello_lists")
     lists_df.attrs["name"] = "trello_lists"
     save_df_with_timestamp(df=lists_df)
 
@@ -145,7 +140,7 @@ def trello_fetch_data(key, token, base_url = "https://api.trello.com/1"):
     checklists_df.fillna(0, inplace=True)
     checklists_df = clean_string_columns(checklists_df)
     checklists_df = normalize_columns(checklists_df)
-    checklists_df = add_timestamp(checklists_df)
+    checklists_df = add_timestamp(checklists_df, dataset="trello_checklists")
     checklists_df.attrs["name"] = "trello_checklists"
     save_df_with_timestamp(df=checklists_df)
 
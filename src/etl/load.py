@@ -1,12 +1,452 @@
 from src.utils.utils_dataframe import *
+import re
+import time
+import random
 import pandas as pd
 import psycopg
-from psycopg.rows import dict_row
-import json
+from psycopg.rows import tuple_row
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.utils.utils_postgres import get_connection, log_pool_stats
+from src.utils.utils_schema import *
+from src.utils.utils_copy import *
+from src.utils.utils_partition import *
+from src.utils.utils_deadletter import *
 from configs.logging_config import get_logger
+from configs.postgres_config import (
+    COPY_THRESHOLD_ROWS, POOL_MAX_SIZE, SWAP_LOCK_TIMEOUT_MS, SWAP_LOCK_RETRIES, SWAP_RETRY_DELAY,
+    BATCH_RETRIES, BATCH_BACKOFF
+)
 logger = get_logger("etl_log")
 
+# Internal column holding the row content hash used by change detection. It is
+# an ordinary column (PostgreSQL cannot hide one from SELECT *), marked with
+# ROW_HASH_COMMENT; readers and exports should leave it out.
+ROW_HASH_COLUMN = "_row_hash"
+ROW_HASH_COMMENT = "Internal to the ETL loader (change detection hash), not for reporting."
+
+
+def copy_dataframe(cur, df: pd.DataFrame, target_name: str, column_types: dict, binary: bool = True) -> None:
+    """
+    Stream a DataFrame into an existing table with COPY.
+
+    With binary, columns are encoded straight from their NumPy buffers into
+    binary COPY (see utils_copy) using column_types, one chunk at a time;
+    frames with a column it cannot encode exactly fall back to row-by-row
+    text COPY. Must run inside a transaction (the fallback uses a savepoint).
+    """
+    cols_sql = ', '.join(df.columns)
+
+    if binary:
+        # A value that cannot be encoded may only show up in a later chunk,
+        # the savepoint lets the text COPY start over
+        cur.execute("SAVEPOINT binary_copy;")
+        try:
+            with cur.copy(f"COPY {target_name} ({cols_sql}) FROM STDIN (FORMAT BINARY)") as copy:
+                for chunk in iter_copy_binary(df, column_types):
+                    copy.write(chunk)
+        except (TypeError, ValueError) as e:
+            cur.execute("ROLLBACK TO SAVEPOINT binary_copy;")
+            logger.info(f"[{target_name}] Binary COPY not possible, using text COPY: {e}")
+        else:
+            cur.execute("RELEASE SAVEPOINT binary_copy;")
+            return
+
+    with cur.copy(f"COPY {target_name} ({cols_sql}) FROM STDIN") as copy:
+        for row in df.itertuples(index=False, name=None):
+            copy.write_row(row)
+
+
+def copy_to_stage(cur, df: pd.DataFrame, stage_name: str, table_name: str, binary: bool = True) -> None:
+    """
+    Create a temp staging table with the types of table_name's matching columns
+    and stream the DataFrame into it with COPY.
+
+    Temp tables are not WAL-logged and are dropped when the transaction ends.
+    """
+    cols_sql = ', '.join(df.columns)
+    cur.execute(f"DROP TABLE IF EXISTS {stage_name};")
+    cur.execute(
+        f"CREATE TEMP TABLE {stage_name} ON COMMIT DROP AS "
+        f"SELECT {cols_sql} FROM {table_name} WITH NO DATA;"
+    )
+    copy_dataframe(cur, df, stage_name, get_table_columns(cur, table_name) or {}, binary)
+
+
+def upsert_conflict_sql(
+        table_name: str,
+        columns: list,
+        primary_key: str,
+        only_changed: bool = False,
+        skip_newer: bool = False
+) -> str:
+    """
+    Build the ON CONFLICT clause of an upsert.
+
+    With only_changed, rows whose ROW_HASH_COLUMN matches the stored one are
+    left untouched, so they produce no new tuple version and no RETURNING row.
+    With skip_newer, stored rows fetched later than the incoming ones are kept
+    (used when replaying old batches).
+    """
+    update_cols = [col for col in columns if col != primary_key]
+    update_set = ', '.join([f"{col} = EXCLUDED.{col}" for col in update_cols])
+    conflict_sql = f"ON CONFLICT ({primary_key}) DO UPDATE SET {update_set}"
+    conditions = []
+    if only_changed:
+        conditions.append(f"{table_name}.{ROW_HASH_COLUMN} IS DISTINCT FROM EXCLUDED.{ROW_HASH_COLUMN}")
+    if skip_newer and 'fetched_timestamp' in columns:
+        conditions.append(
+            f"({table_name}.fetched_timestamp IS NULL "
+            f"OR {table_name}.fetched_timestamp <= EXCLUDED.fetched_timestamp)"
+        )
+    if conditions:
+        conflict_sql += " WHERE " + " AND ".join(conditions)
+    return conflict_sql
+
+
+def build_upsert_sql(
+        table_name: str,
+        columns: list,
+        primary_key: str,
+        only_changed: bool = False,
+        skip_newer: bool = False
+) -> str:
+    """Build the executemany upsert statement, returning whether each row was inserted."""
+    conflict_sql = upsert_conflict_sql(table_name, columns, primary_key, only_changed, skip_newer)
+    return f"""
+    INSERT INTO {table_name} ({', '.join(columns)})
+    VALUES ({', '.join(['%s'] * len(columns))})
+    {conflict_sql}
+    RETURNING (xmax = 0) AS inserted;
+    """
+
+
+def build_history_insert_sql(table_name: str, columns: list) -> str:
+    """Build the executemany insert statement of snapshot history tables (hist_id auto-generated)."""
+    return f"""
+    INSERT INTO {table_name} ({', '.join(columns)})
+    VALUES ({', '.join(['%s'] * len(columns))})
+    RETURNING hist_id;
+    """
+
+
+def run_batch(sql: str, batch_data: list, table_name: str) -> list:
+    """
+    Run one executemany batch on a pooled connection and commit it.
+
+    Transient errors (psycopg.OperationalError: lost connections, deadlocks,
+    serialization failures, lock and pool timeouts) are retried BATCH_RETRIES
+    times with exponential backoff and jitter. Other errors, and the last
+    transient one, are raised.
+
+    Returns the RETURNING rows of every statement in the batch.
+    """
+    for attempt in range(BATCH_RETRIES + 1):
+        try:
+            with get_connection() as batch_conn:
+                with batch_conn.cursor() as batch_cur:
+                    batch_cur.executemany(sql, batch_data, returning=True)
+                    # Each statement returns its own result set (empty for skipped rows)
+                    results = []
+                    while True:
+                        results.extend(batch_cur.fetchall())
+                        if not batch_cur.nextset():
+                            break
+                    batch_conn.commit()
+                    return results
+        except psycopg.OperationalError as e:
+            if attempt == BATCH_RETRIES:
+                raise
+            delay = BATCH_BACKOFF * 2 ** attempt * (1 + random.random() / 2)
+            logger.warning(
+                f"[{table_name}] Batch attempt {attempt + 1}/{BATCH_RETRIES + 1} failed, "
+                f"retrying in {delay:.1f} s: {e}"
+            )
+            time.sleep(delay)
+
+
+def copy_upsert(
+        conn,
+        df: pd.DataFrame,
+        table_name: str,
+        primary_key: str,
+        only_changed: bool = False
+) -> tuple[int, int]:
+    """
+    Stream a DataFrame into a temp staging table with COPY, then merge it into
+    the target table with a single INSERT ... SELECT ... ON CONFLICT DO UPDATE.
+
+    The frame must not contain duplicate primary keys (one statement cannot
+    update the same row twice). The caller owns the transaction.
+    With only_changed, rows with an unchanged ROW_HASH_COLUMN are skipped.
+
+    Returns
+    -------
+    tuple[int, int]
+        (inserts, updates) counted from the RETURNING clause of the merge.
+    """
+    columns = list(df.columns)
+    cols_sql = ', '.join(columns)
+    stage_name = f"stage_{table_name}"
+    conflict_sql = upsert_conflict_sql(table_name, columns, primary_key, only_changed)
+
+    with conn.cursor(row_factory=tuple_row) as cur:
+        copy_to_stage(cur, df, stage_name, table_name)
+
+        cur.execute(f"""
+        WITH upserted AS (
+            INSERT INTO {table_name} ({cols_sql})
+            SELECT {cols_sql} FROM {stage_name}
+            {conflict_sql}
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT
+            COUNT(*) FILTER (WHERE inserted) AS inserts,
+            COUNT(*) FILTER (WHERE NOT inserted) AS updates
+        FROM upserted;
+        """)
+        inserts, updates = cur.fetchone()
+
+    return inserts, updates
+
+
+_INDEXES_SQL = """
+SELECT i.relname, pg_get_indexdef(i.oid), c.conname, pg_get_constraintdef(c.oid)
+FROM pg_index x
+JOIN pg_class i ON i.oid = x.indexrelid
+LEFT JOIN pg_constraint c ON c.conindid = x.indexrelid AND c.conrelid = x.indrelid
+WHERE x.indrelid = to_regclass(%s);
+"""
+
+
+def has_dependents(cur, table_name: str) -> bool:
+    """True if views or foreign keys reference the table, which a swap would break."""
+    cur.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_depend "
+        "WHERE refclassid = 'pg_class'::regclass AND refobjid = to_regclass(%s) AND deptype = 'n');",
+        (table_name,)
+    )
+    return cur.fetchone()[0]
+
+
+def swap_load(
+        conn,
+        df: pd.DataFrame,
+        table_name: str,
+        primary_key: str,
+        truncate: bool = False,
+        only_changed: bool = False
+) -> tuple[int, int]:
+    """
+    Build a complete replacement of table_name in a shadow table and swap it in.
+
+    The shadow is loaded with COPY, then gets the live table's indexes,
+    constraints and grants and is ANALYZEd. The swap (DROP live, RENAME shadow)
+    is the only step that takes an ACCESS EXCLUSIVE lock, so readers see either
+    the old or the new table, never a half-loaded one, and are blocked for
+    milliseconds. Nothing is committed before the swap: a failed load leaves
+    the live table untouched.
+
+    With truncate the shadow holds only the frame's rows, otherwise live rows
+    whose key is not in the frame are carried over (upsert semantics). With
+    only_changed, rows with an unchanged ROW_HASH_COLUMN keep their stored
+    fetched_timestamp. The caller commits.
+
+    Returns
+    -------
+    tuple[int, int]
+        (inserts, updates) relative to the live table.
+    """
+    shadow_name = f"{table_name}_shadow"
+    columns = list(df.columns)
+
+    with conn.cursor(row_factory=tuple_row) as cur:
+        live_types = get_table_columns(cur, table_name) or {}
+        missing_cols = [col for col in live_types if col not in columns]
+
+        cur.execute(f"DROP TABLE IF EXISTS {shadow_name};")
+        cur.execute(f"CREATE TABLE {shadow_name} (LIKE {table_name} INCLUDING DEFAULTS INCLUDING COMMENTS);")
+        copy_dataframe(cur, df, shadow_name, live_types)
+
+        # Count against the live table before anything changes
+        changed_sql = f"s.{ROW_HASH_COLUMN} IS DISTINCT FROM l.{ROW_HASH_COLUMN}" if only_changed else "TRUE"
+        cur.execute(f"""
+        SELECT
+            COUNT(*) FILTER (WHERE l.{primary_key} IS NULL) AS inserts,
+            COUNT(*) FILTER (WHERE l.{primary_key} IS NOT NULL AND {changed_sql}) AS updates
+        FROM {shadow_name} s
+        LEFT JOIN {table_name} l ON l.{primary_key} = s.{primary_key};
+        """)
+        inserts, updates = cur.fetchone()
+
+        if not truncate:
+            # Columns the frame no longer has keep their stored values, like an upsert
+            set_cols = [f"{col} = l.{col}" for col in missing_cols]
+            if only_changed and 'fetched_timestamp' in columns:
+                set_cols.append(
+                    f"fetched_timestamp = CASE WHEN s.{ROW_HASH_COLUMN} = l.{ROW_HASH_COLUMN} "
+                    f"THEN l.fetched_timestamp ELSE s.fetched_timestamp END"
+                )
+            if set_cols:
+                cur.execute(
+                    f"UPDATE {shadow_name} s SET {', '.join(set_cols)} "
+                    f"FROM {table_name} l WHERE l.{primary_key} = s.{primary_key};"
+                )
+            live_cols_sql = ', '.join(live_types)
+            cur.execute(f"""
+            INSERT INTO {shadow_name} ({live_cols_sql})
+            SELECT {live_cols_sql} FROM {table_name} l
+            WHERE NOT EXISTS (SELECT 1 FROM {shadow_name} s WHERE s.{primary_key} = l.{primary_key});
+            """)
+            logger.info(f"[{table_name}] SWAP carried over {cur.rowcount} rows not in the frame.")
+
+        # Indexes are built after the load, under temporary names until the swap
+        cur.execute(_INDEXES_SQL, (table_name,))
+        renames = []
+        for index_name, index_def, constraint_name, constraint_def in cur.fetchall():
+            swap_index = f"{index_name[:57]}_swap"
+            if constraint_name is not None:
+                cur.execute(f"ALTER TABLE {shadow_name} ADD CONSTRAINT {swap_index} {constraint_def};")
+                renames.append(f"ALTER TABLE {table_name} RENAME CONSTRAINT {swap_index} TO {constraint_name};")
+            else:
+                cur.execute(re.sub(
+                    r'^(CREATE (?:UNIQUE )?INDEX )\S+ ON (?:ONLY )?\S+ ',
+                    rf'\g<1>{swap_index} ON {shadow_name} ',
+                    index_def
+                ) + ';')
+                renames.append(f"ALTER INDEX {swap_index} RENAME TO {index_name};")
+
+        cur.execute(
+            "SELECT grantee, privilege_type FROM information_schema.role_table_grants "
+            "WHERE table_schema = current_schema() AND table_name = %s AND grantee <> grantor;",
+            (table_name,)
+        )
+        for grantee, privilege in cur.fetchall():
+            grantee_sql = grantee if grantee == 'PUBLIC' else f'"{grantee}"'
+            cur.execute(f"GRANT {privilege} ON {shadow_name} TO {grantee_sql};")
+
+        cur.execute(f"ANALYZE {shadow_name};")
+        logger.info(f"[{table_name}] SWAP shadow table {shadow_name} built.")
+
+        # Short lock waits with retries instead of queueing readers behind a long one
+        cur.execute(f"SET LOCAL lock_timeout = {int(SWAP_LOCK_TIMEOUT_MS)};")
+        for attempt in range(1, SWAP_LOCK_RETRIES + 1):
+            try:
+                with conn.transaction():
+                    started = time.perf_counter()
+                    cur.execute(f"DROP TABLE {table_name};")
+                    cur.execute(f"ALTER TABLE {shadow_name} RENAME TO {table_name};")
+                    for rename_sql in renames:
+                        cur.execute(rename_sql)
+                break
+            except psycopg.errors.LockNotAvailable:
+                if attempt == SWAP_LOCK_RETRIES:
+                    raise
+                logger.warning(
+                    f"[{table_name}] SWAP lock not granted within {SWAP_LOCK_TIMEOUT_MS} ms "
+                    f"(attempt {attempt}/{SWAP_LOCK_RETRIES}), retrying."
+                )
+                time.sleep(SWAP_RETRY_DELAY)
+        logger.info(f"[{table_name}] SWAP done, lock held {(time.perf_counter() - started) * 1000:.0f} ms.")
+
+        forget_table(shadow_name)
+        refresh_table(cur, table_name)
+
+    return inserts, updates
+
+
+def executemany_upsert(
+        df: pd.DataFrame,
+        table_name: str,
+        primary_key: str,
+        batch_size: int = 1000,
+        only_changed: bool = False
+) -> tuple[int, int, int]:
+    """
+    Upsert a DataFrame in batches of executemany INSERT ... ON CONFLICT statements
+    spread over up to four worker connections borrowed from the shared pool.
+
+    Batches that still fail after run_batch's retries are dead-lettered
+    (see write_failed_batch) instead of failing the whole load.
+
+    Returns
+    -------
+    tuple[int, int, int]
+        (inserts, updates, failed rows) summed over all batches.
+    """
+    upsert_sql = build_upsert_sql(table_name, list(df.columns), primary_key, only_changed)
+    replay_spec = {"kind": "upsert", "table": table_name, "primary_key": primary_key, "only_changed": only_changed}
+
+    # Function to execute a batch and count inserts/updates
+    def execute_batch(batch_df):
+        batch_data = [tuple(row) for row in batch_df.itertuples(index=False)]
+        try:
+            results = run_batch(upsert_sql, batch_data, table_name)
+        except Exception as e:
+            logger.error(f"[{table_name}] Batch execution error: {e}")
+            write_failed_batch(batch_df, replay_spec, e)
+            return 0, 0, len(batch_df)
+        inserts = sum(1 for (inserted,) in results if inserted)
+        return inserts, len(results) - inserts, 0
+
+    # Parallel insertion using ThreadPoolExecutor, leaving one pooled connection for the caller
+    total_inserts = 0
+    total_updates = 0
+    total_failed = 0
+    futures = []
+    with ThreadPoolExecutor(max_workers=max(1, min(4, POOL_MAX_SIZE - 1))) as executor:
+        for i in range(0, len(df), batch_size):
+            futures.append(executor.submit(execute_batch, df.iloc[i:i + batch_size]))
+
+        for future in as_completed(futures):
+            inserts, updates, failed = future.result()
+            total_inserts += inserts
+            total_updates += updates
+            total_failed += failed
+
+    return total_inserts, total_updates, total_failed
+
+
+def executemany_history(df: pd.DataFrame, table_name: str, batch_size: int = 1000) -> tuple[int, int]:
+    """
+    Append a DataFrame to a snapshot history table in executemany batches
+    spread over up to four worker connections borrowed from the shared pool.
+
+    Failing batches are retried and dead-lettered like in executemany_upsert.
+
+    Returns
+    -------
+    tuple[int, int]
+        (inserts, failed rows) summed over all batches.
+    """
+    insert_sql = build_history_insert_sql(table_name, list(df.columns))
+    replay_spec = {"kind": "history", "table": table_name}
+
+    # Function to execute a batch and count inserts
+    def execute_batch(batch_df):
+        batch_data = [tuple(row) for row in batch_df.itertuples(index=False)]
+        try:
+            return len(run_batch(insert_sql, batch_data, table_name)), 0  # All are inserts
+        except Exception as e:
+            logger.error(f"[{table_name}] Batch execution error: {e}")
+            write_failed_batch(batch_df, replay_spec, e)
+            return 0, len(batch_df)
+
+    # Parallel insertion using ThreadPoolExecutor, leaving one pooled connection for the caller
+    total_inserts = 0
+    total_failed = 0
+    futures = []
+    with ThreadPoolExecutor(max_workers=max(1, min(4, POOL_MAX_SIZE - 1))) as executor:
+        for i in range(0, len(df), batch_size):
+            futures.append(executor.submit(execute_batch, df.iloc[i:i + batch_size]))
+
+        for future in as_completed(futures):
+            inserts, failed = future.result()
+            total_inserts += inserts
+            total_failed += failed
+
+    return total_inserts, total_failed
+
+
 def load_to_postgres(
         df: pd.DataFrame,
         dept: str,
@@ -15,121 +455,216 @@ def load_to_postgres(
         primary_key: str = 'id',
         truncate: bool = False,
         creds_file: str = 'credentials/postgres.json',
-        batch_size: int = 1000
-) -> None:
+        batch_size: int = 1000,
+        strategy: str = 'auto',
+        change_detection: bool = False
+) -> dict:
     """
     Load a pandas DataFrame to PostgreSQL with upsert functionality (psycopg 3.x).
+    Returns {"table", "inserts", "updates", "unchanged", "rows"}.
+
+    strategy:
+        'auto'        - COPY + staging upsert for frames with at least
+                        COPY_THRESHOLD_ROWS rows, executemany batches otherwise.
+                        Falls back to executemany if the COPY load fails.
+        'copy'        - always use COPY + staging upsert.
+        'executemany' - always use the threaded executemany batches.
+        'swap'        - build a full replacement in a shadow table and swap it
+                        in with a rename (see swap_load), so readers never see
+                        a half-loaded table. 'auto' uses it when truncate=True.
+                        Tables that views or foreign keys depend on fall back
+                        to TRUNCATE + load.
+
+    change_detection:
+        Store a content hash of every row (fetched_timestamp excluded) in
+        ROW_HASH_COLUMN ('_row_hash') and only write rows whose hash changed.
+        The column is internal to the loader: it is a regular column that
+        SELECT * returns, so it carries the column comment ROW_HASH_COMMENT
+        and BI queries and exports should list their columns without it.
     """
+    if strategy not in ('auto', 'copy', 'executemany', 'swap'):
+        raise ValueError(f"Unknown load strategy: {strategy}")
+
     df_name = getattr(df, "name", "unidentified")
     logger.info(f"{'=' * 5} Loading to postgres for: {df_name}\n")
 
-    # Load credentials
-    with open(creds_file, 'r') as f:
-        creds = json.load(f)
-
-    conn_params = {
-        'host': creds['host'],
-        'port': creds['port'],
-        'dbname': creds['database'],
-        'user': creds['user'],
-        'password': creds['password']
-    }
-
     # delete duplicate columns if they exist
     df = df.loc[:, ~df.columns.duplicated()]
 
-    # Map pandas dtypes to PostgreSQL types
-    def map_dtype_to_pg(dtype, col_name):
-        if pd.api.types.is_bool_dtype(dtype):
-            return 'BOOLEAN'
-        elif pd.api.types.is_integer_dtype(dtype):
-            return 'BIGINT'
-        elif pd.api.types.is_float_dtype(dtype):
-            return 'DOUBLE PRECISION'
-        elif pd.api.types.is_datetime64_any_dtype(dtype) or 'timestamp' in col_name.lower():
-            return 'TIMESTAMP'
-        else:
-            return 'TEXT'
-
     # Table name with postfix
     table_name = f"{dept}_{table_base_name}_{postfix}"
 
-    # Connect using psycopg3
-    with psycopg.connect(**conn_params, row_factory=dict_row) as conn:
+    # Drop duplicate keys, the last occurrence wins
+    duplicated = df.duplicated(subset=[primary_key], keep='last')
+    if duplicated.any():
+        logger.warning(f"[{table_name}] Dropping {duplicated.sum()} rows with duplicate {primary_key}.")
+        df = df.loc[~duplicated]
+
+    # Fingerprint rows for change detection
+    if change_detection:
+        df = df.assign(**{ROW_HASH_COLUMN: row_fingerprint(df)})
+
+    # Map pandas dtypes to PostgreSQL types
+    pg_types = {col: map_dtype_to_pg(df[col].dtype, col) for col in df.columns}
+
+    # Borrow a connection from the shared pool
+    with get_connection(creds_file) as conn:
         with conn.cursor() as cur:
             try:
-                # Create table IF NOT EXISTS
+                # Create the table if missing, otherwise only add new columns / widen types
                 create_table_sql = f"""
                 CREATE TABLE IF NOT EXISTS {table_name} (
                 """
                 columns_def = []
-                for col in df.columns:
-                    pg_type = map_dtype_to_pg(df[col].dtype, col)
+                for col, pg_type in pg_types.items():
                     columns_def.append(f'    {col} {pg_type}')
                     if col == primary_key:
                         columns_def[-1] += ' PRIMARY KEY'
 
                 create_table_sql += ',\n'.join(columns_def) + '\n);'
-                cur.execute(create_table_sql)
-                conn.commit()
+                schema_ddl = ensure_table_schema(cur, table_name, pg_types, create_table_sql)
+                if change_detection and any(ROW_HASH_COLUMN in stmt for stmt in schema_ddl):
+                    cur.execute(f"COMMENT ON COLUMN {table_name}.{ROW_HASH_COLUMN} IS '{ROW_HASH_COMMENT}';")
+                if schema_ddl:
+                    conn.commit()
                 logger.info(f"[{table_name}] Table created or verified.")
 
-                # Truncate table if requested
-                if truncate:
+                use_swap = strategy == 'swap' or (strategy == 'auto' and truncate)
+                if use_swap and has_dependents(cur, table_name):
+                    logger.warning(f"[{table_name}] Views or foreign keys depend on the table, not swapping.")
+                    use_swap = False
+
+                # Truncate table if requested (a swap replaces the table instead)
+                if truncate and not use_swap:
                     truncate_sql = f"TRUNCATE TABLE {table_name};"
                     cur.execute(truncate_sql)
                     conn.commit()
                     logger.info(f"[{table_name}] Table truncated.")
 
-                # Prepare upsert SQL
-                update_cols = [col for col in df.columns if col != primary_key]
-                update_set = ', '.join([f"{col} = EXCLUDED.{col}" for col in update_cols])
-
-                upsert_sql = f"""
-                INSERT INTO {table_name} ({', '.join(df.columns)})
-                VALUES ({', '.join(['%s'] * len(df.columns))})
-                ON CONFLICT ({primary_key}) DO UPDATE SET {update_set}
-                RETURNING (xmax = 0) AS inserted;
-                """
+                total_inserts = None
+                total_updates = None
+                total_failed = 0
+                total_rows = len(df)
 
-                # Function to execute a batch and count inserts/updates
-                def execute_batch(batch_data):
+                use_copy = strategy == 'copy' or (strategy == 'auto' and total_rows >= COPY_THRESHOLD_ROWS)
+                if use_swap:
+                    total_inserts, total_updates = swap_load(
+                        conn, df, table_name, primary_key, truncate=truncate, only_changed=change_detection
+                    )
+                    conn.commit()
+                    logger.info(f"[{table_name}] Loaded with shadow table swap.")
+                elif use_copy:
                     try:
-                        with psycopg.connect(**conn_params) as batch_conn:
-                            with batch_conn.cursor() as batch_cur:
-                                batch_cur.executemany(upsert_sql, batch_data, returning=True)
-                                results = batch_cur.fetchall()
-                                batch_conn.commit()
-                                inserts = sum(1 for (inserted,) in results if inserted)
-                                updates = len(results) - inserts
-                                return inserts, updates
-                    except Exception as e:
-                        logger.error(f"[{table_name}] Batch execution error: {e}")
-                        return 0, 0
-
-                # Parallel insertion using ThreadPoolExecutor
-                total_inserts = 0
-                total_updates = 0
-                total_rows = len(df)
-                futures = []
-                with ThreadPoolExecutor(max_workers=4) as executor:
-                    for i in range(0, len(df), batch_size):
-                        batch_df = df.iloc[i:i + batch_size]
-                        batch_data = [tuple(row) for row in batch_df.itertuples(index=False)]
-                        futures.append(executor.submit(execute_batch, batch_data))
-
-                    for future in as_completed(futures):
-                        inserts, updates = future.result()
-                        total_inserts += inserts
-                        total_updates += updates
-                logger.info(f"inserts made: {total_inserts}, updates made: {total_updates}, total rows: {total_rows}")
+                        total_inserts, total_updates = copy_upsert(
+                            conn, df, table_name, primary_key, only_changed=change_detection
+                        )
+                        conn.commit()
+                        logger.info(f"[{table_name}] Loaded with COPY + staging upsert.")
+                    except psycopg.Error as e:
+                        conn.rollback()
+                        if strategy == 'copy':
+                            raise
+                        logger.warning(f"[{table_name}] COPY load failed, falling back to executemany: {e}")
+                        total_inserts = None
+
+                if total_inserts is None:
+                    total_inserts, total_updates, total_failed = executemany_upsert(
+                        df, table_name, primary_key, batch_size, only_changed=change_detection
+                    )
+                total_unchanged = total_rows - total_inserts - total_updates - total_failed
+                logger.info(
+                    f"inserts made: {total_inserts}, updates made: {total_updates}, "
+                    f"unchanged: {total_unchanged}, failed: {total_failed}, total rows: {total_rows}"
+                )
+                result = {
+                    "table": table_name, "inserts": total_inserts, "updates": total_updates,
+                    "unchanged": total_unchanged, "failed": total_failed, "rows": total_rows
+                }
             except Exception as e:
                 logger.error(f"[{table_name}] Error during load: {e}")
                 conn.rollback()
+                # DDL of the failed transaction is gone, re-read the catalog next time
+                forget_table(table_name)
                 raise
             finally:
-                logger.info(f"[{table_name}] PostgreSQL connection closed.")
+                logger.info(f"[{table_name}] PostgreSQL connection returned to pool.")
+                log_pool_stats(table_name)
     logger.info(f"Loading to postgres for: {df_name} finished.")
+    return result
+
+
+def history_table_sql(table_name: str, pg_types: dict, partitioned: bool) -> str:
+    """
+    CREATE statement(s) for a snapshot history table with auto-generated hist_id.
+
+    Partitioned tables are ranged by month on fetched_timestamp, so the primary
+    key has to include it. hist_id comes from a bigint sequence named like a
+    SERIAL one, which lets migrated tables keep their hist_id values.
+    """
+    columns_def = ',\n'.join(
+        f'        {col} {pg_type}' for col, pg_type in pg_types.items() if col != 'hist_id'
+    )
+    if not partitioned:
+        return f"""
+    CREATE TABLE IF NOT EXISTS {table_name} (
+        hist_id SERIAL PRIMARY KEY,
+{columns_def}
+    );
+    """
+    return f"""
+    CREATE SEQUENCE IF NOT EXISTS {table_name}_hist_id_seq AS BIGINT;
+    ALTER SEQUENCE {table_name}_hist_id_seq AS BIGINT;
+    CREATE TABLE IF NOT EXISTS {table_name} (
+        hist_id BIGINT NOT NULL DEFAULT nextval('{table_name}_hist_id_seq'),
+{columns_def},
+        PRIMARY KEY (hist_id, fetched_timestamp)
+    ) PARTITION BY RANGE (fetched_timestamp);
+    ALTER SEQUENCE {table_name}_hist_id_seq OWNED BY {table_name}.hist_id;
+    """
+
+
+def migrate_history_to_partitions(cur, table_name: str) -> bool:
+    """
+    Move a plain snapshot history table into the monthly partitioned layout.
+
+    The old table is kept as <table_name>_unpartitioned (with any rows lacking a
+    fetched_timestamp, which no partition can hold); hist_id values and their
+    sequence carry over. The caller commits.
+
+    Returns False, leaving the table alone, when it has no TIMESTAMP
+    fetched_timestamp column to partition on.
+    """
+    legacy_types = get_table_columns(cur, table_name)
+    if legacy_types.get('fetched_timestamp') != 'timestamp without time zone':
+        logger.warning(f"[{table_name}] HISTORY 🗂 No TIMESTAMP fetched_timestamp, keeping the table unpartitioned.")
+        return False
+
+    old_name = f"{table_name}_unpartitioned"
+    cur.execute(f"ALTER TABLE {table_name} RENAME TO {old_name};")
+    # Frees the constraint name for the new table's primary key
+    cur.execute(f"ALTER INDEX IF EXISTS {table_name}_pkey RENAME TO {old_name}_pkey;")
+    forget_table(table_name)
+    refresh_table(cur, old_name)
+
+    cur.execute(
+        f"SELECT DISTINCT date_trunc('month', fetched_timestamp) FROM {old_name} "
+        f"WHERE fetched_timestamp IS NOT NULL;"
+    )
+    months = [pd.Timestamp(month).to_period('M') for (month,) in cur.fetchall()]
+
+    ensure_table_schema(cur, table_name, legacy_types, history_table_sql(table_name, legacy_types, partitioned=True))
+    ensure_month_partitions(cur, table_name, months)
+
+    cols_sql = ', '.join(['hist_id'] + [col for col in legacy_types if col != 'hist_id'])
+    cur.execute(
+        f"INSERT INTO {table_name} ({cols_sql}) SELECT {cols_sql} FROM {old_name} "
+        f"WHERE fetched_timestamp IS NOT NULL;"
+    )
+    logger.info(
+        f"[{table_name}] HISTORY 🗂 migrated {cur.rowcount} rows into {len(months)} monthly partitions. "
+        f"Old table kept as {old_name}."
+    )
+    return True
 
 
 def load_history_to_postgres(
@@ -140,64 +675,86 @@ def load_history_to_postgres(
         primary_key: str = 'id',  # This is now the original key, but not used as PK
         truncate: bool = False,
         creds_file: str = 'credentials/postgres.json',
-        batch_size: int = 1000
-) -> None:
+        batch_size: int = 1000,
+        mode: str = 'snapshot',
+        scope_column: str = None,
+        tombstones: bool = True
+) -> dict:
     """
     Load a pandas DataFrame to PostgreSQL by appending new historical values with auto-generated primary key.
+    Returns {"table", "inserts", "rows"} in snapshot mode, see load_history_scd2 for scd2.
+
+    mode:
+        'snapshot' - append the whole DataFrame on every run.
+        'scd2'     - keep one version per key and content in
+                     <dept>_<base>_history_scd2_<postfix> (valid_from / valid_to)
+                     and expose per-run snapshots through a view under the usual
+                     history table name. See load_history_scd2.
+
+    scope_column / tombstones (scd2 only):
+        Keys missing from the DataFrame get a tombstone version, but only among
+        keys whose scope_column value (e.g. 'filial') occurs in the DataFrame.
+        Pass tombstones=False when the DataFrame is not a complete extract.
     """
+    if mode not in ('snapshot', 'scd2'):
+        raise ValueError(f"Unknown history mode: {mode}")
+
     df_name = getattr(df, "name", "unidentified")
     logger.info(f"{'=' * 5} Loading to postgres for: {df_name}\n")
 
-    # Load credentials
-    with open(creds_file, 'r') as f:
-        creds = json.load(f)
-
-    conn_params = {
-        'host': creds['host'],
-        'port': creds['port'],
-        'dbname': creds['database'],
-        'user': creds['user'],
-        'password': creds['password']
-    }
-
     # delete duplicate columns if they exist
     df = df.loc[:, ~df.columns.duplicated()]
 
     # Map pandas dtypes to PostgreSQL types
-    def map_dtype_to_pg(dtype, col_name):
-        if pd.api.types.is_bool_dtype(dtype):
-            return 'BOOLEAN'
-        elif pd.api.types.is_integer_dtype(dtype):
-            return 'BIGINT'
-        elif pd.api.types.is_float_dtype(dtype):
-            return 'DOUBLE PRECISION'
-        elif pd.api.types.is_datetime64_any_dtype(dtype) or 'timestamp' in col_name.lower():
-            return 'TIMESTAMP'
-        elif 'pickup_time' in col_name.lower():
-            return 'TIME'
-        else:
-            return 'TEXT'
+    pg_types = {col: map_dtype_to_pg(df[col].dtype, col, time_columns=('pickup_time',)) for col in df.columns}
 
     # Table name with postfix
     table_name = f"{dept}_{table_base_name}_history_{postfix}"
 
-    # Connect using psycopg3
-    with psycopg.connect(**conn_params, row_factory=dict_row) as conn:
+    if mode == 'scd2':
+        storage_name = f"{dept}_{table_base_name}_history_scd2_{postfix}"
+        with get_connection(creds_file) as conn:
+            try:
+                result = load_history_scd2(
+                    conn, df, table_name, storage_name, primary_key, pg_types,
+                    scope_column=scope_column, tombstones=tombstones, truncate=truncate
+                )
+            except Exception as e:
+                logger.error(f"[{table_name}] Error during load: {e}")
+                conn.rollback()
+                # DDL of the failed transaction is gone, re-read the catalog next time
+                forget_table(table_name)
+                forget_table(storage_name)
+                raise
+            finally:
+                logger.info(f"[{table_name}] PostgreSQL connection returned to pool.")
+                log_pool_stats(table_name)
+        logger.info(f"Loading to postgres for: {df_name} HISTORY 🗂 finished.")
+        return result
+
+    # Borrow a connection from the shared pool
+    with get_connection(creds_file) as conn:
         with conn.cursor() as cur:
             try:
-                # Create table IF NOT EXISTS with auto-generated hist_id as PRIMARY KEY
-                create_table_sql = f"""
-                 CREATE TABLE IF NOT EXISTS {table_name} (
-                     hist_id SERIAL PRIMARY KEY,
-                 """
-                columns_def = []
-                for col in df.columns:
-                    pg_type = map_dtype_to_pg(df[col].dtype, col)
-                    columns_def.append(f'    {col} {pg_type}')
+                # Monthly partitions on fetched_timestamp, plain tables for frames without it
+                has_timestamp = pg_types.get('fetched_timestamp') == 'TIMESTAMP'
+                kind = get_table_kind(cur, table_name)
+                partitioned = is_partitioned(cur, table_name) if kind else has_timestamp
+                if kind == 'BASE TABLE' and not partitioned and has_timestamp:
+                    partitioned = migrate_history_to_partitions(cur, table_name)
+                    conn.commit()
+                if partitioned and not has_timestamp:
+                    raise ValueError(f"[{table_name}] Partitioned history needs a fetched_timestamp column.")
 
-                create_table_sql += ',\n'.join(columns_def) + '\n);'
-                cur.execute(create_table_sql)
-                conn.commit()
+                # Create table if missing with auto-generated hist_id as PRIMARY KEY,
+                # otherwise only add new columns / widen types
+                create_table_sql = history_table_sql(table_name, pg_types, partitioned)
+                ddl = ensure_table_schema(cur, table_name, pg_types, create_table_sql)
+                if partitioned:
+                    ddl += ensure_month_partitions(cur, table_name, months_of(df['fetched_timestamp']))
+                    ddl += apply_retention(cur, table_name)
+                if ddl:
+                    conn.commit()
                 logger.info(f"[{table_name}] HISTORY 🗂 Table created or verified.")
 
                 # Truncate table if requested (note: does not reset serial by default)
@@ -207,45 +764,431 @@ def load_history_to_postgres(
                     conn.commit()
                     logger.info(f"[{table_name}] Table truncated.")
 
-                # Prepare insert SQL without ON CONFLICT, hist_id auto-generated
-                insert_sql = f"""
-                 INSERT INTO {table_name} ({', '.join(df.columns)})
-                 VALUES ({', '.join(['%s'] * len(df.columns))})
-                 RETURNING hist_id;
-                 """
-
-                # Function to execute a batch and count inserts
-                def execute_batch(batch_data):
-                    try:
-                        with psycopg.connect(**conn_params) as batch_conn:
-                            with batch_conn.cursor() as batch_cur:
-                                batch_cur.executemany(insert_sql, batch_data, returning=True)
-                                results = batch_cur.fetchall()
-                                batch_conn.commit()
-                                inserts = len(results)  # All are inserts
-                                return inserts
-                    except Exception as e:
-                        logger.error(f"[{table_name}] Batch execution error: {e}")
-                        return 0
-
-                # Parallel insertion using ThreadPoolExecutor
-                total_inserts = 0
                 total_rows = len(df)
-                futures = []
-                with ThreadPoolExecutor(max_workers=4) as executor:
-                    for i in range(0, len(df), batch_size):
-                        batch_df = df.iloc[i:i + batch_size]
-                        batch_data = [tuple(row) for row in batch_df.itertuples(index=False)]
-                        futures.append(executor.submit(execute_batch, batch_data))
-
-                    for future in as_completed(futures):
-                        inserts = future.result()
-                        total_inserts += inserts
-                logger.info(f"Total inserts made: {total_inserts}, total rows: {total_rows}")
+                total_inserts, total_failed = executemany_history(df, table_name, batch_size)
+                logger.info(f"Total inserts made: {total_inserts}, failed: {total_failed}, total rows: {total_rows}")
+                result = {"table": table_name, "inserts": total_inserts, "failed": total_failed, "rows": total_rows}
             except Exception as e:
                 logger.error(f"[{table_name}] Error during load: {e}")
                 conn.rollback()
+                # DDL of the failed transaction is gone, re-read the catalog next time
+                forget_table(table_name)
                 raise
             finally:
-                logger.info(f"[{table_name}] PostgreSQL connection closed.")
-    logger.info(f"Loading to postgres for: {df_name} HISTORY 🗂 finished.")
\ No newline at end of file
+                logger.info(f"[{table_name}] PostgreSQL connection returned to pool.")
+                log_pool_stats(table_name)
+    logger.info(f"Loading to postgres for: {df_name} HISTORY 🗂 finished.")
+    return result
+
+
+def replay_failed_batches(table_name: str = None) -> dict:
+    """
+    Reload dead-lettered batches (see write_failed_batch), oldest first.
+
+    Upserts keep stored rows that were fetched later than the replayed ones,
+    history rows are appended (their monthly partitions are recreated if
+    needed). Replayed batches are removed; batches that fail again stay for
+    the next attempt.
+
+    Run with: python -c "from src.etl.load import replay_failed_batches; replay_failed_batches()"
+
+    Returns {"batches", "rows", "failed"}.
+    """
+    pending = list_failed_batches(table_name)
+    replayed = rows = failed = 0
+    for batch_id, spec in sorted(pending.items(), key=lambda item: item[1]["failed_at"]):
+        try:
+            batch_df = read_failed_batch(spec)
+            columns = list(batch_df.columns)
+            if spec["kind"] == "history":
+                if 'fetched_timestamp' in columns:
+                    with get_connection() as conn:
+                        with conn.cursor() as cur:
+                            if is_partitioned(cur, spec["table"]) and ensure_month_partitions(
+                                    cur, spec["table"], months_of(batch_df['fetched_timestamp'])):
+                                conn.commit()
+                sql = build_history_insert_sql(spec["table"], columns)
+            else:
+                sql = build_upsert_sql(
+                    spec["table"], columns, spec["primary_key"], spec.get("only_changed", False), skip_newer=True
+                )
+            run_batch(sql, [tuple(row) for row in batch_df.itertuples(index=False)], spec["table"])
+        except Exception as e:
+            failed += 1
+            logger.error(f"[{spec['table']}] Replay of {batch_id} failed, keeping it: {e}")
+            continue
+
+        remove_failed_batch(batch_id)
+        replayed += 1
+        rows += len(batch_df)
+        logger.info(f"[{spec['table']}] Replayed {len(batch_df)} rows from {batch_id}.")
+
+    logger.info(f"Failed batches replayed: {replayed} ({rows} rows), still failing: {failed}.")
+    return {"batches": replayed, "rows": rows, "failed": failed}
+
+
+# Bookkeeping columns of SCD2 history storage tables
+SCD2_COLUMNS = ('valid_from', 'valid_to', 'is_tombstone')
+
+
+def create_scd2_storage(cur, storage_name: str, primary_key: str, pg_types: dict) -> list:
+    """
+    Create an SCD2 history storage table and its lookup indexes if missing,
+    otherwise evolve its columns (see ensure_table_schema).
+
+    Returns the DDL executed.
+    """
+    columns_def = ',\n'.join(
+        f'        {col} {pg_type}' for col, pg_type in pg_types.items() if col != 'hist_id'
+    )
+    # Current versions are looked up by key on every run
+    create_sql = f"""
+    CREATE TABLE IF NOT EXISTS {storage_name} (
+        hist_id BIGSERIAL PRIMARY KEY,
+{columns_def},
+        valid_from TIMESTAMP NOT NULL,
+        valid_to TIMESTAMP,
+        is_tombstone BOOLEAN NOT NULL DEFAULT FALSE
+    );
+    CREATE INDEX IF NOT EXISTS {storage_name}_current_idx
+        ON {storage_name} ({primary_key}) WHERE valid_to IS NULL;
+    CREATE INDEX IF NOT EXISTS {storage_name}_key_idx
+        ON {storage_name} ({primary_key}, valid_from);
+    """
+    return ensure_table_schema(cur, storage_name, pg_types, create_sql)
+
+
+def create_scd2_runs(cur, storage_name: str, scope_column: str = None) -> bool:
+    """
+    Create <storage_name>_runs, the log of load runs behind the daily view:
+    one row per run (fetched_timestamp) and scope_column value.
+
+    A storage table that existed before the log is backfilled with the times
+    versions were opened, the only runs it still knows about.
+
+    Returns True if the table was created.
+    """
+    runs_name = f"{storage_name}_runs"
+    if get_table_kind(cur, runs_name) is not None:
+        return False
+
+    scope_expr = f"{scope_column}::text" if scope_column else "NULL::text"
+    cur.execute(f"""
+    CREATE TABLE IF NOT EXISTS {runs_name} (
+        fetched_timestamp TIMESTAMP NOT NULL,
+        scope TEXT
+    );
+    CREATE INDEX IF NOT EXISTS {runs_name}_ts_idx ON {runs_name} (fetched_timestamp);
+    INSERT INTO {runs_name} (fetched_timestamp, scope)
+    SELECT DISTINCT valid_from, {scope_expr} FROM {storage_name};
+    """)
+    refresh_table(cur, runs_name)
+    logger.info(f"[{runs_name}] SCD2 run log created.")
+    return True
+
+
+def record_scd2_run(cur, storage_name: str, stage_name: str, run_ts: str, scope_column: str = None) -> None:
+    """Add the current run (per scope_column value in the stage table) to <storage_name>_runs."""
+    runs_name = f"{storage_name}_runs"
+    if scope_column:
+        cur.execute(f"""
+        INSERT INTO {runs_name} (fetched_timestamp, scope)
+        SELECT DISTINCT %s::timestamp, {scope_column}::text FROM {stage_name};
+        """, (run_ts,))
+    else:
+        cur.execute(f"INSERT INTO {runs_name} (fetched_timestamp, scope) VALUES (%s::timestamp, NULL);", (run_ts,))
+
+
+def create_scd2_daily_view(cur, view_name: str, storage_name: str, scope_column: str = None) -> None:
+    """
+    (Re)create the snapshot view over an SCD2 storage table.
+
+    Compatibility shim for queries written against the old append-only
+    snapshot tables: every load run in <storage_name>_runs is joined with the
+    versions current at that run, with fetched_timestamp = the run time. Only
+    runs that actually happened produce rows, and a version opened and closed
+    on the same day still shows up for its run. Filters on fetched_timestamp
+    narrow the runs first, but a wide range still re-expands one row per key
+    and run; new queries should read the storage table with interval
+    predicates instead, e.g. valid_from <= ts AND (valid_to IS NULL OR valid_to > ts)
+    AND NOT is_tombstone.
+    """
+    columns = [col for col in get_table_columns(cur, storage_name) if col not in SCD2_COLUMNS]
+    select_cols = [
+        "r.fetched_timestamp" if col == 'fetched_timestamp' else f"v.{col}" for col in columns
+    ]
+    if 'fetched_timestamp' not in columns:
+        select_cols.append("r.fetched_timestamp")
+    scope_match = f"(r.scope IS NULL OR r.scope = v.{scope_column}::text)" if scope_column else "TRUE"
+
+    cur.execute(f"DROP VIEW IF EXISTS {view_name};")
+    cur.execute(f"""
+    CREATE VIEW {view_name} AS
+    SELECT {', '.join(select_cols)}
+    FROM {storage_name}_runs r
+    JOIN {storage_name} v
+      ON v.valid_from <= r.fetched_timestamp
+     AND (v.valid_to IS NULL OR v.valid_to > r.fetched_timestamp)
+     AND {scope_match}
+    WHERE NOT v.is_tombstone;
+    """)
+
+
+def migrate_history_to_scd2(
+        cur,
+        history_name: str,
+        storage_name: str,
+        primary_key: str,
+        scope_column: str = None
+) -> None:
+    """
+    One-off compaction of an append-only snapshot history table into SCD2 form.
+
+    For every key only the snapshots whose content differs from the previous
+    snapshot become versions; each version is valid until the next one. Keys
+    that are missing from the latest runs of their scope get a tombstone at
+    the first run they were absent from. Gaps in the middle of a key's history
+    are merged into the surrounding version.
+
+    The snapshot table is kept as <history_name>_snapshots, its runs go to
+    <storage_name>_runs and history_name becomes the snapshot view.
+    """
+    legacy_types = get_table_columns(cur, history_name)
+    if 'fetched_timestamp' not in legacy_types:
+        raise ValueError(f"[{history_name}] Cannot migrate to SCD2 without a fetched_timestamp column.")
+
+    pg_types = {col: pg_type for col, pg_type in legacy_types.items() if col != 'hist_id'}
+    create_scd2_storage(cur, storage_name, primary_key, pg_types)
+    create_scd2_runs(cur, storage_name, scope_column)
+
+    columns = list(pg_types)
+    cols_sql = ', '.join(columns)
+    compare_cols = [col for col in columns if col not in (primary_key, 'fetched_timestamp')]
+    row_text = f"ROW({', '.join(compare_cols)})::text" if compare_cols else "''"
+    scope_expr = f"{scope_column}::text" if scope_column else "NULL::text"
+
+    # Last run each key was seen in, and the first later run of its scope (if any)
+    cur.execute(f"""
+    CREATE TEMP TABLE scd2_gone ON COMMIT DROP AS
+    WITH runs AS (
+        SELECT DISTINCT {scope_expr} AS scope, fetched_timestamp FROM {history_name}
+    ),
+    last_seen AS (
+        SELECT
+            {primary_key},
+            MAX(fetched_timestamp) AS last_ts,
+            (ARRAY_AGG({scope_expr} ORDER BY fetched_timestamp DESC))[1] AS scope
+        FROM {history_name}
+        GROUP BY {primary_key}
+    )
+    SELECT
+        l.{primary_key},
+        l.scope,
+        (
+            SELECT MIN(r.fetched_timestamp) FROM runs r
+            WHERE r.scope IS NOT DISTINCT FROM l.scope AND r.fetched_timestamp > l.last_ts
+        ) AS gone_ts
+    FROM last_seen l;
+    """)
+
+    cur.execute(f"""
+    INSERT INTO {storage_name} ({cols_sql}, valid_from, valid_to)
+    WITH snapshots AS (
+        SELECT DISTINCT ON ({primary_key}, fetched_timestamp)
+            {cols_sql}, {row_text} AS row_text
+        FROM {history_name}
+        ORDER BY {primary_key}, fetched_timestamp, hist_id DESC
+    ),
+    marked AS (
+        SELECT *, LAG(row_text) OVER (PARTITION BY {primary_key} ORDER BY fetched_timestamp) AS prev_text
+        FROM snapshots
+    ),
+    versions AS (
+        SELECT *, LEAD(fetched_timestamp) OVER (PARTITION BY {primary_key} ORDER BY fetched_timestamp) AS next_ts
+        FROM marked
+        WHERE prev_text IS DISTINCT FROM row_text
+    )
+    SELECT {', '.join(f'v.{col}' for col in columns)}, v.fetched_timestamp, COALESCE(v.next_ts, g.gone_ts)
+    FROM versions v
+    JOIN scd2_gone g ON g.{primary_key} = v.{primary_key}
+    ORDER BY v.{primary_key}, v.fetched_timestamp;
+    """)
+    versions = cur.rowcount
+
+    tombstone_cols = [primary_key, 'fetched_timestamp']
+    tombstone_values = [f"g.{primary_key}", "g.gone_ts"]
+    if scope_column:
+        tombstone_cols.append(scope_column)
+        tombstone_values.append(f"g.scope::{pg_types[scope_column]}")
+    cur.execute(f"""
+    INSERT INTO {storage_name} ({', '.join(tombstone_cols)}, valid_from, valid_to, is_tombstone)
+    SELECT {', '.join(tombstone_values)}, g.gone_ts, NULL, TRUE
+    FROM scd2_gone g
+    WHERE g.gone_ts IS NOT NULL;
+    """)
+    tombstones = cur.rowcount
+
+    # Every snapshot run, including runs that changed nothing
+    cur.execute(f"TRUNCATE TABLE {storage_name}_runs;")
+    cur.execute(f"""
+    INSERT INTO {storage_name}_runs (fetched_timestamp, scope)
+    SELECT DISTINCT fetched_timestamp, {scope_expr} FROM {history_name};
+    """)
+
+    cur.execute(f"ALTER TABLE {history_name} RENAME TO {history_name}_snapshots;")
+    forget_table(history_name)
+    refresh_table(cur, f"{history_name}_snapshots")
+    create_scd2_daily_view(cur, history_name, storage_name, scope_column)
+    refresh_table(cur, history_name)
+    logger.info(
+        f"[{history_name}] HISTORY 🗂 migrated to SCD2: {versions} versions, {tombstones} tombstones. "
+        f"Snapshots kept in {history_name}_snapshots."
+    )
+
+
+def load_history_scd2(
+        conn,
+        df: pd.DataFrame,
+        history_name: str,
+        storage_name: str,
+        primary_key: str,
+        pg_types: dict,
+        scope_column: str = None,
+        tombstones: bool = True,
+        truncate: bool = False
+) -> dict:
+    """
+    Apply a DataFrame to an SCD2 history table in one transaction.
+
+    - keys whose content (all columns except fetched_timestamp) changed: the
+      current version is closed (valid_to) and a new version is opened (valid_from);
+    - new keys: a first version is opened;
+    - reopened keys (back after a tombstone): the tombstone is closed and a
+      new version is opened;
+    - keys missing from the DataFrame (within its scope_column values): the
+      current version is closed and a tombstone version is opened;
+    - unchanged keys: nothing is written.
+
+    An existing append-only history table is compacted first (see migrate_history_to_scd2).
+
+    Returns {"table", "opened", "new", "changed", "reopened", "tombstones", "unchanged", "rows"}.
+    """
+    if scope_column and scope_column not in df.columns:
+        raise ValueError(f"[{history_name}] Scope column {scope_column} is missing from the DataFrame.")
+
+    # One version per key, the last occurrence wins
+    df = df.loc[~df.duplicated(subset=[primary_key], keep='last')]
+
+    if 'fetched_timestamp' in df.columns and len(df):
+        run_ts = str(df['fetched_timestamp'].max())
+    else:
+        run_ts = pd.Timestamp.now(tz="Asia/Tashkent").strftime("%Y-%m-%d %H:%M:%S")
+
+    columns = list(df.columns)
+    cols_sql = ', '.join(columns)
+    compare_cols = [col for col in columns if col not in (primary_key, 'fetched_timestamp')]
+    if compare_cols:
+        changed_sql = (
+            f"ROW({', '.join(f'h.{col}' for col in compare_cols)}) IS DISTINCT FROM "
+            f"ROW({', '.join(f's.{col}' for col in compare_cols)})"
+        )
+    else:
+        changed_sql = "FALSE"
+    stage_name = f"stage_{storage_name}"
+
+    with conn.cursor(row_factory=tuple_row) as cur:
+        kind = get_table_kind(cur, history_name)
+        if kind == 'BASE TABLE':
+            migrate_history_to_scd2(cur, history_name, storage_name, primary_key, scope_column)
+            kind = get_table_kind(cur, history_name)
+
+        # The view pins column types, drop it while the storage table changes
+        changes = []
+        if get_table_kind(cur, storage_name) is not None:
+            changes = plan_table_changes(cur, storage_name, pg_types)
+        if changes and kind == 'VIEW':
+            cur.execute(f"DROP VIEW {history_name};")
+            forget_table(history_name)
+            kind = None
+        ddl = create_scd2_storage(cur, storage_name, primary_key, pg_types)
+        # Views from before the run log expanded every calendar day, rebuild them over it
+        if create_scd2_runs(cur, storage_name, scope_column) or kind is None:
+            create_scd2_daily_view(cur, history_name, storage_name, scope_column)
+            refresh_table(cur, history_name)
+            ddl.append(f"CREATE VIEW {history_name}")
+        if ddl:
+            conn.commit()
+        logger.info(f"[{history_name}] HISTORY 🗂 SCD2 table created or verified.")
+
+        if truncate:
+            cur.execute(f"TRUNCATE TABLE {storage_name}, {storage_name}_runs;")
+            conn.commit()
+            logger.info(f"[{storage_name}] Table truncated.")
+
+        copy_to_stage(cur, df, stage_name, storage_name)
+
+        # Close current versions that changed, and tombstones of keys that came back
+        cur.execute(f"""
+        UPDATE {storage_name} h SET valid_to = %s::timestamp
+        FROM {stage_name} s
+        WHERE h.{primary_key} = s.{primary_key}
+          AND h.valid_to IS NULL
+          AND (h.is_tombstone OR {changed_sql})
+        RETURNING h.is_tombstone;
+        """, (run_ts,))
+        closed = [row[0] for row in cur.fetchall()]
+        reopened = sum(closed)
+        changed = len(closed) - reopened
+
+        # Close keys that disappeared and open a tombstone for them
+        removed = 0
+        if tombstones and len(df):
+            scope_filter = ""
+            tombstone_cols = [primary_key]
+            if scope_column:
+                scope_filter = f"AND h.{scope_column} IN (SELECT DISTINCT {scope_column} FROM {stage_name})"
+                tombstone_cols.append(scope_column)
+            if 'fetched_timestamp' in columns:
+                tombstone_values = tombstone_cols + ['%(run_ts)s::timestamp']
+                tombstone_cols = tombstone_cols + ['fetched_timestamp']
+            else:
+                tombstone_values = list(tombstone_cols)
+            cur.execute(f"""
+            WITH gone AS (
+                UPDATE {storage_name} h SET valid_to = %(run_ts)s::timestamp
+                WHERE h.valid_to IS NULL
+                  AND NOT h.is_tombstone
+                  AND NOT EXISTS (SELECT 1 FROM {stage_name} s WHERE s.{primary_key} = h.{primary_key})
+                  {scope_filter}
+                RETURNING h.*
+            )
+            INSERT INTO {storage_name} ({', '.join(tombstone_cols)}, valid_from, is_tombstone)
+            SELECT {', '.join(tombstone_values)}, %(run_ts)s::timestamp, TRUE
+            FROM gone;
+            """, {'run_ts': run_ts})
+            removed = cur.rowcount
+
+        # Open a version for every key without a current one (new, changed or returning keys)
+        cur.execute(f"""
+        INSERT INTO {storage_name} ({cols_sql}, valid_from)
+        SELECT {', '.join(f's.{col}' for col in columns)}, %s::timestamp
+        FROM {stage_name} s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {storage_name} h
+            WHERE h.{primary_key} = s.{primary_key} AND h.valid_to IS NULL
+        );
+        """, (run_ts,))
+        opened = cur.rowcount
+        if len(df):
+            record_scd2_run(cur, storage_name, stage_name, run_ts, scope_column)
+        conn.commit()
+
+    new_keys = opened - changed - reopened
+    logger.info(
+        f"[{history_name}] SCD2 versions opened: {opened} (new keys: {new_keys}, changed: {changed}, "
+        f"reopened: {reopened}), tombstones: {removed}, unchanged: {len(df) - opened}, total rows: {len(df)}"
+    )
+    return {
+        "table": history_name, "opened": opened, "new": new_keys, "changed": changed, "reopened": reopened,
+        "tombstones": removed, "unchanged": len(df) - opened, "rows": len(df)
+    }
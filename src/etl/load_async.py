@@ -0,0 +1,174 @@
+import time
+import asyncio
+import threading
+import pandas as pd
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from src.etl.load import load_to_postgres, load_history_to_postgres
+from configs.postgres_config import LOAD_CONCURRENCY, LOAD_MAX_PENDING
+from configs.logging_config import get_logger
+logger = get_logger("etl_log")
+
+
+def load_job(df: pd.DataFrame, dept: str, table_base_name: str, postfix: str, **kwargs) -> tuple:
+    """Build a (df, spec) job that load_tables runs with load_to_postgres(df, **spec)."""
+    return df, {"dept": dept, "table_base_name": table_base_name, "postfix": postfix, **kwargs}
+
+
+def history_job(df: pd.DataFrame, dept: str, table_base_name: str, postfix: str, **kwargs) -> tuple:
+    """Build a (df, spec) job that load_tables runs with load_history_to_postgres(df, **spec)."""
+    return df, {"dept": dept, "table_base_name": table_base_name, "postfix": postfix, "history": True, **kwargs}
+
+
+def job_table_name(spec: dict) -> str:
+    """Name of the table a job writes to, as the loaders build it."""
+    infix = "_history" if spec.get("history") else ""
+    return f"{spec['dept']}_{spec['table_base_name']}{infix}_{spec['postfix']}"
+
+
+def _load(df: pd.DataFrame, spec: dict) -> dict:
+    """Run one job in the calling thread and summarise it; never raises."""
+    table_name = job_table_name(spec)
+    spec = dict(spec)
+    loader = load_history_to_postgres if spec.pop("history", False) else load_to_postgres
+    # Kept for callers that act on what was loaded (e.g. watermarks), not the frame itself
+    summary = {"table": table_name, "attrs": dict(df.attrs)}
+
+    # e.g. an incremental extract that found no changes
+    if df.empty:
+        logger.info(f"[{table_name}] Nothing to load.")
+        return {**summary, "ok": True, "result": None, "error": None, "seconds": 0.0}
+
+    started = time.perf_counter()
+    try:
+        result = loader(df, **spec)
+        error = None
+    except Exception as e:
+        result, error = None, e
+    seconds = time.perf_counter() - started
+
+    if error is None:
+        logger.info(f"[{table_name}] ✅ loaded in {seconds:.1f} s.")
+    else:
+        logger.error(f"[{table_name}] ❌ load failed after {seconds:.1f} s: {error}")
+    return {**summary, "ok": error is None, "result": result, "error": error, "seconds": seconds}
+
+
+def _log_summary(results: list, wall: float) -> None:
+    failed = [r["table"] for r in results if not r["ok"]]
+    logger.info(
+        f"Loaded {len(results) - len(failed)}/{len(results)} tables in {wall:.1f} s "
+        f"(sequential would be ~{sum(r['seconds'] for r in results):.1f} s)."
+    )
+    if failed:
+        logger.warning(f"❌ Failed loads: {', '.join(failed)}")
+
+
+async def _run_job(df: pd.DataFrame, spec: dict, semaphore: asyncio.Semaphore, table_locks: dict) -> dict:
+    if df.empty:
+        return _load(df, spec)
+
+    # Jobs for the same table run one after another, in submission order
+    async with table_locks.setdefault(job_table_name(spec), asyncio.Lock()):
+        async with semaphore:
+            return await asyncio.to_thread(_load, df, spec)
+
+
+async def load_tables_async(jobs: list, max_concurrency: int = LOAD_CONCURRENCY) -> list:
+    """
+    Load a batch of (df, spec) jobs concurrently.
+
+    Each job runs load_to_postgres (or load_history_to_postgres for
+    history_job specs) in a worker thread on the shared connection pool; at most
+    max_concurrency tables load at once and jobs for the same table are
+    serialised. A failing job does not stop the others; empty frames are skipped.
+
+    Parameters
+    ----------
+    jobs : list
+        (df, spec) tuples from load_job / history_job.
+    max_concurrency : int, optional
+        Tables loaded at the same time. Default = LOAD_CONCURRENCY.
+
+    Returns
+    -------
+    list
+        One dict per job, in job order:
+        {"table", "attrs" (the frame's attrs), "ok", "result" (the loader's counts),
+        "error", "seconds"}.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    table_locks = {}
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(_run_job(df, spec, semaphore, table_locks) for df, spec in jobs))
+    _log_summary(results, time.perf_counter() - started)
+    return results
+
+
+def load_tables(jobs: list, max_concurrency: int = LOAD_CONCURRENCY) -> list:
+    """Synchronous entry point of load_tables_async for the department scripts."""
+    return asyncio.run(load_tables_async(jobs, max_concurrency))
+
+
+class LoadQueue:
+    """
+    Load (df, spec) jobs in the background while the next frames are extracted.
+
+    submit() hands a job to a pool of max_concurrency loader threads and
+    returns at once, unless max_pending jobs are already waiting or loading:
+    then it blocks until one finishes, so the extractor never runs far ahead
+    of the database. Jobs for the same table load one after another, in
+    submission order. The queue drops its reference to a frame as soon as the
+    frame is loaded.
+
+    Call join() once everything is submitted:
+
+        loads = LoadQueue()
+        loads.submit(load_job(df=classes, dept="education", ...))
+        ...
+        results = loads.join()
+    """
+
+    def __init__(self, max_concurrency: int = LOAD_CONCURRENCY, max_pending: int = LOAD_MAX_PENDING):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="load")
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._last = {}  # {table name: future of its latest job}
+        self._futures = []
+        self._started = time.perf_counter()
+
+    def submit(self, job: tuple) -> Future:
+        """Queue a (df, spec) job from load_job / history_job."""
+        df, spec = job
+        table_name = job_table_name(spec)
+        self._slots.acquire()
+        future = self._executor.submit(self._run, df, spec, self._last.get(table_name))
+        future.add_done_callback(lambda _: self._slots.release())
+        self._last[table_name] = future
+        self._futures.append(future)
+        return future
+
+    @staticmethod
+    def _run(df: pd.DataFrame, spec: dict, previous: Future) -> dict:
+        # The previous job of this table was queued first, so it already holds a worker
+        if previous is not None:
+            wait([previous])
+        return _load(df, spec)
+
+    def join(self) -> list:
+        """
+        Wait for every submitted job and return one dict per job, in
+        submission order, as load_tables does.
+        """
+        results = [future.result() for future in self._futures]
+        self._executor.shutdown()
+        self._futures, self._last = [], {}
+        _log_summary(results, time.perf_counter() - self._started)
+        return results
+
+
+__all__ = ["load_job",
+           "history_job",
+           "job_table_name",
+           "load_tables_async",
+           "load_tables",
+           "LoadQueue"]
@@ -34,4 +34,18 @@ def update_json_cache(file_name: str, updates: dict, dir: str):
     with open(path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
-    logger.info(f"Updated cache file: {path}")
\ No newline at end of file
+    logger.info(f"Updated cache file: {path}")
+
+
+def write_json_cache(file_name: str, data: dict, dir: str):
+    """
+    Replace dir/{file_name}.json with the given dictionary.
+
+    - Unlike update_json_cache, keys missing from data are dropped.
+    """
+    os.makedirs(dir, exist_ok=True)
+    path = os.path.join(dir, f"{file_name}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+    logger.info(f"Rewrote cache file: {path}")
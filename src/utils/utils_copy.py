@@ -0,0 +1,255 @@
+import numpy as np
+import pandas as pd
+from src.utils.utils_schema import PG_TYPE_NAMES
+from configs.postgres_config import COPY_CHUNK_ROWS
+from configs.logging_config import get_logger
+logger = get_logger("etl_log")
+
+# PostgreSQL binary COPY framing: signature, flags field, header extension length
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + (0).to_bytes(4, "big") + (0).to_bytes(4, "big")
+PGCOPY_TRAILER = (-1).to_bytes(2, "big", signed=True)
+
+# Binary timestamps count microseconds from 2000-01-01
+_PG_EPOCH_US = np.datetime64("2000-01-01", "us").astype(np.int64)
+
+# Exact formats tried before the generic ISO 8601 parser
+_TIMESTAMP_FORMATS = ("%Y-%m-%d %H:%M:%S", "ISO8601")
+
+
+def _fixed_column(values: np.ndarray, mask: np.ndarray) -> dict:
+    """Wrap a big-endian fixed-width array; masked rows are sent as NULL."""
+    values = np.ascontiguousarray(values)
+    width = values.dtype.itemsize
+    return {
+        "values": values,
+        "width": width,
+        "lengths": np.where(mask, -1, width).astype(np.int64),
+    }
+
+
+def _encode_bigint(s: pd.Series) -> dict:
+    if pd.api.types.is_bool_dtype(s.dtype) or not pd.api.types.is_integer_dtype(s.dtype):
+        raise TypeError("expected an integer dtype")
+    mask = s.isna().to_numpy()
+    return _fixed_column(s.to_numpy(dtype=np.int64, na_value=0).astype(">i8"), mask)
+
+
+def _encode_double(s: pd.Series) -> dict:
+    if pd.api.types.is_bool_dtype(s.dtype) or not pd.api.types.is_numeric_dtype(s.dtype):
+        raise TypeError("expected a numeric dtype")
+    if isinstance(s.dtype, np.dtype):
+        # NumPy floats have no NULL, NaN is written as NaN like the text path does
+        mask = np.zeros(len(s), dtype=bool)
+    else:
+        mask = s.isna().to_numpy()
+    return _fixed_column(s.to_numpy(dtype=np.float64, na_value=np.nan).astype(">f8"), mask)
+
+
+def _encode_boolean(s: pd.Series) -> dict:
+    if not pd.api.types.is_bool_dtype(s.dtype):
+        if s.dtype != object or pd.api.types.infer_dtype(s, skipna=True) not in ("boolean", "empty"):
+            raise TypeError("expected a boolean dtype")
+    mask = s.isna().to_numpy()
+    return _fixed_column(s.to_numpy(dtype=bool, na_value=False).astype(np.uint8), mask)
+
+
+def _encode_timestamp(s: pd.Series) -> dict:
+    if pd.api.types.is_datetime64_any_dtype(s.dtype):
+        parsed = s
+    elif s.dtype == object or pd.api.types.is_string_dtype(s.dtype):
+        kind = pd.api.types.infer_dtype(s, skipna=True)
+        if kind in ("datetime", "datetime64", "empty"):
+            parsed = pd.to_datetime(s)
+        elif kind == "string":
+            # add_timestamp writes '%Y-%m-%d %H:%M:%S' strings, PostgreSQL would parse them the same way
+            given = s.notna().to_numpy()
+            for fmt in _TIMESTAMP_FORMATS:
+                parsed = pd.to_datetime(s, format=fmt, errors="coerce")
+                if not (parsed.isna().to_numpy() & given).any():
+                    break
+            else:
+                raise ValueError("timestamp strings that do not parse as ISO 8601")
+        else:
+            raise TypeError(f"expected timestamps, got {kind}")
+    else:
+        raise TypeError("expected timestamps")
+
+    if getattr(parsed.dtype, "tz", None) is not None:
+        raise TypeError("timezone-aware values for a timestamp without time zone column")
+    mask = parsed.isna().to_numpy()
+    micros = parsed.to_numpy(dtype="datetime64[us]").astype(np.int64) - _PG_EPOCH_US
+    micros[mask] = 0
+    return _fixed_column(micros.astype(">i8"), mask)
+
+
+def _encode_time(s: pd.Series) -> dict:
+    if pd.api.types.is_timedelta64_dtype(s.dtype):
+        parsed = s
+    elif s.dtype == object and pd.api.types.infer_dtype(s, skipna=True) in ("time", "string", "empty"):
+        # datetime.time and 'HH:MM:SS[.ffffff]' strings both read as time-of-day deltas
+        parsed = pd.to_timedelta(s.map(str, na_action="ignore"), errors="coerce")
+        if (parsed.isna().to_numpy() & s.notna().to_numpy()).any():
+            raise ValueError("time values that do not parse as HH:MM:SS")
+    else:
+        raise TypeError("expected times of day")
+
+    mask = parsed.isna().to_numpy()
+    micros = parsed.to_numpy(dtype="timedelta64[us]").astype(np.int64)
+    micros[mask] = 0
+    if ((micros < 0) | (micros > 86_400_000_000)).any():
+        raise ValueError("time values outside 00:00:00-24:00:00")
+    return _fixed_column(micros.astype(">i8"), mask)
+
+
+def _encode_text(s: pd.Series) -> dict:
+    if not (s.dtype == object or pd.api.types.is_string_dtype(s.dtype)) \
+            or pd.api.types.infer_dtype(s, skipna=True) not in ("string", "empty"):
+        raise TypeError("expected strings")
+    mask = s.isna().to_numpy()
+    values = s.to_numpy(dtype=object)[~mask]
+
+    # One join + one encode for the whole column instead of one bytes object per value
+    text = "".join(values)
+    blob = text.encode("utf-8")
+    value_lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+    if len(blob) != len(text):
+        # Non-ASCII text: byte lengths differ from character lengths
+        value_lengths = np.fromiter(
+            (len(v.encode("utf-8")) for v in values), dtype=np.int64, count=len(values)
+        )
+
+    lengths = np.full(len(s), -1, dtype=np.int64)
+    lengths[~mask] = value_lengths
+    offsets = np.zeros(len(s) + 1, dtype=np.int64)
+    np.cumsum(np.maximum(lengths, 0), out=offsets[1:])
+    return {
+        "blob": np.frombuffer(blob, dtype=np.uint8),
+        "offsets": offsets,
+        "lengths": lengths,
+    }
+
+
+# information_schema data_type -> column encoder
+_ENCODERS = {
+    "bigint": _encode_bigint,
+    "double precision": _encode_double,
+    "boolean": _encode_boolean,
+    "timestamp without time zone": _encode_timestamp,
+    "time without time zone": _encode_time,
+    "text": _encode_text,
+}
+
+
+def prepare_copy_columns(df: pd.DataFrame, column_types: dict) -> list:
+    """
+    Convert every DataFrame column into NumPy buffers laid out for binary COPY.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Frame to encode, columns in COPY order.
+    column_types : dict
+        {column: PostgreSQL type} of the target table, either as
+        information_schema reports it or as map_dtype_to_pg returns it.
+
+    Returns
+    -------
+    list
+        One prepared column per DataFrame column.
+
+    Raises
+    ------
+    TypeError, ValueError
+        If a column type or its values have no exact binary encoding; the
+        caller should fall back to text COPY.
+    """
+    columns = []
+    for col in df.columns:
+        pg_type = column_types.get(col)
+        if pg_type is None:
+            raise TypeError(f"column {col} has no target type")
+        pg_type = PG_TYPE_NAMES.get(pg_type, pg_type.lower())
+        encoder = _ENCODERS.get(pg_type)
+        if encoder is None:
+            raise TypeError(f"column {col}: no binary encoder for {pg_type}")
+        try:
+            columns.append(encoder(df[col]))
+        except (TypeError, ValueError) as e:
+            raise type(e)(f"column {col} ({df[col].dtype} -> {pg_type}): {e}") from e
+    return columns
+
+
+def _scatter(buf: np.ndarray, positions: np.ndarray, data: np.ndarray) -> None:
+    """Write row i of a (n, width) uint8 array to buf[positions[i]:positions[i] + width]."""
+    buf[positions[:, None] + np.arange(data.shape[1])] = data
+
+
+def _encode_chunk(columns: list, start: int, stop: int) -> memoryview:
+    n = stop - start
+    lengths = [col["lengths"][start:stop] for col in columns]
+    field_widths = [4 + np.maximum(length, 0) for length in lengths]
+
+    row_widths = 2 + sum(field_widths)
+    row_starts = np.zeros(n, dtype=np.int64)
+    np.cumsum(row_widths[:-1], out=row_starts[1:])
+    buf = np.empty(int(row_widths.sum()), dtype=np.uint8)
+
+    # Each tuple starts with its int16 field count
+    field_count = np.full(n, len(columns), dtype=">i2")
+    _scatter(buf, row_starts, field_count.view(np.uint8).reshape(n, 2))
+
+    positions = row_starts + 2
+    for col, length, width in zip(columns, lengths, field_widths):
+        # int32 field length, -1 for NULL
+        _scatter(buf, positions, length.astype(">i4").view(np.uint8).reshape(n, 4))
+
+        present = length >= 0
+        data_positions = positions[present] + 4
+        if "blob" in col:
+            lo, hi = col["offsets"][start], col["offsets"][stop]
+            source_starts = col["offsets"][start:stop][present]
+            destination = np.repeat(data_positions - source_starts, length[present]) + np.arange(lo, hi)
+            buf[destination] = col["blob"][lo:hi]
+        else:
+            values = col["values"][start:stop][present]
+            _scatter(buf, data_positions, values.view(np.uint8).reshape(len(values), col["width"]))
+        positions += width
+    return memoryview(buf)
+
+
+def iter_copy_binary(df: pd.DataFrame, column_types: dict, chunk_rows: int = COPY_CHUNK_ROWS):
+    """
+    Yield a complete binary COPY stream (header, tuples, trailer) for a DataFrame.
+
+    The frame is encoded chunk_rows at a time: each slice goes through
+    prepare_copy_columns and is laid out with vectorised scatters, so no
+    per-row Python objects are created and memory stays bounded by the chunk.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Frame to encode, columns in COPY order.
+    column_types : dict
+        {column: PostgreSQL type} of the target table, see prepare_copy_columns.
+    chunk_rows : int, optional
+        Rows per yielded buffer. Default = COPY_CHUNK_ROWS.
+
+    Yields
+    ------
+    bytes | memoryview
+        Buffers to pass to psycopg's Copy.write in order.
+
+    Raises
+    ------
+    TypeError, ValueError
+        From prepare_copy_columns, possibly after earlier chunks were yielded.
+    """
+    yield PGCOPY_HEADER
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        yield _encode_chunk(prepare_copy_columns(chunk, column_types), 0, len(chunk))
+    yield PGCOPY_TRAILER
+
+
+__all__ = ["prepare_copy_columns",
+           "iter_copy_binary"]
@@ -1,28 +1,128 @@
 # pip freeze > requirements.txt
 import re
+import json
 from io import StringIO
 import numpy as np
 from pathlib import Path
 from datetime import datetime, timedelta
 from etl_metadata.blueprints import expected_columns_dict
+from src.utils.utils_cache import update_json_cache
 import pandas as pd
 from configs.logging_config import get_logger
 
 logger = get_logger("etl_log")
 dataframe_log = get_logger(name="dataframe_log")
 
-def add_timestamp(df: pd.DataFrame, col: str = "fetched_timestamp") -> pd.DataFrame:
+# Formats tried, in order, on a sample of a date column whose format is not known yet
+DATETIME_FORMATS = [
+    "%Y-%m-%dT%H:%M:%S.%fZ",  # 2025-11-29T07:05:49.721Z
+    "%Y-%m-%dT%H:%M:%S%z",  # 2025-11-29T07:05:49+00:00
+    "%Y-%m-%dT%H:%M:%S",  # 2025-11-29T07:05:49
+    "%Y-%m-%d %H:%M:%S",  # 2025-11-29 07:05:49
+    "%Y-%m-%d",  # 2025-11-29
+    "%d-%m-%Y %H:%M:%S",  # 29-11-2025 07:05:49
+    "%d/%m/%Y %H:%M:%S",  # 29/11/2025 07:05:49
+    "%d/%m/%Y",  # 29/11/2025
+    "%m/%d/%Y",  # 11/29/2025
+    "%m-%d-%Y",  # 11-29-2025
+]
+DATETIME_SAMPLE_SIZE = 500
+# Share of a column's dated values a format must parse to be used
+DATETIME_MIN_VALID = 0.9
+# Values standing in for a missing date (fillna / 'NA'), not counted as dates
+DATETIME_PLACEHOLDERS = [0, "0", "", "NA"]
+
+# Format found per dataset and date column, kept across runs:
+# DATETIME_FORMATS_DIR/datetime_formats.json, {dataset: {column: format}}
+DATETIME_FORMATS_CACHE = "datetime_formats"
+DATETIME_FORMATS_DIR = "etl_metadata"
+_datetime_formats = None
+
+
+def _known_datetime_formats() -> dict:
+    global _datetime_formats
+    if _datetime_formats is None:
+        path = Path(DATETIME_FORMATS_DIR) / f"{DATETIME_FORMATS_CACHE}.json"
+        try:
+            _datetime_formats = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+        except (OSError, json.JSONDecodeError):
+            _datetime_formats = {}
+    return _datetime_formats
+
+
+def _parse_with_format(s: pd.Series, fmt: str, dated: int):
+    """s parsed with fmt, or None if fmt leaves more than 1 - DATETIME_MIN_VALID of the dated values unparsed."""
+    try:
+        parsed = pd.to_datetime(s, format=fmt, errors="coerce", utc=True)
+    except Exception:
+        return None
+    return parsed if parsed.notna().sum() > DATETIME_MIN_VALID * dated else None
+
+
+def _detect_datetime_format(values: pd.Series):
+    """First of DATETIME_FORMATS that fits an evenly spread sample of values, or None."""
+    sample = values.iloc[::max(1, len(values) // DATETIME_SAMPLE_SIZE)]
+    for fmt in DATETIME_FORMATS:
+        if _parse_with_format(sample, fmt, len(sample)) is not None:
+            return fmt
+    return None
+
+
+def _parse_datetime_column(s: pd.Series, known_format: str = None):
+    """
+    Parse a date column to UTC datetimes with a single format.
+
+    known_format (remembered from an earlier run) is tried first; otherwise,
+    or if it no longer fits, the format is detected on a sample. The whole
+    column is parsed once with it, and with the flexible parser only if no
+    format fits. Placeholders (DATETIME_PLACEHOLDERS) do not count as dates.
+
+    Returns
+    -------
+    tuple
+        (UTC datetimes, format to remember or None)
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return pd.to_datetime(s, utc=True), None
+
+    values = s[s.notna() & ~s.isin(DATETIME_PLACEHOLDERS)]
+    if values.empty:
+        return pd.Series(pd.NaT, index=s.index, dtype="datetime64[ns, UTC]"), known_format
+
+    if known_format is not None:
+        parsed = _parse_with_format(s, known_format, len(values))
+        if parsed is not None:
+            return parsed, known_format
+        logger.info(f"Datetime format {known_format!r} no longer fits '{s.name}', detecting it again.")
+
+    fmt = _detect_datetime_format(values)
+    if fmt is not None and fmt != known_format:
+        parsed = _parse_with_format(s, fmt, len(values))
+        if parsed is not None:
+            return parsed, fmt
+
+    # No single format fits: auto-detect everything
+    return pd.to_datetime(s, errors="coerce", utc=True), None
+
+
+def add_timestamp(df: pd.DataFrame, col: str = "fetched_timestamp", dataset: str = None) -> pd.DataFrame:
     """
         Add a current timestamp column in Asia/Tashkent timezone for ETL tracking.
         Convert any existing date columns from ISO 8601 to Postgres TIMESTAMP format,
         rename them to <original>_timestamp, and drop the original column.
 
+        The format of each date column is detected on a sample and remembered
+        per dataset in DATETIME_FORMATS_DIR, so later runs parse it directly.
+
         Parameters
         ----------
         df : pd.DataFrame
             Input DataFrame.
         col : str, optional
             Column name to store the current timestamp. Default = 'fetched_timestamp'.
+        dataset : str, optional
+            Name the date formats are remembered under. Default = df.attrs["name"];
+            without either they are detected on every call.
 
         Returns
         -------
@@ -33,6 +133,9 @@ def add_timestamp(df: pd.DataFrame, col: str = "fetched_timestamp") -> pd.DataFr
     """
     tz = "Asia/Tashkent"
     df_out = df.copy()
+    dataset = dataset or df.attrs.get("name")
+    known = _known_datetime_formats().get(dataset, {}) if dataset else {}
+    formats = dict(known)
 
     # 1. Add current timestamp column (Tashkent time)
     now_str = pd.Timestamp.now(tz=tz).strftime("%Y-%m-%d %H:%M:%S")
@@ -52,44 +155,12 @@ def add_timestamp(df: pd.DataFrame, col: str = "fetched_timestamp") -> pd.DataFr
         if dc in df_out.columns:
             new_col = f"{dc}_timestamp"
 
-            # Try parsing as datetime
-            def parse_datetime_series(s: pd.Series) -> pd.Series:
-                """
-                Robust multi-format datetime parser:
-                1. Tries fast exact formats.
-                2. Falls back to flexible parser.
-                3. Returns UTC-aware datetimes.
-                """
-
-                # List of common formats to try for speed
-                formats = [
-                    "%Y-%m-%dT%H:%M:%S.%fZ",  # 2025-11-29T07:05:49.721Z
-                    "%Y-%m-%dT%H:%M:%S%z",  # 2025-11-29T07:05:49+00:00
-                    "%Y-%m-%dT%H:%M:%S",  # 2025-11-29T07:05:49
-                    "%Y-%m-%d %H:%M:%S",  # 2025-11-29 07:05:49
-                    "%Y-%m-%d",  # 2025-11-29
-                    "%d-%m-%Y %H:%M:%S",  # 29-11-2025 07:05:49
-                    "%d/%m/%Y %H:%M:%S",  # 29/11/2025 07:05:49
-                    "%d/%m/%Y",  # 29/11/2025
-                    "%m/%d/%Y",  # 11/29/2025
-                    "%m-%d-%Y",  # 11-29-2025
-                ]
-
-                # Try each format in order
-                for fmt in formats:
-                    try:
-                        parsed = pd.to_datetime(s, format=fmt, errors="coerce", utc=True)
-                        # If parsing worked on >90% rows → use this format
-                        if parsed.notna().mean() > 0.9:
-                            return parsed
-                    except Exception:
-                        pass
-
-                # Final fallback: auto-detect everything
-                return pd.to_datetime(s, errors="coerce", utc=True)
-
             try:
-                dt = parse_datetime_series(df_out[dc])
+                dt, fmt = _parse_datetime_column(df_out[dc], known.get(dc))
+                if fmt is not None:
+                    formats[dc] = fmt
+                else:
+                    formats.pop(dc, None)
             except Exception as e:
                 # Log the error (optional)
                 logger.error(f"⚠️ Failed to parse datetime column '{dc}': {e}")
@@ -103,15 +174,20 @@ def add_timestamp(df: pd.DataFrame, col: str = "fetched_timestamp") -> pd.DataFr
             if dt.dt.tz is None:
                 dt = dt.dt.tz_localize("UTC")
 
-            # Convert to Tashkent and format as string
-            df_out[new_col] = (
-                dt.dt.tz_convert(tz)
-                  .dt.strftime("%Y-%m-%d %H:%M:%S")
+            # Convert to Tashkent and format as "YYYY-MM-DD HH:MM:SS" (vectorised, unlike dt.strftime)
+            local = dt.dt.tz_convert(tz).dt.tz_localize(None).to_numpy().astype("datetime64[s]")
+            df_out[new_col] = pd.Series(
+                np.char.replace(np.datetime_as_string(local, unit="s"), "T", " "), index=df_out.index
             )
 
             # Drop original column
             df_out.drop(columns=dc, inplace=True)
 
+    if dataset and formats != known:
+        _known_datetime_formats()[dataset] = formats
+        Path(DATETIME_FORMATS_DIR).mkdir(parents=True, exist_ok=True)
+        update_json_cache(DATETIME_FORMATS_CACHE, {dataset: formats}, DATETIME_FORMATS_DIR)
+
     return df_out
 
 
@@ -149,6 +225,27 @@ def clean_string_columns(df: pd.DataFrame, allow_extra: str = "") -> pd.DataFram
     return df_clean
 
 
+def row_fingerprint(df: pd.DataFrame, exclude: tuple = ("fetched_timestamp",)) -> pd.Series:
+    """
+    Compute a vectorised 64-bit content hash per row.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Input DataFrame.
+    exclude : tuple, optional
+        Columns left out of the hash (e.g. ETL bookkeeping that changes every run).
+
+    Returns
+    -------
+    pd.Series
+        int64 hash per row (fits a PostgreSQL BIGINT), aligned with df.index.
+    """
+    cols = [c for c in df.columns if c not in exclude]
+    hashes = pd.util.hash_pandas_object(df[cols], index=False)
+    return pd.Series(hashes.to_numpy().view("int64"), index=df.index)
+
+
 def fill_and_numeric(series, fill_value=0, dtype="float"):
     """
     Fill NA values and convert a pandas Series to numeric type.
@@ -338,5 +435,6 @@ __all__ = ["clean_string_columns",
            "add_timestamp",
            "normalize_columns",
            "fill_and_numeric",
+           "row_fingerprint",
            "log_df",
            "save_df_with_timestamp"]
\ No newline at end of file
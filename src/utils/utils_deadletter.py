@@ -0,0 +1,119 @@
+import os
+import json
+import threading
+import pandas as pd
+from datetime import datetime, timedelta
+from src.utils.utils_cache import update_json_cache
+from configs.postgres_config import DEAD_LETTER_DIR
+from configs.logging_config import get_logger
+logger = get_logger("etl_log")
+
+# Index of dead-lettered batches: DEAD_LETTER_DIR/index.json, {batch id: spec}
+_INDEX_NAME = "index"
+# Batch workers write concurrently, update_json_cache is read-modify-write
+_index_lock = threading.Lock()
+
+
+def _index_path() -> str:
+    return os.path.join(DEAD_LETTER_DIR, f"{_INDEX_NAME}.json")
+
+
+def _read_index() -> dict:
+    if not os.path.exists(_index_path()):
+        return {}
+    with open(_index_path(), "r", encoding="utf-8") as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError:
+            return {}
+
+
+def write_failed_batch(batch_df: pd.DataFrame, spec: dict, error: Exception) -> str:
+    """
+    Save a batch that could not be loaded to DEAD_LETTER_DIR and register it in the index.
+
+    Rows are written to Parquet; frames pyarrow cannot store (e.g. object
+    columns with mixed types) fall back to a pickle so no row is lost.
+
+    Parameters
+    ----------
+    batch_df : pd.DataFrame
+        Rows of the failed batch, columns as loaded.
+    spec : dict
+        How to replay the batch: {"kind": "upsert" | "history", "table", ...}.
+    error : Exception
+        Last error of the batch, kept for the operator.
+
+    Returns
+    -------
+    str
+        Batch id (file name without extension), or "" if nothing could be saved.
+    """
+    # Uzbekistan is UTC+5
+    now_uzbek = datetime.utcnow() + timedelta(hours=5)
+    batch_id = f"{spec['table']}__{now_uzbek.strftime('%Y_%m_%d_%H-%M-%S-%f')}"
+
+    try:
+        os.makedirs(DEAD_LETTER_DIR, exist_ok=True)
+        file_name = f"{batch_id}.parquet"
+        try:
+            batch_df.to_parquet(os.path.join(DEAD_LETTER_DIR, file_name), index=False)
+        except Exception as e:
+            logger.warning(f"[{spec['table']}] Batch not storable as Parquet ({e}), writing a pickle.")
+            file_name = f"{batch_id}.pkl"
+            batch_df.to_pickle(os.path.join(DEAD_LETTER_DIR, file_name))
+
+        entry = {
+            **spec,
+            "file": file_name,
+            "rows": len(batch_df),
+            "error": f"{type(error).__name__}: {error}",
+            "failed_at": now_uzbek.strftime("%Y-%m-%d %H:%M:%S.%f"),
+        }
+        with _index_lock:
+            update_json_cache(_INDEX_NAME, {batch_id: entry}, DEAD_LETTER_DIR)
+    except Exception as e:
+        logger.error(f"❌[{spec['table']}] Failed to dead-letter {len(batch_df)} rows, they are lost: {e}")
+        return ""
+
+    logger.warning(f"[{spec['table']}] {len(batch_df)} rows dead-lettered as {file_name}.")
+    return batch_id
+
+
+def list_failed_batches(table_name: str = None) -> dict:
+    """Return {batch id: spec} of dead-lettered batches, optionally only for one table."""
+    with _index_lock:
+        index = _read_index()
+    return {
+        batch_id: spec for batch_id, spec in index.items()
+        if table_name is None or spec.get("table") == table_name
+    }
+
+
+def read_failed_batch(spec: dict) -> pd.DataFrame:
+    """Load the rows of a dead-lettered batch."""
+    path = os.path.join(DEAD_LETTER_DIR, spec["file"])
+    if spec["file"].endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+def remove_failed_batch(batch_id: str) -> None:
+    """Delete a replayed batch and its index entry."""
+    with _index_lock:
+        index = _read_index()
+        spec = index.pop(batch_id, None)
+        if spec is None:
+            return
+        path = os.path.join(DEAD_LETTER_DIR, spec["file"])
+        if os.path.exists(path):
+            os.remove(path)
+        # update_json_cache only merges keys, rewrite the index without the entry
+        with open(_index_path(), "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+
+
+__all__ = ["write_failed_batch",
+           "list_failed_batches",
+           "read_failed_batch",
+           "remove_failed_batch"]
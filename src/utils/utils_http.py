@@ -0,0 +1,319 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import threading
+import requests
+from datetime import datetime, timezone
+from requests.structures import CaseInsensitiveDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from configs.http_config import (
+    HTTP_TIMEOUT, HTTP_RETRIES, HTTP_BACKOFF, RETRY_STATUSES, HTTP_POOL_MAXSIZE, HTTP_CONCURRENCY,
+    RATE_LIMITS, HTTP_CACHE_DIR, HTTP_CACHE_TTLS
+)
+from configs.logging_config import get_logger
+logger = get_logger("etl_log")
+
+# One keep-alive Session and one token bucket per host, created on first use
+_sessions = {}
+_buckets = {}
+_registry_lock = threading.Lock()
+
+# Set by refresh_reference() (main.py --refresh-reference): ignore cached responses
+_bypass_cache = False
+
+# Request headers that do not change a response and must not end up in cache keys
+_UNKEYED_HEADERS = {"authorization", "cookie"}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` requests per second with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, sleeping until one is available. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def _rate_limit_for(host: str):
+    for suffix, limit in RATE_LIMITS.items():
+        if host == suffix or host.endswith(f".{suffix}"):
+            return limit
+    return None
+
+
+def _new_session() -> requests.Session:
+    retry = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        respect_retry_after_header=True,
+        # Hand the last response back so callers' raise_for_status() reports it
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=HTTP_POOL_MAXSIZE)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(url: str) -> requests.Session:
+    """Return the shared keep-alive Session for the host of url."""
+    host = urlsplit(url).hostname or ""
+    session = _sessions.get(host)
+    if session is None:
+        with _registry_lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = _sessions[host] = _new_session()
+                limit = _rate_limit_for(host)
+                if limit:
+                    _buckets[host] = TokenBucket(limit["rate"], limit["burst"])
+    return session
+
+
+def http_request(method: str, url: str, cache: str = None, **kwargs) -> requests.Response:
+    """
+    Send a request through the shared per-host Session.
+
+    Applies the host's token-bucket rate limit, HTTP_TIMEOUT unless a timeout
+    is given, and retries with exponential backoff on connection errors and
+    429/5xx responses (Retry-After is honoured). Same signature and return
+    value as requests.request.
+
+    cache names an entry of HTTP_CACHE_TTLS: the GET response is then served
+    from / stored in the on-disk cache (see _cached_request).
+    """
+    if cache is not None and method.upper() == "GET":
+        return _cached_request(cache, url, kwargs)
+    return _send(method, url, **kwargs)
+
+
+def _send(method: str, url: str, **kwargs) -> requests.Response:
+    session = get_session(url)
+    bucket = _buckets.get(urlsplit(url).hostname or "")
+    if bucket is not None:
+        waited = bucket.acquire()
+        if waited > 1:
+            logger.info(f"Rate limit: waited {waited:.1f} s for {urlsplit(url).hostname}")
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    return session.request(method, url, **kwargs)
+
+
+def refresh_reference(enabled: bool = True) -> None:
+    """Bypass the response cache for the rest of the run (fresh responses are still stored)."""
+    global _bypass_cache
+    _bypass_cache = enabled
+
+
+def _cache_path(url: str, kwargs: dict) -> str:
+    headers = {k.lower(): v for k, v in (kwargs.get("headers") or {}).items() if k.lower() not in _UNKEYED_HEADERS}
+    key = json.dumps([url, kwargs.get("params"), headers], sort_keys=True, default=str)
+    return os.path.join(HTTP_CACHE_DIR, f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json")
+
+
+def _cached_response(entry: dict, path: str) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.reason = "OK (cached)"
+    response.url = entry["url"]
+    response.headers = CaseInsensitiveDict(entry["headers"])
+    response.encoding = entry.get("encoding")
+    response._content = base64.b64decode(entry["body"])
+    response.cache_path = path
+    return response
+
+
+def _store(path: str, url: str, response: requests.Response) -> None:
+    entry = {
+        "url": url,
+        "fetched_at": datetime.now(timezone.utc).isoformat(),
+        "headers": {k: v for k, v in response.headers.items() if k.lower() in ("content-type", "etag", "last-modified")},
+        "encoding": response.encoding,
+        "body": base64.b64encode(response.content).decode("ascii"),
+    }
+    _write_entry(path, entry)
+
+
+def _write_entry(path: str, entry: dict) -> None:
+    os.makedirs(HTTP_CACHE_DIR, exist_ok=True)
+    # Write then rename so a concurrent reader never sees half a file
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, path)
+
+
+def _cached_request(cache: str, url: str, kwargs: dict) -> requests.Response:
+    """
+    GET through the on-disk response cache, keyed by URL, params and headers
+    (credentials excluded).
+
+    A response younger than HTTP_CACHE_TTLS[cache] is returned without a
+    request. An older one is revalidated with If-None-Match /
+    If-Modified-Since when the server sent ETag / Last-Modified: a 304 renews
+    it, anything else replaces it. Only 200 responses are stored.
+    """
+    ttl = HTTP_CACHE_TTLS[cache]
+    path = _cache_path(url, kwargs)
+
+    entry = None
+    if os.path.exists(path) and not _bypass_cache:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            entry = None
+
+    if entry is not None:
+        age = datetime.now(timezone.utc) - datetime.fromisoformat(entry["fetched_at"])
+        if age < ttl:
+            logger.info(f"HTTP cache hit ({cache}, {age.total_seconds() / 3600:.1f} h old): {url}")
+            return _cached_response(entry, path)
+
+        validators = {}
+        if entry["headers"].get("ETag"):
+            validators["If-None-Match"] = entry["headers"]["ETag"]
+        if entry["headers"].get("Last-Modified"):
+            validators["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+        if validators:
+            kwargs = {**kwargs, "headers": {**(kwargs.get("headers") or {}), **validators}}
+
+    response = _send("GET", url, **kwargs)
+    if response.status_code == 304 and entry is not None:
+        logger.info(f"HTTP cache revalidated ({cache}): {url}")
+        entry["fetched_at"] = datetime.now(timezone.utc).isoformat()
+        _write_entry(path, entry)
+        return _cached_response(entry, path)
+
+    if response.status_code == 200:
+        _store(path, url, response)
+        response.cache_path = path
+    return response
+
+
+def drop_cached(response: requests.Response) -> None:
+    """Remove a response from the cache, e.g. when its body turned out to be an API error."""
+    path = getattr(response, "cache_path", None)
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def http_get(url: str, **kwargs) -> requests.Response:
+    """GET through http_request."""
+    return http_request("GET", url, **kwargs)
+
+
+def http_post(url: str, **kwargs) -> requests.Response:
+    """POST through http_request. POSTs are retried on connection errors only, not on 429/5xx."""
+    return http_request("POST", url, **kwargs)
+
+
+def crawl(fetch, tasks: list, max_workers: int = HTTP_CONCURRENCY, label: str = "crawl",
+          progress_every: float = 10.0, on_result=None) -> list:
+    """
+    Call fetch(*task) for every task on a thread pool.
+
+    Progress and throughput (requests/s) are logged every progress_every
+    seconds and once at the end. fetch should catch its own errors; an
+    exception escaping it is logged and stored as the task's result.
+
+    Parameters
+    ----------
+    fetch : callable
+        Function doing one request, called as fetch(*task).
+    tasks : list
+        Argument tuples, one per request.
+    max_workers : int, optional
+        Requests in flight at once. Default = HTTP_CONCURRENCY.
+    label : str, optional
+        Name used in the log lines.
+    progress_every : float, optional
+        Seconds between progress log lines. Default = 10.
+    on_result : callable, optional
+        Called as on_result(task, result) in task order, as soon as a result
+        and all the ones before it are in. Results handed over this way are
+        not kept, so large responses can be consumed while the crawl runs.
+
+    Returns
+    -------
+    list
+        fetch results in task order, whatever order they completed in
+        (all None when on_result is given).
+    """
+    results = [None] * len(tasks)
+    if not tasks:
+        return results
+
+    started = last_log = time.perf_counter()
+    pending, next_i = {}, 0
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {pool.submit(fetch, *task): i for i, task in enumerate(tasks)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"[{label}] Unhandled error for {tasks[i]}: {e}")
+                result = e
+
+            if on_result is None:
+                results[i] = result
+            else:
+                # Hand over the in-order prefix, hold later results until it reaches them
+                pending[i] = result
+                while next_i in pending:
+                    on_result(tasks[next_i], pending.pop(next_i))
+                    next_i += 1
+
+            now = time.perf_counter()
+            if now - last_log >= progress_every and done < len(tasks):
+                last_log = now
+                logger.info(f"[{label}] {done}/{len(tasks)} requests, {done / (now - started):.1f} req/s")
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"[{label}] {len(tasks)} requests in {elapsed:.1f} s "
+                f"({len(tasks) / max(elapsed, 1e-9):.1f} req/s, {max_workers} workers)")
+    return results
+
+
+def close_sessions() -> None:
+    """Close every pooled Session (call once before exit)."""
+    with _registry_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _buckets.clear()
+
+
+__all__ = ["TokenBucket",
+           "get_session",
+           "http_request",
+           "http_get",
+           "http_post",
+           "crawl",
+           "refresh_reference",
+           "drop_cached",
+           "close_sessions"]
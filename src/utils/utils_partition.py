@@ -0,0 +1,147 @@
+import re
+import pandas as pd
+from src.utils.utils_schema import get_table_kind, refresh_table, forget_table
+from configs.postgres_config import (
+    HISTORY_PARTITIONS_AHEAD, HISTORY_RETENTION_MONTHS, HISTORY_RETENTION_OVERRIDES, HISTORY_RETENTION_ACTION
+)
+from configs.logging_config import get_logger
+logger = get_logger("etl_log")
+
+# Monthly partitions are named <table>_pYYYYMM
+_PARTITION_SUFFIX = re.compile(r"_p(\d{6})$")
+
+
+def partition_name(table_name: str, month: pd.Period) -> str:
+    """Name of the monthly partition of table_name holding month."""
+    return f"{table_name}_p{month.strftime('%Y%m')}"
+
+
+def months_of(timestamps: pd.Series) -> list:
+    """
+    Distinct calendar months of a timestamp column, as pd.Period('M').
+
+    Parameters
+    ----------
+    timestamps : pd.Series
+        Datetimes or '%Y-%m-%d %H:%M:%S' strings (see add_timestamp).
+
+    Returns
+    -------
+    list
+        Sorted months, NaT values ignored.
+    """
+    parsed = pd.to_datetime(timestamps, errors="coerce").dropna()
+    return sorted(parsed.dt.to_period("M").unique())
+
+
+def ensure_month_partitions(cur, table_name: str, months: list) -> list:
+    """
+    Create the monthly range partitions of a history table that are missing.
+
+    The current month and HISTORY_PARTITIONS_AHEAD following months are always
+    included, so a run near the month boundary never finds its partition
+    missing. Existing partitions are known from the schema catalog and cost no
+    DDL. The caller commits.
+
+    Parameters
+    ----------
+    cur : psycopg.Cursor
+        Cursor of the loading transaction.
+    table_name : str
+        Partitioned parent table.
+    months : list
+        pd.Period('M') values that rows are about to be written to.
+
+    Returns
+    -------
+    list
+        Names of the partitions created.
+    """
+    current = pd.Timestamp.now(tz="Asia/Tashkent").tz_localize(None).to_period("M")
+    wanted = set(months) | {current + i for i in range(HISTORY_PARTITIONS_AHEAD + 1)}
+
+    created = []
+    for month in sorted(wanted):
+        name = partition_name(table_name, month)
+        if get_table_kind(cur, name) is not None:
+            continue
+        start = month.start_time.strftime("%Y-%m-%d")
+        end = (month + 1).start_time.strftime("%Y-%m-%d")
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table_name} "
+            f"FOR VALUES FROM ('{start}') TO ('{end}');"
+        )
+        refresh_table(cur, name)
+        created.append(name)
+
+    if created:
+        logger.info(f"[{table_name}] Partitions created: {', '.join(created)}")
+    return created
+
+
+def list_month_partitions(cur, table_name: str) -> dict:
+    """Return {month: partition name} for the attached monthly partitions of table_name."""
+    cur.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(%s);",
+        (table_name,)
+    )
+    partitions = {}
+    for (name,) in cur.fetchall():
+        match = _PARTITION_SUFFIX.search(name)
+        if match:
+            partitions[pd.Period(f"{match.group(1)[:4]}-{match.group(1)[4:]}", freq="M")] = name
+    return partitions
+
+
+def apply_retention(cur, table_name: str) -> list:
+    """
+    Detach or drop monthly partitions older than the retention window.
+
+    The window is HISTORY_RETENTION_OVERRIDES[table_name] or
+    HISTORY_RETENTION_MONTHS months including the current one; None keeps
+    everything. With HISTORY_RETENTION_ACTION = 'detach' old partitions become
+    standalone <partition>_detached tables that can be archived or dropped by
+    hand, with 'drop' they are deleted. The caller commits.
+
+    Returns
+    -------
+    list
+        Names of the partitions removed from table_name.
+    """
+    keep_months = HISTORY_RETENTION_OVERRIDES.get(table_name, HISTORY_RETENTION_MONTHS)
+    if keep_months is None:
+        return []
+    if HISTORY_RETENTION_ACTION not in ("detach", "drop"):
+        raise ValueError(f"Unknown retention action: {HISTORY_RETENTION_ACTION}")
+
+    current = pd.Timestamp.now(tz="Asia/Tashkent").tz_localize(None).to_period("M")
+    oldest_kept = current - (keep_months - 1)
+
+    removed = []
+    for month, name in sorted(list_month_partitions(cur, table_name).items()):
+        if month >= oldest_kept:
+            continue
+        if HISTORY_RETENTION_ACTION == "drop":
+            cur.execute(f"DROP TABLE {name};")
+            forget_table(name)
+        else:
+            cur.execute(f"ALTER TABLE {table_name} DETACH PARTITION {name};")
+            cur.execute(f"ALTER TABLE {name} RENAME TO {name}_detached;")
+            forget_table(name)
+            refresh_table(cur, f"{name}_detached")
+        removed.append(name)
+
+    if removed:
+        logger.info(
+            f"[{table_name}] Retention ({keep_months} months): "
+            f"{HISTORY_RETENTION_ACTION}ed {', '.join(removed)}"
+        )
+    return removed
+
+
+__all__ = ["partition_name",
+           "months_of",
+           "ensure_month_partitions",
+           "list_month_partitions",
+           "apply_retention"]
@@ -0,0 +1,118 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+from psycopg_pool import ConnectionPool
+from configs.postgres_config import POOL_MIN_SIZE, POOL_MAX_SIZE, POOL_TIMEOUT, POOL_MAX_IDLE
+from configs.logging_config import get_logger
+logger = get_logger("etl_log")
+
+# Process-wide pool, created on first use
+_pool = None
+_pool_lock = threading.Lock()
+
+# Time callers spent waiting for a connection
+_wait_stats = {"borrows": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+
+
+def get_pool(creds_file: str = 'credentials/postgres.json') -> ConnectionPool:
+    """
+    Return the shared PostgreSQL connection pool, creating it on first call.
+
+    Credentials are read once; later calls reuse the open pool regardless of creds_file.
+    Connections are health-checked before they are handed out.
+    """
+    global _pool
+    if _pool is not None:
+        return _pool
+
+    with _pool_lock:
+        if _pool is None:
+            with open(creds_file, 'r') as f:
+                creds = json.load(f)
+
+            conn_params = {
+                'host': creds['host'],
+                'port': creds['port'],
+                'dbname': creds['database'],
+                'user': creds['user'],
+                'password': creds['password']
+            }
+
+            _pool = ConnectionPool(
+                kwargs=conn_params,
+                min_size=POOL_MIN_SIZE,
+                max_size=POOL_MAX_SIZE,
+                timeout=POOL_TIMEOUT,
+                max_idle=POOL_MAX_IDLE,
+                check=ConnectionPool.check_connection,
+                name="etl_pool",
+                open=True
+            )
+            logger.info(f"PostgreSQL pool opened (min_size={POOL_MIN_SIZE}, max_size={POOL_MAX_SIZE}).")
+
+    return _pool
+
+
+@contextmanager
+def get_connection(creds_file: str = 'credentials/postgres.json'):
+    """
+    Borrow a connection from the shared pool.
+
+    The transaction is committed when the block exits normally and rolled back
+    on error; the connection then goes back to the pool.
+    """
+    pool = get_pool(creds_file)
+    start = time.perf_counter()
+    with pool.connection() as conn:
+        waited = time.perf_counter() - start
+        with _pool_lock:
+            _wait_stats["borrows"] += 1
+            _wait_stats["wait_seconds"] += waited
+            _wait_stats["max_wait_seconds"] = max(_wait_stats["max_wait_seconds"], waited)
+        yield conn
+
+
+def log_pool_stats(context: str = "") -> None:
+    """Log pool wait time and utilisation."""
+    if _pool is None:
+        return
+
+    stats = _pool.get_stats()
+    pool_size = stats.get("pool_size", 0)
+    available = stats.get("pool_available", 0)
+    in_use = pool_size - available
+    utilisation = in_use / POOL_MAX_SIZE * 100
+
+    borrows = _wait_stats["borrows"]
+    avg_wait_ms = _wait_stats["wait_seconds"] / borrows * 1000 if borrows else 0.0
+    max_wait_ms = _wait_stats["max_wait_seconds"] * 1000
+
+    prefix = f"[{context}] " if context else ""
+    logger.info(
+        f"{prefix}Pool: {in_use}/{POOL_MAX_SIZE} connections in use ({utilisation:.0f}%), "
+        f"opened: {pool_size}, borrows: {borrows}, "
+        f"avg wait: {avg_wait_ms:.1f} ms, max wait: {max_wait_ms:.1f} ms, "
+        f"waiting now: {stats.get('requests_waiting', 0)}"
+    )
+
+
+def close_pool() -> None:
+    """Close the shared pool, waiting for borrowed connections to be returned."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            return
+        pool = _pool
+        _pool = None
+
+    # Log final stats before the pool goes away
+    stats = pool.get_stats()
+    borrows = _wait_stats["borrows"]
+    logger.info(
+        f"Closing PostgreSQL pool: borrows: {borrows}, "
+        f"total wait: {_wait_stats['wait_seconds']:.2f} s, "
+        f"connections opened: {stats.get('connections_num', 0)}"
+    )
+    pool.close(timeout=POOL_TIMEOUT)
+    logger.info("PostgreSQL pool closed.")
@@ -0,0 +1,182 @@
+import threading
+import pandas as pd
+from configs.logging_config import get_logger
+logger = get_logger("etl_log")
+
+# In-process copy of information_schema for the current schema:
+# {table_name: {"kind": "BASE TABLE" | "VIEW", "partitioned": bool, "columns": {column: data_type}}}
+_catalog = None
+_catalog_lock = threading.RLock()
+
+# Loader types as information_schema.columns.data_type reports them
+PG_TYPE_NAMES = {
+    'BOOLEAN': 'boolean',
+    'BIGINT': 'bigint',
+    'DOUBLE PRECISION': 'double precision',
+    'TIMESTAMP': 'timestamp without time zone',
+    'TIME': 'time without time zone',
+    'TEXT': 'text',
+}
+
+# Type changes that never lose data: {current type: {wanted types it may widen to}}
+SAFE_WIDENINGS = {
+    'smallint': {'bigint', 'double precision', 'text'},
+    'integer': {'bigint', 'double precision', 'text'},
+    'bigint': {'double precision', 'text'},
+    'real': {'double precision', 'text'},
+    'double precision': {'text'},
+    'boolean': {'text'},
+    'timestamp without time zone': {'text'},
+    'time without time zone': {'text'},
+    'date': {'text'},
+    'character varying': {'text'},
+}
+
+_CATALOG_SQL = """
+SELECT c.table_name, t.table_type, cl.relkind = 'p', c.column_name, c.data_type
+FROM information_schema.columns c
+JOIN information_schema.tables t
+  ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+JOIN pg_class cl
+  ON cl.relname = c.table_name AND cl.relnamespace = c.table_schema::text::regnamespace
+WHERE c.table_schema = current_schema() {table_filter}
+ORDER BY c.table_name, c.ordinal_position;
+"""
+
+
+def map_dtype_to_pg(dtype, col_name: str, time_columns: tuple = ()) -> str:
+    """
+    Map a pandas dtype to the PostgreSQL type used by the loaders.
+
+    Columns whose name contains 'timestamp' are TIMESTAMP, columns whose name
+    contains one of time_columns are TIME.
+    """
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'BOOLEAN'
+    elif pd.api.types.is_integer_dtype(dtype):
+        return 'BIGINT'
+    elif pd.api.types.is_float_dtype(dtype):
+        return 'DOUBLE PRECISION'
+    elif pd.api.types.is_datetime64_any_dtype(dtype) or 'timestamp' in col_name.lower():
+        return 'TIMESTAMP'
+    elif any(t in col_name.lower() for t in time_columns):
+        return 'TIME'
+    else:
+        return 'TEXT'
+
+
+def _read_catalog(cur, table_name: str = None) -> dict:
+    if table_name is None:
+        cur.execute(_CATALOG_SQL.format(table_filter=""))
+    else:
+        cur.execute(_CATALOG_SQL.format(table_filter="AND c.table_name = %s"), (table_name,))
+
+    catalog = {}
+    for name, kind, partitioned, column, data_type in cur.fetchall():
+        entry = catalog.setdefault(name, {"kind": kind, "partitioned": partitioned, "columns": {}})
+        entry["columns"][column] = data_type
+    return catalog
+
+
+def load_catalog(cur) -> dict:
+    """Read information_schema once per run and cache it in-process."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = _read_catalog(cur)
+            logger.info(f"Schema catalog cached: {len(_catalog)} relations.")
+        return _catalog
+
+
+def refresh_table(cur, table_name: str) -> None:
+    """Re-read one relation from information_schema after DDL outside the schema manager."""
+    catalog = load_catalog(cur)
+    fresh = _read_catalog(cur, table_name)
+    with _catalog_lock:
+        catalog.pop(table_name, None)
+        catalog.update(fresh)
+
+
+def forget_table(table_name: str) -> None:
+    """Drop a relation from the cache (e.g. after it was renamed or dropped)."""
+    with _catalog_lock:
+        if _catalog is not None:
+            _catalog.pop(table_name, None)
+
+
+def get_table_kind(cur, table_name: str):
+    """Return 'BASE TABLE', 'VIEW' or None if the relation does not exist."""
+    entry = load_catalog(cur).get(table_name)
+    return entry["kind"] if entry else None
+
+
+def is_partitioned(cur, table_name: str) -> bool:
+    """True if the relation is a declaratively partitioned table."""
+    entry = load_catalog(cur).get(table_name)
+    return bool(entry and entry["partitioned"])
+
+
+def get_table_columns(cur, table_name: str):
+    """Return {column: data_type} in column order, or None if the relation does not exist."""
+    entry = load_catalog(cur).get(table_name)
+    return dict(entry["columns"]) if entry else None
+
+
+def plan_table_changes(cur, table_name: str, pg_types: dict) -> list:
+    """
+    Diff wanted column types against the cached schema of an existing table.
+
+    Returns the DDL needed: ADD COLUMN for new columns and ALTER COLUMN TYPE for
+    safe widenings (see SAFE_WIDENINGS). Columns missing from pg_types are kept,
+    narrowing or incompatible type changes are left to PostgreSQL's casts.
+    """
+    existing = get_table_columns(cur, table_name) or {}
+    ddl = []
+    for col, pg_type in pg_types.items():
+        wanted = PG_TYPE_NAMES.get(pg_type, pg_type.lower())
+        current = existing.get(col)
+        if current is None:
+            ddl.append(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {col} {pg_type};")
+        elif current != wanted and wanted in SAFE_WIDENINGS.get(current, ()):
+            ddl.append(f"ALTER TABLE {table_name} ALTER COLUMN {col} TYPE {pg_type} USING {col}::{pg_type};")
+            logger.warning(f"[{table_name}] Widening column {col} from {current} to {pg_type}.")
+    return ddl
+
+
+def ensure_table_schema(cur, table_name: str, pg_types: dict, create_sql: str) -> list:
+    """
+    Make sure table_name exists and has every column in pg_types.
+
+    Missing tables are created with create_sql. Existing tables get only the
+    ADD COLUMN / widening DDL from plan_table_changes; when nothing changed no
+    statement is sent at all. The caller commits.
+
+    Returns
+    -------
+    list
+        DDL statements executed.
+    """
+    if get_table_kind(cur, table_name) is None:
+        cur.execute(create_sql)
+        refresh_table(cur, table_name)
+        logger.info(f"[{table_name}] Table created.")
+        return [create_sql]
+
+    ddl = plan_table_changes(cur, table_name, pg_types)
+    if ddl:
+        for stmt in ddl:
+            cur.execute(stmt)
+        refresh_table(cur, table_name)
+        logger.info(f"[{table_name}] Schema evolved: {' '.join(ddl)}")
+    return ddl
+
+
+__all__ = ["map_dtype_to_pg",
+           "load_catalog",
+           "refresh_table",
+           "forget_table",
+           "get_table_kind",
+           "is_partitioned",
+           "get_table_columns",
+           "plan_table_changes",
+           "ensure_table_schema"]
@@ -0,0 +1,137 @@
+import io
+import ijson
+import numpy as np
+import pandas as pd
+import requests
+from configs.logging_config import get_logger
+logger = get_logger("etl_log")
+
+
+class ColumnBuilder:
+    """
+    Collect records straight into per-column lists and build the DataFrame once.
+
+    Keeps one list per column instead of one dict per record. With sep, nested
+    dicts are flattened into "<key><sep><subkey>" columns like
+    pd.json_normalize(records, sep=sep) (lists are kept as values); without it
+    records are taken as they are, like pd.DataFrame(records). Keys missing
+    from a record are filled with NaN, as pandas does for a list of records.
+    """
+
+    def __init__(self, sep: str = None):
+        self.sep = sep
+        self.columns = {}
+        self.rows = 0
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def _flatten(self, record: dict, prefix: str, out: dict) -> dict:
+        for key, value in record.items():
+            if isinstance(value, dict):
+                self._flatten(value, f"{prefix}{key}{self.sep}", out)
+            else:
+                out[f"{prefix}{key}"] = value
+        return out
+
+    def append(self, record: dict) -> None:
+        """Add one record."""
+        if self.sep is not None:
+            # Same key order as json_normalize: top-level values first, then the flattened dicts
+            values = {key: value for key, value in record.items() if not isinstance(value, dict)}
+            if len(values) < len(record):
+                self._flatten({k: v for k, v in record.items() if isinstance(v, dict)}, "", values)
+        else:
+            values = record
+        columns = self.columns
+        for key, value in values.items():
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = [np.nan] * self.rows
+            column.append(value)
+        self.rows += 1
+        if len(values) < len(columns):
+            for column in columns.values():
+                if len(column) < self.rows:
+                    column.append(np.nan)
+
+    def extend(self, records) -> None:
+        """Add every record of an iterable."""
+        for record in records:
+            self.append(record)
+
+    def column(self, name: str) -> list:
+        """Values of a column so far (all NaN if the column never appeared)."""
+        return self.columns.get(name, [np.nan] * self.rows)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Build the DataFrame (columns in first-seen order) and release the lists.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per appended record.
+        """
+        df = pd.DataFrame(self.columns, index=pd.RangeIndex(self.rows))
+        self.columns, self.rows = {}, 0
+        return df
+
+
+def iter_json_items(response: requests.Response, prefix: str, meta: dict = None):
+    """
+    Decode the items of a JSON array in a response one at a time.
+
+    The body is parsed incrementally (ijson) while it is read, so neither the
+    raw payload nor the whole decoded document is held in memory; request it
+    with stream=True for that (an already read body is parsed from memory).
+    The response is closed once the items are exhausted.
+
+    Parameters
+    ----------
+    response : requests.Response
+        Response whose body is a JSON document.
+    prefix : str
+        Dotted path of the array, e.g. "data.data" for {"data": {"data": [...]}}.
+    meta : dict, optional
+        Filled with the scalar values found outside the items, keyed by their
+        path (e.g. meta["code"], meta["data.total"]). Complete once the
+        items are exhausted.
+
+    Yields
+    ------
+    dict
+        Each item under prefix (numbers as int / float).
+
+    Raises
+    ------
+    ValueError
+        If the body is not valid JSON.
+    """
+    if response._content_consumed or response.raw is None:
+        source = io.BytesIO(response.content)
+    else:
+        response.raw.decode_content = True  # gzip / br as sent by the API
+        source = response.raw
+
+    in_items = False
+
+    def events():
+        nonlocal in_items
+        for path, event, value in ijson.parse(source, use_float=True):
+            if path == prefix and event in ("start_array", "end_array"):
+                in_items = event == "start_array"
+            elif meta is not None and not in_items and event in ("string", "number", "boolean", "null"):
+                meta[path] = value
+            yield path, event, value
+
+    try:
+        yield from ijson.items(events(), f"{prefix}.item")
+    except ijson.JSONError as e:
+        raise ValueError(f"Invalid JSON from {response.url}: {e}") from e
+    finally:
+        response.close()
+
+
+__all__ = ["ColumnBuilder",
+           "iter_json_items"]
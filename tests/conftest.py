@@ -0,0 +1,77 @@
+"""
+Fixtures for the loader tests.
+
+They need a real PostgreSQL: TEST_POSTGRES_DSN when set, otherwise a
+throwaway server started with pgserver (pip install pgserver). Without
+either the tests are skipped.
+"""
+import os
+import sys
+import tempfile
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import psycopg
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Loggers pick up log_folder when they are first created, point it away from
+# the repo's logs/ before any src module is imported
+import configs.logging_config as logging_config  # noqa: E402
+
+_log_dir = tempfile.TemporaryDirectory(prefix="etl_test_logs_")
+logging_config.log_folder = Path(_log_dir.name)
+
+
+@pytest.fixture(scope="session")
+def postgres_dsn():
+    dsn = os.getenv("TEST_POSTGRES_DSN")
+    if dsn:
+        yield dsn
+        return
+
+    pgserver = pytest.importorskip("pgserver", reason="set TEST_POSTGRES_DSN or install pgserver")
+    with tempfile.TemporaryDirectory() as data_dir:
+        server = pgserver.get_server(data_dir, cleanup_mode="stop")
+        try:
+            yield server.get_uri()
+        finally:
+            server.cleanup()
+
+
+@pytest.fixture
+def db(postgres_dsn, monkeypatch):
+    """
+    A connection for assertions, with the loaders' pooled connections pointed
+    at the test database. Tables created by the test are dropped afterwards.
+    """
+    import src.etl.load as load
+
+    @contextmanager
+    def get_connection(creds_file=None):
+        # Commits on a clean exit and rolls back on error, like the pool's connections
+        with psycopg.connect(postgres_dsn) as conn:
+            yield conn
+
+    monkeypatch.setattr(load, "get_connection", get_connection)
+
+    with psycopg.connect(postgres_dsn, autocommit=True) as conn:
+        before = _tables(conn)
+        yield conn
+        for table in _tables(conn) - before:
+            conn.execute(f"DROP TABLE IF EXISTS {table} CASCADE;")
+            load.forget_table(table)
+
+
+@pytest.fixture
+def table_base_name():
+    return f"t{uuid.uuid4().hex[:12]}"
+
+
+def _tables(conn) -> set:
+    rows = conn.execute(
+        "SELECT tablename FROM pg_tables WHERE schemaname = current_schema();"
+    ).fetchall()
+    return {row[0] for row in rows}
@@ -0,0 +1,59 @@
+"""LoadQueue ordering and back-pressure, with the loaders replaced by a recorder."""
+import threading
+import time
+
+import pandas as pd
+
+import src.etl.load_async as load_async
+from src.etl.load_async import LoadQueue, load_job
+
+
+def recorder(monkeypatch, delay=0.02):
+    calls, running, peak = [], [], [0]
+    lock = threading.Lock()
+
+    def load_to_postgres(df, table_base_name, **kwargs):
+        with lock:
+            running.append(table_base_name)
+            peak[0] = max(peak[0], len(running))
+        time.sleep(delay)
+        with lock:
+            running.remove(table_base_name)
+            calls.append((table_base_name, int(df["id"].iloc[0])))
+        return {"rows": len(df)}
+
+    monkeypatch.setattr(load_async, "load_to_postgres", load_to_postgres)
+    return calls, peak
+
+
+def job(table, marker):
+    return load_job(df=pd.DataFrame({"id": [marker]}), dept="test", table_base_name=table, postfix="q")
+
+
+def test_jobs_for_a_table_load_in_submission_order(monkeypatch):
+    calls, _ = recorder(monkeypatch)
+    loads = LoadQueue(max_concurrency=4, max_pending=8)
+    for marker in range(5):
+        loads.submit(job("a", marker))
+        loads.submit(job("b", marker))
+
+    results = loads.join()
+
+    assert [marker for table, marker in calls if table == "a"] == list(range(5))
+    assert [marker for table, marker in calls if table == "b"] == list(range(5))
+    assert [r["table"] for r in results] == ["test_a_q", "test_b_q"] * 5
+    assert all(r["ok"] and r["result"] == {"rows": 1} for r in results)
+
+
+def test_submit_blocks_while_max_pending_jobs_are_queued(monkeypatch):
+    calls, peak = recorder(monkeypatch, delay=0.05)
+    loads = LoadQueue(max_concurrency=2, max_pending=2)
+
+    loads.submit(job("a", 1))
+    loads.submit(job("b", 1))
+    # Both slots taken: the third submit waits for one of them to finish
+    loads.submit(job("c", 1))
+    assert len(calls) >= 1
+
+    loads.join()
+    assert peak[0] <= 2 and len(calls) == 3
@@ -0,0 +1,48 @@
+"""Facebook insights helpers, with the Graph API replaced by stubs."""
+import requests
+
+import src.etl.extract_marketing as marketing
+
+
+def test_async_report_request_errors_fall_back(monkeypatch):
+    def http_post(url, **kwargs):
+        response = requests.Response()
+        response.status_code, response.url = 500, url
+        return response
+
+    monkeypatch.setattr(marketing, "http_post", http_post)
+
+    assert marketing.facebook_run_async_report(
+        "https://graph.example/v21.0/act_1/insights", {"access_token": "t"}, label="act_1"
+    ) is None
+
+
+def test_async_report_poll_errors_fall_back(monkeypatch):
+    def http_post(url, **kwargs):
+        response = requests.Response()
+        response.status_code, response._content = 200, b'{"report_run_id": "42"}'
+        return response
+
+    def http_get(url, **kwargs):
+        raise requests.ConnectionError("connection reset")
+
+    monkeypatch.setattr(marketing, "http_post", http_post)
+    monkeypatch.setattr(marketing, "http_get", http_get)
+
+    assert marketing.facebook_run_async_report(
+        "https://graph.example/v21.0/act_1/insights", {"access_token": "t"}, label="act_1"
+    ) is None
+
+
+def test_action_sums_keep_every_digit():
+    days = [
+        [{"action_type": "impressions", "value": "1234567"}, {"action_type": "spend", "value": "0.1"}],
+        [{"action_type": "impressions", "value": "7654321"}, {"action_type": "spend", "value": "1000000.2"}],
+        None,
+    ]
+
+    assert marketing._sum_action_lists(days) == [
+        {"action_type": "impressions", "value": "8888888"},
+        {"action_type": "spend", "value": "1000000.3"},
+    ]
+    assert marketing._sum_action_lists([None, []]) is None
@@ -0,0 +1,76 @@
+"""SCD2 history loads (mode='scd2') and their snapshot view against a real PostgreSQL."""
+import pandas as pd
+
+from src.etl.load import load_history_to_postgres
+
+DEPT, POSTFIX = "test", "h"
+
+
+def frame(rows, fetched):
+    """rows: [(id, name)]"""
+    df = pd.DataFrame(rows, columns=["id", "name"])
+    df["id"] = df["id"].astype("int64")
+    df["fetched_timestamp"] = fetched
+    return df
+
+
+def load(df, table_base_name, **kwargs):
+    return load_history_to_postgres(df, dept=DEPT, table_base_name=table_base_name, postfix=POSTFIX, **kwargs)
+
+
+def snapshots(db, relation):
+    return db.execute(
+        f"SELECT fetched_timestamp::text, id, name FROM {relation} ORDER BY fetched_timestamp, id;"
+    ).fetchall()
+
+
+def test_view_has_a_row_per_key_and_run(db, table_base_name):
+    view = f"{DEPT}_{table_base_name}_history_{POSTFIX}"
+    load(frame([(1, "a"), (2, "x")], "2025-01-01 10:00:00"), table_base_name, mode="scd2")
+    # Changed again on the same day
+    load(frame([(1, "b"), (2, "x")], "2025-01-01 18:00:00"), table_base_name, mode="scd2")
+    # No run on 2025-01-02
+    load(frame([(1, "b")], "2025-01-03 10:00:00"), table_base_name, mode="scd2")
+
+    assert snapshots(db, view) == [
+        ("2025-01-01 10:00:00", 1, "a"),
+        ("2025-01-01 10:00:00", 2, "x"),
+        ("2025-01-01 18:00:00", 1, "b"),
+        ("2025-01-01 18:00:00", 2, "x"),
+        ("2025-01-03 10:00:00", 1, "b"),
+    ]
+    assert db.execute(
+        f"SELECT id, name FROM {view} WHERE fetched_timestamp = '2025-01-01 18:00:00' ORDER BY id;"
+    ).fetchall() == [(1, "b"), (2, "x")]
+
+
+def test_migrated_view_matches_the_snapshot_table(db, table_base_name):
+    history = f"{DEPT}_{table_base_name}_history_{POSTFIX}"
+    runs = [
+        ([(1, "a"), (2, "x")], "2025-01-01 10:00:00"),
+        ([(1, "a"), (2, "x")], "2025-01-02 10:00:00"),  # nothing changed
+        ([(1, "b")], "2025-01-02 18:00:00"),  # 2 disappears
+        ([(1, "b")], "2025-01-05 10:00:00"),
+    ]
+    for rows, fetched in runs:
+        load(frame(rows, fetched), table_base_name)
+    expected = snapshots(db, history)
+
+    # The next scd2 load compacts the snapshot table first
+    load(frame([(1, "b"), (3, "z")], "2025-01-06 10:00:00"), table_base_name, mode="scd2")
+
+    assert snapshots(db, history) == expected + [
+        ("2025-01-06 10:00:00", 1, "b"),
+        ("2025-01-06 10:00:00", 3, "z"),
+    ]
+
+
+def test_returning_keys_are_counted_as_reopened(db, table_base_name):
+    load(frame([(1, "a"), (2, "x")], "2025-01-01 10:00:00"), table_base_name, mode="scd2")
+    load(frame([(1, "a")], "2025-01-02 10:00:00"), table_base_name, mode="scd2")
+
+    result = load(frame([(1, "b"), (2, "x"), (3, "z")], "2025-01-03 10:00:00"), table_base_name, mode="scd2")
+
+    assert {key: result[key] for key in ("opened", "new", "changed", "reopened", "tombstones", "unchanged")} == {
+        "opened": 3, "new": 1, "changed": 1, "reopened": 1, "tombstones": 0, "unchanged": 0
+    }
@@ -0,0 +1,124 @@
+"""Shadow table swap loads (strategy='swap') against a real PostgreSQL."""
+import pandas as pd
+
+from src.etl.load import load_to_postgres, forget_table, ROW_HASH_COLUMN, ROW_HASH_COMMENT
+
+DEPT, POSTFIX = "test", "swap"
+
+
+def frame(rows, fetched="2025-01-01 00:00:00"):
+    """rows: [(id, name, amount)]"""
+    df = pd.DataFrame(rows, columns=["id", "name", "amount"])
+    df["id"] = df["id"].astype("int64")
+    df["amount"] = df["amount"].astype("float64")
+    df["fetched_timestamp"] = fetched
+    return df
+
+
+def load(df, table_base_name, **kwargs):
+    return load_to_postgres(df, dept=DEPT, table_base_name=table_base_name, postfix=POSTFIX, **kwargs)
+
+
+def live_table(db, table_base_name, **kwargs):
+    """
+    Create the live table with rows 1-3, an extra index, a named unique
+    constraint and a 'note' column the frames do not have.
+    """
+    table = f"{DEPT}_{table_base_name}_{POSTFIX}"
+    load(frame([(1, "a", 10.0), (2, "b", 20.0), (3, "c", 30.0)]), table_base_name, strategy="copy", **kwargs)
+    db.execute(f"CREATE INDEX {table}_name_idx ON {table} (name);")
+    db.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_id_name_key UNIQUE (id, name);")
+    db.execute(f"ALTER TABLE {table} ADD COLUMN note TEXT;")
+    db.execute(f"UPDATE {table} SET note = 'note ' || id;")
+    forget_table(table)  # DDL outside the schema manager
+    return table
+
+
+def rows(db, table):
+    return db.execute(f"SELECT id, name, amount, note FROM {table} ORDER BY id;").fetchall()
+
+
+def table_oid(db, table):
+    return db.execute("SELECT to_regclass(%s)::oid;", (table,)).fetchone()[0]
+
+
+def index_names(db, table):
+    return sorted(row[0] for row in db.execute(
+        "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s;", (table,)
+    ).fetchall())
+
+
+def constraint_names(db, table):
+    return sorted(row[0] for row in db.execute(
+        "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s);", (table,)
+    ).fetchall())
+
+
+def assert_swapped(db, table, oid, indexes, constraints):
+    assert table_oid(db, table) != oid
+    assert table_oid(db, f"{table}_shadow") is None
+    assert index_names(db, table) == indexes
+    assert constraint_names(db, table) == constraints
+
+
+def test_truncate_replaces_the_table(db, table_base_name):
+    table = live_table(db, table_base_name)
+    oid, indexes, constraints = table_oid(db, table), index_names(db, table), constraint_names(db, table)
+    assert f"{table}_name_idx" in indexes and f"{table}_id_name_key" in constraints
+
+    # 'auto' swaps full reloads
+    result = load(frame([(2, "b2", 21.0), (4, "d", 40.0)]), table_base_name, truncate=True)
+
+    assert (result["inserts"], result["updates"]) == (1, 1)
+    assert rows(db, table) == [(2, "b2", 21.0, None), (4, "d", 40.0, None)]
+    assert_swapped(db, table, oid, indexes, constraints)
+
+
+def test_without_truncate_live_rows_are_carried_over(db, table_base_name):
+    table = live_table(db, table_base_name)
+    oid, indexes, constraints = table_oid(db, table), index_names(db, table), constraint_names(db, table)
+
+    result = load(frame([(2, "b2", 21.0), (4, "d", 40.0)]), table_base_name, strategy="swap")
+
+    assert (result["inserts"], result["updates"]) == (1, 1)
+    # Rows not in the frame keep their values, columns not in the frame keep the stored ones
+    assert rows(db, table) == [
+        (1, "a", 10.0, "note 1"),
+        (2, "b2", 21.0, "note 2"),
+        (3, "c", 30.0, "note 3"),
+        (4, "d", 40.0, None),
+    ]
+    assert_swapped(db, table, oid, indexes, constraints)
+
+
+def test_change_detection_keeps_fetched_timestamp_of_unchanged_rows(db, table_base_name):
+    table = live_table(db, table_base_name, change_detection=True)
+
+    result = load(
+        frame([(1, "a", 10.0), (2, "b2", 21.0)], fetched="2025-02-01 00:00:00"),
+        table_base_name, strategy="swap", change_detection=True
+    )
+
+    assert (result["inserts"], result["updates"], result["unchanged"]) == (0, 1, 1)
+    fetched = db.execute(f"SELECT id, fetched_timestamp::text FROM {table} ORDER BY id;").fetchall()
+    assert fetched == [(1, "2025-01-01 00:00:00"), (2, "2025-02-01 00:00:00"), (3, "2025-01-01 00:00:00")]
+    # The hash column stays marked as internal on the swapped-in table
+    comment = db.execute(
+        "SELECT col_description(to_regclass(%s), attnum) FROM pg_attribute "
+        "WHERE attrelid = to_regclass(%s) AND attname = %s;", (table, table, ROW_HASH_COLUMN)
+    ).fetchone()[0]
+    assert comment == ROW_HASH_COMMENT
+
+
+def test_tables_with_dependents_are_not_swapped(db, table_base_name):
+    table = live_table(db, table_base_name)
+    db.execute(f"CREATE VIEW {table}_v AS SELECT id, name FROM {table};")
+    oid = table_oid(db, table)
+
+    result = load(frame([(2, "b2", 21.0), (4, "d", 40.0)]), table_base_name, truncate=True)
+
+    # Falls back to TRUNCATE + load in place, the view keeps working
+    assert table_oid(db, table) == oid
+    assert table_oid(db, f"{table}_shadow") is None
+    assert result["rows"] == 2
+    assert db.execute(f"SELECT id, name FROM {table}_v ORDER BY id;").fetchall() == [(2, "b2"), (4, "d")]